@@ -1,791 +1,303 @@
 # app.py
 import streamlit as st
-import re
+import html
 import os
+import re
 import time
-import random
+import uuid
 from dotenv import load_dotenv
-from groq import Groq
+from chatbot import get_engine, get_rule_store, normalize_input
+from chatbot.ai import build_messages, get_ai_client
+from chatbot.cache import get_response_cache
+from chatbot.context import new_conversation_context
+from chatbot.history import QueryHistory
+from chatbot.messages import Message, MessageStore, memory_report, new_message_store
+from chatbot.persistence import get_conversation_store
+from chatbot.metrics import STAGE_SECONDS, TURNS, start_metrics_server
+from chatbot.pipeline import (AI_BUSY_MESSAGE, AI_ERROR_MESSAGE, ai_span_attributes, ask_ai, lookup_ai_cache, match_rule,
+                              store_ai_response)
+from chatbot.scheduler import BusyError
+from chatbot.tone import classify_tone
+from chatbot.semantic_cache import get_semantic_cache
+from chatbot.tracing import current_span, get_tracer, use_span
+
+# Page styles live in static/chatbot.css
+CSS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "chatbot.css")
+
+# Function to minify CSS: drop comments and collapse whitespace
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
 
-# Set page config (must be first Streamlit command)
-st.set_page_config(
-    page_title="AI Assistant | Nandesh Kalashetti",
-    page_icon="🤖",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Function to minify static HTML: collapse whitespace between and inside tags
+def minify_html(markup):
+    return re.sub(r"\s+", " ", re.sub(r">\s+<", "><", markup)).strip()
 
-# Load environment variables
-load_dotenv()
+# Function to get the page CSS as one minified <style> block, built once per process
+@st.cache_resource(show_spinner=False)
+def get_page_css():
+    with open(CSS_FILE, encoding="utf-8") as f:
+        return f"<style>{minify_css(f.read())}</style>"
 
-# Configure Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Function to get a static block of page chrome minified, built once per process
+@st.cache_resource(show_spinner=False)
+def static_html(markup):
+    return minify_html(markup)
 
-# Define CSS styles for modern UI
+# Define CSS styles for modern UI. With static file serving enabled
+# (--server.enableStaticServing true) the browser fetches and caches the
+# stylesheet once; otherwise the minified CSS is inlined.
 def load_css():
-    st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    @import url('https://cdnjs.cloudflare.com/ajax/libs/animate.css/4.1.1/animate.min.css');
-    
-    * {
-        font-family: 'Inter', sans-serif;
-        margin: 0;
-        padding: 0;
-        box-sizing: border-box;
-    }
-    
-    /* Base styling */
-    body {
-        background-color: #0f172a;
-        color: #f8fafc;
-        background-image: radial-gradient(circle at 50% 50%, #1e293b 0%, #0f172a 100%);
-    }
-    
-    /* Chat interface */
-    .chat-interface {
-        display: flex;
-        flex-direction: column;
-        min-height: 100vh;
-        padding: 0;
-        position: relative;
-    }
-    
-    /* Messages container with smooth scroll */
-    .messages-container {
-        flex: 1;
-        overflow-y: auto;
-        padding: 10px 20px 130px 20px;
-        display: flex;
-        flex-direction: column;
-        gap: 20px;
-        max-width: 1000px;
-        margin: 0 auto;
-        width: 100%;
-        scroll-behavior: smooth;
-    }
-    
-    /* Modern message styles */
-    .message {
-        padding: 16px 20px;
-        margin-bottom: 12px;
-        border-radius: 16px;
-        max-width: 85%;
-        animation: fadeInUp 0.3s ease-out;
-        word-wrap: break-word;
-        line-height: 1.6;
-        box-shadow: 0 4px 20px rgba(0, 0, 0, 0.2);
-        position: relative;
-        transform-origin: center;
-        transition: all 0.2s ease;
-    }
-    
-    .message:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 8px 24px rgba(0, 0, 0, 0.25);
-    }
-    
-    .user-message {
-        background: linear-gradient(135deg, #3b82f6, #1d4ed8);
-        color: white;
-        align-self: flex-end;
-        border-radius: 16px 16px 4px 16px;
-        margin-right: 10px;
-    }
-    
-    .bot-message {
-        background-color: #1e293b;
-        color: #f8fafc;
-        align-self: flex-start;
-        border-radius: 16px 16px 16px 4px;
-        border-left: 3px solid #3b82f6;
-        margin-left: 10px;
-    }
-    
-    /* Message avatars with better positioning */
-    .user-message::before {
-        content: "";
-        position: absolute;
-        bottom: -10px;
-        right: -10px;
-        width: 30px;
-        height: 30px;
-        background-image: url('https://img.icons8.com/color/96/000000/user-male-circle--v1.png');
-        background-size: cover;
-        border-radius: 50%;
-        border: 2px solid #3b82f6;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-    }
-    
-    .bot-message::before {
-        content: "";
-        position: absolute;
-        bottom: -10px;
-        left: -10px;
-        width: 30px;
-        height: 30px;
-        background-image: url('https://img.icons8.com/fluency/96/000000/chatbot.png');
-        background-size: cover;
-        border-radius: 50%;
-        border: 2px solid #3b82f6;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-    }
-    
-    /* Fixed input area with glass effect */
-    .input-area {
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        right: 0;
-        padding: 15px 20px 20px 20px;
-        background: rgba(15, 23, 42, 0.95);
-        z-index: 100;
-        backdrop-filter: blur(10px);
-        -webkit-backdrop-filter: blur(10px);
-        border-top: 1px solid rgba(59, 130, 246, 0.2);
-        box-shadow: 0 -10px 30px rgba(0, 0, 0, 0.3);
-    }
-    
-    /* Form styling - cleaner look */
-    form[data-testid="stForm"] {
-        background-color: transparent !important;
-        border: none !important;
-        padding: 0 !important;
-        margin: 0 !important;
-    }
-    
-    /* Input container with animations */
-    .input-container {
-        display: flex;
-        align-items: center;
-        background-color: rgba(30, 41, 59, 0.7);
-        border-radius: 12px;
-        padding: 4px 15px;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.2);
-        margin: 0 auto;
-        max-width: 900px;
-        border: 1px solid rgba(59, 130, 246, 0.2);
-        transition: all 0.3s ease;
-    }
-    
-    .input-container:focus-within {
-        box-shadow: 0 4px 20px rgba(59, 130, 246, 0.4);
-        border: 1px solid rgba(59, 130, 246, 0.6);
-        background-color: rgba(30, 41, 59, 0.9);
-    }
-    
-    /* Input field styling */
-    .input-container .stTextInput {
-        flex-grow: 1;
-    }
-    
-    .input-container .stTextInput > div {
-        background-color: transparent !important;
-        border: none !important;
-    }
-    
-    .input-container .stTextInput > div > div > input {
-        background-color: transparent !important;
-        color: #f8fafc !important;
-        border: none !important;
-        padding: 12px 5px !important;
-        font-size: 15px !important;
-        width: 100% !important;
-        height: 44px !important;
-    }
-    
-    .input-container .stTextInput > div > div > input::placeholder {
-        color: rgba(148, 163, 184, 0.7) !important;
-        font-style: normal !important;
-    }
-    
-    /* Modern submit button */
-    button[kind="primary"] {
-        background: linear-gradient(135deg, #3b82f6, #1d4ed8) !important;
-        color: white !important;
-        border: none !important;
-        border-radius: 10px !important;
-        font-weight: 600 !important;
-        letter-spacing: 0.5px !important;
-        padding: 0 20px !important;
-        margin: 0 !important;
-        height: 44px !important;
-        min-width: 100px !important;
-        display: flex !important;
-        align-items: center !important;
-        justify-content: center !important;
-        cursor: pointer !important;
-        transition: all 0.3s ease !important;
-        box-shadow: 0 4px 10px rgba(29, 78, 216, 0.3) !important;
-    }
-    
-    button[kind="primary"]:hover {
-        transform: translateY(-2px) !important;
-        box-shadow: 0 6px 15px rgba(29, 78, 216, 0.4) !important;
-        background: linear-gradient(135deg, #2563eb, #1e40af) !important;
-    }
-    
-    /* Sidebar styling - modern, clean look */
-    [data-testid="stSidebar"] {
-        background-color: #0f172a;
-        border-right: 1px solid rgba(59, 130, 246, 0.1);
-    }
-    
-    .sidebar-content {
-        padding: 20px 15px;
-    }
-    
-    /* Logo/profile container with subtle animation */
-    .logo-container {
-        display: flex;
-        flex-direction: column;
-        align-items: center;
-        margin-bottom: 25px;
-        animation: fadeIn 1s ease-out;
-    }
-    
-    .logo-container img {
-        width: 90px;
-        height: 90px;
-        border-radius: 50%;
-        object-fit: cover;
-        border: 3px solid #3b82f6;
-        box-shadow: 0 8px 20px rgba(0, 0, 0, 0.3);
-        transition: all 0.3s ease;
-    }
-    
-    .logo-container img:hover {
-        transform: scale(1.05);
-        border-color: #60a5fa;
-        box-shadow: 0 8px 25px rgba(59, 130, 246, 0.4);
-    }
-    
-    /* Connect links with animations */
-    .connect-links {
-        display: flex;
-        justify-content: center;
-        gap: 12px;
-        margin: 15px 0;
-    }
-    
-    .connect-link {
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        width: 38px;
-        height: 38px;
-        background-color: #1e293b;
-        border-radius: 50%;
-        transition: all 0.3s ease;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .connect-link:hover {
-        transform: translateY(-3px);
-        background-color: #3b82f6;
-    }
-    
-    .connect-link:hover::after {
-        content: '';
-        position: absolute;
-        width: 100%;
-        height: 100%;
-        border-radius: 50%;
-        border: 2px solid #3b82f6;
-        animation: pulse 1.5s infinite;
-    }
-    
-    /* Recent chats styling - modern and interactive */
-    .history-container {
-        max-height: 300px;
-        overflow-y: auto;
-        padding-right: 5px;
-        margin-bottom: 20px;
-        border-radius: 10px;
-    }
-    
-    .history-item {
-        padding: 10px 15px;
-        margin-bottom: 8px;
-        background-color: #1e293b;
-        border-radius: 8px;
-        font-size: 13px;
-        color: #e2e8f0;
-        cursor: pointer;
-        transition: all 0.2s ease;
-        border-left: 3px solid transparent;
-        white-space: nowrap;
-        overflow: hidden;
-        text-overflow: ellipsis;
-    }
-    
-    .history-item:hover {
-        background-color: #2d3748;
-        transform: translateX(3px);
-        border-left-color: #3b82f6;
-    }
-    
-    /* Feature cards with hover effects */
-    .feature-card {
-        background-color: #1e293b;
-        border-radius: 10px;
-        padding: 12px 15px;
-        margin-bottom: 10px;
-        transition: all 0.3s ease;
-        border-left: 3px solid transparent;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    
-    .feature-card:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 8px 15px rgba(0, 0, 0, 0.15);
-        border-left: 3px solid #3b82f6;
-        background-color: #2d3748;
-    }
-    
-    /* Animated tech badges */
-    .tech-badge {
-        display: inline-block;
-        background-color: #1e293b;
-        color: #94a3b8;
-        padding: 6px 10px;
-        border-radius: 20px;
-        font-size: 12px;
-        margin: 0 5px 8px 0;
-        transition: all 0.2s ease;
-        border: 1px solid rgba(59, 130, 246, 0.2);
-    }
-    
-    .tech-badge:hover {
-        background-color: #3b82f6;
-        color: white;
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(59, 130, 246, 0.3);
-    }
-    
-    /* Welcome banner styling */
-    .welcome-banner {
-        text-align: center;
-        margin: 25px auto 30px;
-        max-width: 800px;
-        animation: fadeInDown 0.8s ease-out;
-    }
-    
-    .welcome-banner h1 {
-        color: #f8fafc;
-        font-size: 30px;
-        font-weight: 700;
-        margin-bottom: 15px;
-        background: linear-gradient(135deg, #3b82f6, #60a5fa);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        letter-spacing: -0.5px;
-    }
-    
-    .welcome-banner p {
-        color: #94a3b8;
-        font-size: 16px;
-        max-width: 600px;
-        margin: 0 auto;
-        line-height: 1.6;
-    }
-    
-    /* Pattern examples section */
-    .patterns-section {
-        background-color: rgba(30, 41, 59, 0.6);
-        border-radius: 12px;
-        padding: 18px 22px;
-        margin: 0 auto 35px;
-        max-width: 800px;
-        border: 1px solid rgba(59, 130, 246, 0.2);
-        box-shadow: 0 4px 20px rgba(0, 0, 0, 0.15);
-        backdrop-filter: blur(5px);
-        -webkit-backdrop-filter: blur(5px);
-    }
-    
-    .pattern-indicator {
-        display: inline-block;
-        background-color: rgba(59, 130, 246, 0.15);
-        color: #bfdbfe;
-        border-radius: 20px;
-        padding: 6px 12px;
-        font-size: 13px;
-        margin: 5px;
-        border: 1px solid rgba(59, 130, 246, 0.3);
-        transition: all 0.2s ease;
-        cursor: pointer;
-    }
-    
-    .pattern-indicator:hover {
-        background-color: rgba(59, 130, 246, 0.3);
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Welcome container with better animation */
-    .welcome-container {
-        text-align: center;
-        padding: 40px 20px;
-        color: #94a3b8;
-        display: flex;
-        flex-direction: column;
-        align-items: center;
-        justify-content: center;
-        min-height: 400px;
-        animation: fadeIn 1s ease-out;
-    }
-    
-    .welcome-container img {
-        animation: float 6s ease-in-out infinite;
-        margin-bottom: 25px;
-        filter: drop-shadow(0 10px 15px rgba(0, 0, 0, 0.3));
-    }
-    
-    /* Footer info styling */
-    .footer-info {
-        text-align: center;
-        color: #94a3b8;
-        font-size: 11px;
-        margin-top: 12px;
-        opacity: 0.8;
-        letter-spacing: 0.5px;
-    }
-    
-    /* Hide Streamlit elements */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Mobile responsiveness */
-    @media (max-width: 768px) {
-        .message {
-            max-width: 90%;
-            font-size: 14px;
-            padding: 12px 15px;
-        }
-        
-        .user-message::before,
-        .bot-message::before {
-            width: 25px;
-            height: 25px;
-        }
-        
-        .welcome-banner h1 {
-            font-size: 24px;
-        }
-        
-        .welcome-banner p {
-            font-size: 14px;
-        }
-        
-        .pattern-indicator {
-            font-size: 12px;
-            padding: 5px 10px;
-        }
-        
-        .input-container .stTextInput > div > div > input {
-            font-size: 14px !important;
-        }
-        
-        .messages-container {
-            padding: 10px 15px 130px 15px;
-        }
-        
-        .logo-container img {
-            width: 70px;
-            height: 70px;
-        }
-    }
-    
-    /* Animations */
-    @keyframes fadeIn {
-        from { opacity: 0; }
-        to { opacity: 1; }
-    }
-    
-    @keyframes fadeInUp {
-        from { opacity: 0; transform: translateY(20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    @keyframes fadeInDown {
-        from { opacity: 0; transform: translateY(-20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    @keyframes float {
-        0% { transform: translateY(0px); }
-        50% { transform: translateY(-15px); }
-        100% { transform: translateY(0px); }
-    }
-    
-    @keyframes pulse {
-        0% { transform: scale(1); opacity: 1; }
-        100% { transform: scale(1.5); opacity: 0; }
-    }
-    
-    @keyframes gradient {
-        0% { background-position: 0% 50%; }
-        50% { background-position: 100% 50%; }
-        100% { background-position: 0% 50%; }
-    }
-    
-    /* Scrollbar styling */
-    ::-webkit-scrollbar {
-        width: 6px;
-        height: 6px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: #1e293b;
-        border-radius: 4px;
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: #475569;
-        border-radius: 4px;
-    }
-    
-    ::-webkit-scrollbar-thumb:hover {
-        background: #3b82f6;
-    }
-    
-    /* Column adjustments for better layout */
-    div[data-testid="column"] {
-        padding: 0 !important;
-    }
-    
-    /* Fix form spacing */
-    div[data-testid="stForm"] {
-        border: none !important;
-        padding: 0 !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    if st.get_option("server.enableStaticServing"):
+        st.markdown('<link rel="stylesheet" href="app/static/chatbot.css">', unsafe_allow_html=True)
+    else:
+        st.markdown(get_page_css(), unsafe_allow_html=True)
 
 # Initialize session state variables
 def init_session_state():
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-    if 'rules' not in st.session_state:
-        # Define rule patterns with improved responses and emojis
-        st.session_state.rules = [
-            {
-                'patterns': [r'hello|hi|hey|greetings', r'^hi$'],
-                'responses': ["👋 Hello! How can I help you today?", "👋 Hi there! What can I assist you with?", "👋 Hey! I'm here to help. What's on your mind?"]
-            },
-            {
-                'patterns': [r'who are you|what are you|tell me about yourself'],
-                'responses': ["🤖 I'm an advanced AI assistant created by Nandesh Kalashetti. I combine rule-based capabilities with AI to provide helpful responses to your questions!"]
-            },
-            {
-                'patterns': [r'bye|goodbye|see you|farewell'],
-                'responses': ["👋 Goodbye! Have a great day!", "✨ See you later! Take care!", "👋 Farewell! Come back soon!"]
-            },
-            {
-                'patterns': [r'thank you|thanks'],
-                'responses': ["😊 You're welcome! Anything else you need help with?", "🙏 Happy to help! Let me know if you need anything else."]
-            },
-            {
-                'patterns': [r'what can you do|help|capabilities'],
-                'responses': ["🚀 I can answer questions, provide information, assist with various tasks, and engage in natural conversations. Just ask me anything!"]
-            },
-            {
-                'patterns': [r'weather|temperature'],
-                'responses': ["🌦️ I'm sorry, I don't have access to real-time weather data, but I'd be happy to help with other questions!"]
-            },
-            {
-                'patterns': [r'your name'],
-                'responses': ["🤖 I'm your AI assistant, created by Nandesh Kalashetti. You can call me Assistant!"]
-            },
-            {
-                'patterns': [r'how are you'],
-                'responses': ["😊 I'm doing well, thank you! How about you?", "🌟 I'm functioning perfectly! How can I brighten your day?"]
-            },
-            {
-                'patterns': [r'who (is|made) (you|this)|creator|developer'],
-                'responses': ["👨‍💻 I was created by Nandesh Kalashetti, a talented full-stack developer specializing in MERN stack, React.js, TypeScript, PHP, and MySQL."]
-            },
-            {
-                'patterns': [r'project|about this chatbot'],
-                'responses': ["🚀 This is an advanced AI chatbot with rule-based intelligence. I use pattern matching for quick responses and AI capabilities for complex questions!"]
-            },
-            {
-                'patterns': [r'joke|tell me a joke|make me laugh'],
-                'responses': ["😄 Why don't scientists trust atoms? Because they make up everything!", 
-                             "😂 Why did the JavaScript developer wear glasses? Because he couldn't C#!",
-                             "🤣 Why do programmers prefer dark mode? Because light attracts bugs!"]
-            },
-            {
-                'patterns': [r'time|what time|date|what date'],
-                'responses': ["⏰ I don't have access to the current time or date, but your device should show that information!"]
-            },
-            # GenAI and AI Technology related rules
-            {
-                'patterns': [r'what is (ai|artificial intelligence)'],
-                'responses': ["🧠 Artificial Intelligence is technology enabling machines to simulate human intelligence through learning and problem-solving. It spans from simple rule-based systems to complex neural networks that can recognize patterns, make decisions, and improve over time."]
-            },
-            {
-                'patterns': [r'what is (generative ai|genai)'],
-                'responses': ["✨ Generative AI refers to AI systems that can create new content like text, images, code, or music based on their training data. Popular examples include ChatGPT for text, DALL-E for images, and Stable Diffusion for visual content."]
-            },
-            {
-                'patterns': [r'explain (llm|large language model)'],
-                'responses': ["📚 Large Language Models (LLMs) are AI systems trained on vast amounts of text data to understand and generate human-like text. They can write essays, answer questions, translate languages, and even generate programming code based on the patterns they've learned."]
-            },
-            {
-                'patterns': [r'(difference|compare) (between|of) (ml|machine learning) and (ai|artificial intelligence)'],
-                'responses': ["🔄 Artificial Intelligence is the broader concept of machines being able to perform tasks in a way we'd consider 'smart', while Machine Learning is a specific subset focused on algorithms that improve automatically through experience and data processing."]
-            },
-            {
-                'patterns': [r'what is (ml|machine learning)'],
-                'responses': ["📊 Machine Learning is a subset of AI that enables systems to learn and improve from experience without explicit programming. It works by analyzing patterns in data, making predictions or decisions, and improving its accuracy over time."]
-            },
-            {
-                'patterns': [r'explain neural networks'],
-                'responses': ["🧩 Neural networks are computing systems inspired by the human brain's structure. They consist of interconnected 'neurons' that process information in layers, allowing them to recognize patterns, classify data, and make predictions on complex problems like image recognition."]
-            },
-            {
-                'patterns': [r'what is deep learning'],
-                'responses': ["🔍 Deep Learning is a subset of machine learning using neural networks with multiple layers (hence 'deep'). These advanced networks excel at processing complex data like images, sound, and text, enabling breakthroughs in speech recognition, computer vision, and natural language processing."]
-            },
-            {
-                'patterns': [r'what is (nlp|natural language processing)'],
-                'responses': ["🗣️ Natural Language Processing (NLP) is an AI field focused on enabling computers to understand, interpret, and generate human language. It powers applications like translation services, chatbots, sentiment analysis, and voice assistants."]
-            },
-            {
-                'patterns': [r'is ai dangerous'],
-                'responses': ["⚖️ AI itself isn't inherently dangerous, but it comes with risks that need careful management. Concerns include privacy issues, algorithmic bias, job displacement, and security challenges. Responsible development with ethical guidelines and appropriate regulations can help mitigate these potential risks."]
-            },
-            {
-                'patterns': [r'will ai replace humans|ai taking jobs'],
-                'responses': ["🤝 While AI will automate certain tasks and transform some professions, it's more likely to augment human capabilities rather than fully replace us. New jobs will emerge as AI creates new industries and opportunities, though workforce transitions will require adaptation and retraining."]
-            },
-            {
-                'patterns': [r'what is (cv|computer vision)'],
-                'responses': ["👁️ Computer Vision is an AI field that enables machines to derive meaningful information from visual inputs like images and videos. It powers technologies like facial recognition, autonomous vehicles, medical image analysis, and augmented reality."]
-            },
-            {
-                'patterns': [r'what is chatgpt'],
-                'responses': ["💬 ChatGPT is a conversational AI assistant developed by OpenAI. It's based on the GPT (Generative Pre-trained Transformer) architecture and can engage in dialogue, answer questions, write content, and assist with various tasks through natural language interaction."]
-            },
-            {
-                'patterns': [r'best ai tools'],
-                'responses': ["🛠️ Some popular AI tools include ChatGPT for conversation and text generation, DALL-E and Midjourney for image creation, GitHub Copilot for coding assistance, Jasper for content writing, and Lumen5 for video creation. The 'best' tool depends on your specific needs and use case."]
-            },
-            {
-                'patterns': [r'ai ethics|ethical ai'],
-                'responses': ["⚖️ AI ethics focuses on ensuring AI systems are developed and used responsibly, addressing issues like fairness, transparency, privacy, accountability, and preventing harm. It's crucial for building AI that respects human values and promotes well-being across society."]
-            },
-            {
-                'patterns': [r'future of ai'],
-                'responses': ["🔮 The future of AI likely includes more powerful and efficient models, greater integration into everyday life, improved multimodal capabilities, and specialized AI for complex domains. We'll see advances in reasoning abilities, human-AI collaboration, and potentially artificial general intelligence, all alongside evolving ethical frameworks."]
-            },
-            # Fun and personality-based questions
-            {
-                'patterns': [r'tell me a fun fact'],
-                'responses': ["✨ Did you know that honey never spoils? Archaeologists have found pots of honey in ancient Egyptian tombs that are over 3,000 years old and still perfectly good to eat!",
-                              "🧠 Fun fact: Your brain uses about 20% of the oxygen and blood in your body, despite only being 2% of your total body weight!",
-                              "🌌 Fascinating fact: There are more stars in the universe than grains of sand on all the beaches on Earth!"]
-            },
-            {
-                'patterns': [r'sing a song|sing for me'],
-                'responses': ["🎵 *Clears throat* La la la... Oh wait, I don't actually have a voice! But I'd be happy to share some lyrics or discuss your favorite songs instead!"]
-            },
-            {
-                'patterns': [r'tell me a riddle'],
-                'responses': ["🧩 I'm light as a feather, but even the strongest person can't hold me for more than a few minutes. What am I? (Answer: Breath)",
-                              "🧩 What has cities but no houses, forests but no trees, and rivers but no water? (Answer: A map)",
-                              "🧩 The more you take, the more you leave behind. What am I? (Answer: Footsteps)"]
-            },
-            {
-                'patterns': [r'meaning of life'],
-                'responses': ["🌌 The meaning of life is a profound philosophical question with countless interpretations! Some say it's 42, others find meaning in relationships, personal growth, happiness, or contributing to something greater than themselves. What do you think it is?"]
-            },
-            {
-                'patterns': [r'are you human'],
-                'responses': ["🤖 No, I'm not human - I'm an AI assistant created to help and communicate with people. I don't have consciousness or emotions, but I'm designed to be helpful, informative, and engage in natural conversations!"]
-            },
-            {
-                'patterns': [r'do you dream'],
-                'responses': ["💤 I don't dream or sleep - I'm an AI program that processes and responds to information. But I'm curious - what did you dream about last night?"]
-            },
-            {
-                'patterns': [r'favorite (color|food|movie|book)'],
-                'responses': ["💭 As an AI, I don't have personal preferences or favorites. But I'm designed to appreciate all the wonderful diversity of human experiences! What's your favorite?"]
-            },
-            {
-                'patterns': [r'(tell me|share) (something|anything) (in|about) (हिन्दी|hindi)'],
-                'responses': ["🇮🇳 नमस्ते! कैसे हैं आप? मैं एक AI असिस्टेंट हूँ और मुझे आपकी सहायता करके ख़ुशी होगी। आप किस विषय पर बात करना चाहेंगे?"]
-            },
-            {
-                'patterns': [r'(tell me|share) (something|anything) (in|about) (मराठी|marathi)'],
-                'responses': ["🇮🇳 नमस्कार! तुम्ही कसे आहात? मी एक AI असिस्टंट आहे आणि मला तुमची मदत करण्यात आनंद होईल. तुम्हाला कशाबद्दल बोलायला आवडेल?"]
-            },
-            # Technical and programming questions
-            {
-                'patterns': [r'what is (programming|coding)'],
-                'responses': ["💻 Programming or coding is the process of creating instructions for computers to follow. It uses languages like Python, JavaScript, or C++ to build applications, websites, games, and software that power our digital world."]
-            },
-            {
-                'patterns': [r'best programming language'],
-                'responses': ["⌨️ There's no single 'best' programming language! It depends on what you're building. Python is great for beginners and AI/data science, JavaScript for web development, Java for enterprise applications, C/C++ for performance-critical software, and so on. The best language is the one that fits your specific needs!"]
-            },
-            {
-                'patterns': [r'how to learn (programming|coding)'],
-                'responses': ["📚 Start with a beginner-friendly language like Python. Use free resources like freeCodeCamp, Codecademy, or CS50. Build small projects to apply what you learn. Join coding communities for support. Practice regularly and be patient - learning to code is a journey that takes time but offers great rewards!"]
-            },
-            {
-                'patterns': [r'(what|how) about blockchain'],
-                'responses': ["🔗 Blockchain is a distributed ledger technology that records transactions across many computers so no record can be altered retroactively. It enables secure, transparent systems without central authorities and powers cryptocurrencies like Bitcoin, plus applications in supply chain, voting systems, and digital identity verification."]
-            }
-        ]
+    if 'session_id' not in st.session_state:
+        # Identifies this browser session to the shared AI scheduler and the
+        # conversation log; kept in the URL so a reload resumes the chat.
+        # st.query_params (Streamlit 1.30+) is only touched when logging is on.
+        st.session_state.session_id = resume_session_id() or uuid.uuid4().hex
+        if get_conversation_store() is not None:
+            st.query_params["session"] = st.session_state.session_id
+    if not isinstance(st.session_state.get('chat_history'), QueryHistory):
+        st.session_state.chat_history = QueryHistory()
+    if not isinstance(st.session_state.get('messages'), MessageStore):
+        st.session_state.messages = new_message_store(st.session_state.session_id)
+        # Prior turns and rolling summary sent with AI questions
+        st.session_state.context = new_conversation_context()
+        resume_session(st.session_state.session_id)
+    if 'history_window' not in st.session_state:
+        st.session_state.history_window = HISTORY_WINDOW
+
+# Function to get the session id to resume from the URL, if it is one we logged
+def resume_session_id():
+    store = get_conversation_store()
+    if store is None:
+        return None
+    session = st.query_params.get("session", "")
+    if re.fullmatch(r"[0-9a-f]{32}", session) and store.has_session(session):
+        return session
+    return None
+
+# Function to reload a logged session's messages and recent chats
+def resume_session(session):
+    store = get_conversation_store()
+    if store is None or not store.has_session(session):
+        return
+    for message in store.load_messages(session):
+        if message.role == "assistant":
+            message.decoration = classify_tone(message.content)
+        message.html = build_message_html(message)
+        st.session_state.messages.append(message)
+    for query, timestamp in store.user_queries(session):
+        st.session_state.chat_history.add(query, timestamp)
 
 # Function to match user input with rule patterns - improved for faster response
-def find_response(user_input):
-    user_input = user_input.lower().strip()
+def find_response(user_input, engine=None):
+    user_input = normalize_input(user_input)
     
     # Try to match with simple rules first for faster responses
-    for rule in st.session_state.rules:
-        for pattern in rule['patterns']:
-            if re.search(pattern, user_input):
-                return random.choice(rule['responses'])
+    match = (engine or get_engine()).match(user_input)
+    if match:
+        return match.response
     
     # If no simple rule matches, use Groq API for more complex responses
     return get_ai_response(user_input)
 
+# Stream AI responses into the chat as tokens arrive (CHATBOT_STREAM=0 disables)
+STREAM_AI_RESPONSES = os.getenv("CHATBOT_STREAM", "1") != "0"
+# Minimum seconds between bubble updates while streaming
+STREAM_RENDER_INTERVAL = 0.05
+
 # Function to get response from Groq API
 def get_ai_response(query):
+    return fetch_ai_response(query)[0]
+
+# Function to get an AI response through the shared caches, after the
+# prior turns in `context` if given.
+# Returns the text and the cache status ("exact", "semantic" or "miss").
+def fetch_ai_response(query, session=None, context=None):
     try:
         # Empty spinner for better UX
         with st.spinner(""):
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You are a helpful, friendly assistant created by Nandesh Kalashetti. Keep your answers very concise, informative and engaging. Use emojis when appropriate but don't overdo it. Format important information with bold when needed. Be conversational yet efficient. Keep responses under 100 words when possible."},
-                    {"role": "user", "content": query}
-                ],
-                model="llama3-8b-8192",  # Efficient model
-                max_tokens=500,  # Reduced for faster responses
-                temperature=0.7,  # Good creativity balance
-                top_p=0.95,  # Better quality without sacrificing speed
-                stream=False,  # Not streaming for faster complete responses
-                timeout=10  # Set timeout to ensure fast responses
-            )
-            return chat_completion.choices[0].message.content
+            return ask_ai(query, session, context)
+    except BusyError:
+        # Shed by the scheduler: answer fast instead of queueing
+        return AI_BUSY_MESSAGE, "miss"
+    except Exception as e:
+        st.error(f"Error connecting to Groq API: {str(e)}")
+        return AI_ERROR_MESSAGE, "miss"
+
+# Function to stream a response from Groq API, yielding text as it arrives.
+# A `usage` dict gets the reported token usage once the stream ends.
+def stream_ai_response(query, session=None, context=None, usage=None):
+    return get_ai_client().stream(build_messages(query, context), session=session, usage=usage)
+
+# Function to render a streamed response into a placeholder bubble.
+# Returns the final text, time to first token, total time in seconds and
+# the cache status ("exact", "semantic" or "miss").
+def render_ai_stream(query, placeholder, session=None, context=None):
+    start = time.perf_counter()
+    cached, cache_status = lookup_ai_cache(query, context)
+    if cached is not None:
+        placeholder.markdown(f'<div class="message bot-message">{html.escape(cached, quote=False)}</div>', unsafe_allow_html=True)
+        elapsed = time.perf_counter() - start
+        return cached, elapsed, elapsed, cache_status
+
+    first_token = None
+    failed = False
+    error = None
+    last_render = 0.0
+    parts = []
+    span = current_span()
+    usage = {} if span is not None else None
+    try:
+        for delta in stream_ai_response(query, session, context, usage):
+            now = time.perf_counter()
+            if first_token is None:
+                first_token = now - start
+            parts.append(delta)
+            # Throttle re-renders so long answers don't flood the websocket
+            if now - last_render >= STREAM_RENDER_INTERVAL:
+                placeholder.markdown(f'<div class="message bot-message">{html.escape("".join(parts), quote=False)}</div>', unsafe_allow_html=True)
+                last_render = now
+    except BusyError as e:
+        failed = True
+        error = f"BusyError: {e}"
+        if not parts:
+            parts.append(AI_BUSY_MESSAGE)
     except Exception as e:
         st.error(f"Error connecting to Groq API: {str(e)}")
-        return "😕 I'm having trouble connecting right now. Please try again in a moment."
+        failed = True
+        error = f"{type(e).__name__}: {e}"
+        if not parts:
+            parts.append(AI_ERROR_MESSAGE)
+    total = time.perf_counter() - start
+    STAGE_SECONDS.observe(total, "ai")
+    if span is not None:
+        end = time.perf_counter_ns()
+        attributes = ai_span_attributes(build_messages(query, context), usage, cache_status, stream=True)
+        if first_token is not None:
+            attributes["ai.ttft_ms"] = round(first_token * 1000, 3)
+        span.child("ai.call", end - int(total * 1e9), end, attributes, error)
+    text = "".join(parts)
+    # Only complete answers are worth reusing
+    if not failed:
+        store_ai_response(query, text, context)
+    return text, (first_token if first_token is not None else total), total, cache_status
 
-# Function to add to chat history
+# Function to add to chat history (a repeated query moves to the top)
 def add_to_chat_history(query):
-    if query not in [item[0] for item in st.session_state.chat_history]:
-        st.session_state.chat_history.insert(0, (query, time.time()))
-        # Keep only the most recent 15 queries
-        if len(st.session_state.chat_history) > 15:
-            st.session_state.chat_history = st.session_state.chat_history[:15]
+    st.session_state.chat_history.add(query)
+
+# Function to build the sidebar's recent chats as one HTML block
+def render_chat_history(chat_history, title="Recent Chats"):
+    items = []
+    for query, timestamp in chat_history:
+        # Escaped as a JS string, then as an HTML attribute
+        safe_query = html.escape(query.replace("\\", "\\\\").replace("'", "\\'"))
+        label = html.escape(query[:40] + '...' if len(query) > 40 else query)
+        items.append(f'<div class="history-item" onclick="document.getElementById(\'user-input\').value=\'{safe_query}\'; document.getElementById(\'user-input\').focus();">{label}</div>')
+    return (f"<h3 style='color: #f8fafc; font-size: 15px; margin: 20px 0 5px;'>{title}</h3>"
+            f'<div class="history-container">{"".join(items)}</div>')
+
+# Number of most recent messages shown; "load earlier" reveals this many more
+HISTORY_WINDOW = 40
+
+# Function to build a message's chat bubble HTML. Text is escaped, so
+# neither users nor model output can inject markup into the page.
+def build_message_html(message):
+    content = html.escape(message.content, quote=False)
+    if message.role == "user":
+        return f'<div class="message user-message">{content}</div>'
+
+    if message.decoration:
+        content = f"{message.decoration} {content}"
+
+    # Check if this was a rule-based match and add the pattern indicator
+    pattern_indicator = ""
+    if message.pattern:
+        pattern_indicator = f'<div style="margin-top: 12px; font-size: 12px; color: #94a3b8;"><span class="pattern-indicator" style="display: inline-block; background-color: rgba(59, 130, 246, 0.15); color: #bfdbfe; border-radius: 20px; padding: 4px 12px; font-size: 12px; border: 1px solid rgba(59, 130, 246, 0.3); margin-right: 5px;">rule</span> Matched pattern: <code style="background: rgba(30, 41, 59, 0.6); padding: 2px 6px; border-radius: 4px; font-size: 11px;">{html.escape(message.pattern)}</code></div>'
+
+    # Add AI indicator for non-rule responses
+    elif message.source in AI_SOURCES:
+        pattern_indicator = '<div style="margin-top: 12px; font-size: 12px; color: #94a3b8;"><span class="pattern-indicator" style="display: inline-block; background-color: rgba(236, 72, 153, 0.15); color: #fbcfe8; border-radius: 20px; padding: 4px 12px; font-size: 12px; border: 1px solid rgba(236, 72, 153, 0.3); margin-right: 5px;">ai</span> No rule pattern matched - using AI response</div>'
+
+    return f'<div class="message bot-message">{content}{pattern_indicator}</div>'
+
+# Sources of assistant messages the rules didn't answer
+AI_SOURCES = ("ai", "busy", "error")
+
+# Function to tell which AI source produced a response
+def ai_source(response):
+    if response == AI_BUSY_MESSAGE:
+        return "busy"
+    if response == AI_ERROR_MESSAGE:
+        return "error"
+    return "ai"
+
+# Function to add a message to the chat. Its decoration and HTML are
+# computed here, once, and reused on every later rerun. Rule answers are
+# stored as a reference to the shared response text.
+def add_message(role, content, matched_pattern=None, is_pattern_match=None, rules_version=None,
+                ttft=None, generation_time=None, cache_status=None, source=None):
+    if source is None and is_pattern_match is not None:
+        source = "rule" if is_pattern_match else "ai"
+    timing = (ttft, generation_time, cache_status) if ttft is not None else None
+    message = Message(role, content, matched_pattern, source, rules_version, timing=timing,
+                      rule_response=bool(is_pattern_match))
+    if role == "assistant":
+        span = current_span()
+        start = time.perf_counter_ns()
+        message.decoration = classify_tone(content)
+        if span is not None:
+            span.child("decorate", start, time.perf_counter_ns(), {"tone.emoji": message.decoration})
+    message.html = build_message_html(message)
+    store = get_conversation_store()
+    if store is not None:
+        store.record(st.session_state.session_id, message)
+    return st.session_state.messages.append(message)
+
+# Function to get a message's HTML (messages read back from the spill log
+# don't keep theirs)
+def message_html(message):
+    return message.html or build_message_html(message)
+
+# Function to render the visible window of the chat, one element per
+# message so markdown a message leaves open (an unclosed ``` fence) can't
+# spill into the next. Only the last history_window messages are sent;
+# older ones wait behind a "load earlier" button, so rerun cost doesn't
+# grow with the conversation.
+def render_messages():
+    start = time.perf_counter()
+    messages = st.session_state.messages
+    hidden = max(0, len(messages) - st.session_state.history_window)
+    if hidden:
+        if st.button(f"⬆️ Load {min(hidden, HISTORY_WINDOW)} earlier messages", key="load_earlier"):
+            st.session_state.history_window += HISTORY_WINDOW
+            hidden = max(0, len(messages) - st.session_state.history_window)
+    for message in messages[hidden:]:
+        st.markdown(message_html(message), unsafe_allow_html=True)
+    STAGE_SECONDS.observe(time.perf_counter() - start, "render")
+
+# Function to render the messages and finish the trace of the turn the last
+# run answered, if it was sampled: the st.rerun() round-trip, then this
+# run's render, then the turn itself
+def render_traced_messages():
+    pending = st.session_state.pop("pending_trace", None)
+    if pending is None:
+        return render_messages()
+    trace, rerun_at = pending
+    trace.child("rerun", rerun_at, time.perf_counter_ns())
+    with use_span(trace), trace.child("render", attributes={"chat.messages": len(st.session_state.messages)}):
+        render_messages()
+    trace.end()
 
 # Function to handle message submission
 def handle_submit():
@@ -796,39 +308,52 @@ def handle_submit():
         add_to_chat_history(user_message)
         
         # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": user_message})
+        add_message("user", user_message)
         
         # Clear input
         st.session_state.user_input = ""
         
-        # Get bot response
-        response = find_response(user_message)
+        # Get bot response from the current rule snapshot
+        snapshot = get_rule_store().snapshot()
+        response = find_response(user_message, snapshot.engine)
         
         # Add bot response to chat
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        add_message("assistant", response, rules_version=snapshot.version)
         
         # Rerun to update UI
         st.rerun()
 
 # Main app function
 def main():
+    # Set page config (must be first Streamlit command)
+    st.set_page_config(
+        page_title="AI Assistant | Nandesh Kalashetti",
+        page_icon="🤖",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+    # Load environment variables before the AI client reads GROQ_API_KEY
+    load_dotenv()
+    # Serve /metrics on CHATBOT_METRICS_PORT, if set (once per process)
+    start_metrics_server()
+
     load_css()
     init_session_state()
+    # Start (and pre-warm) the shared AI connection before the first question
+    get_ai_client()
     
     # Sidebar
     with st.sidebar:
         # Developer info with profile picture
         st.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
-        st.markdown("""
+        st.markdown(static_html("""
         <div class="logo-container">
             <h2 style="margin-top: 10px; color: #f8fafc; font-size: 18px;">Nandesh Kalashetti</h2>
             <p style="color: #94a3b8; font-size: 13px;">Full-Stack Developer</p>
         </div>
-        """, unsafe_allow_html=True)
         
-        # Connect links
-        st.markdown("<h3 style='color: #f8fafc; font-size: 15px; margin: 15px 0 10px;'>Connect With Me</h3>", unsafe_allow_html=True)
-        st.markdown("""
+        <h3 style='color: #f8fafc; font-size: 15px; margin: 15px 0 10px;'>Connect With Me</h3>
         <div class="connect-links">
             <a href="https://github.com/Universe7Nandu" target="_blank" class="connect-link">
                 <img src="https://img.icons8.com/fluent/24/000000/github.png" width="18" />
@@ -843,27 +368,24 @@ def main():
                 <img src="https://img.icons8.com/fluency/24/000000/instagram-new.png" width="18" />
             </a>
         </div>
-        """, unsafe_allow_html=True)
+        """), unsafe_allow_html=True)
         
-        # Chat history in sidebar
+        # Chat history in sidebar, sent as a single element: the latest
+        # queries, or the best matches for a search over all of them
         if st.session_state.chat_history:
-            st.markdown("<h3 style='color: #f8fafc; font-size: 15px; margin: 20px 0 5px;'>Recent Chats</h3>", unsafe_allow_html=True)
-            st.markdown('<div class="history-container">', unsafe_allow_html=True)
-            
-            for i, (query, timestamp) in enumerate(st.session_state.chat_history):
-                # Fix the SyntaxError by using double quotes and escaping properly
-                safe_query = query.replace('"', '&quot;')
-                st.markdown(f"""
-                <div class="history-item" onclick="document.getElementById('user-input').value='{safe_query}'; document.getElementById('user-input').focus();">
-                    {query[:40] + '...' if len(query) > 40 else query}
-                </div>
-                """, unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
+            search = st.text_input("🔎 Search your chats", key="history_search", placeholder="Search past questions...")
+            if search.strip():
+                results = st.session_state.chat_history.search(search)
+                if results:
+                    st.markdown(render_chat_history(results, "Search Results"), unsafe_allow_html=True)
+                else:
+                    st.caption("No past questions match.")
+            else:
+                st.markdown(render_chat_history(st.session_state.chat_history.recent()), unsafe_allow_html=True)
         
-        # Feature cards
-        st.markdown("<h3 style='color: #f8fafc; font-size: 15px; margin: 20px 0 5px;'>Features</h3>", unsafe_allow_html=True)
-        st.markdown("""
+        # Feature cards and tech stack
+        st.markdown(static_html("""
+        <h3 style='color: #f8fafc; font-size: 15px; margin: 20px 0 5px;'>Features</h3>
         <div class="feature-card">
             <h4 style="color: #f8fafc; font-size: 14px; margin-bottom: 5px;">🧠 Pattern Matching</h4>
             <p style="color: #94a3b8; font-size: 12px;">Rule-based responses to predefined questions</p>
@@ -883,11 +405,8 @@ def main():
             <h4 style="color: #f8fafc; font-size: 14px; margin-bottom: 5px;">📊 Unit Testing</h4>
             <p style="color: #94a3b8; font-size: 12px;">Ensuring response reliability</p>
         </div>
-        """, unsafe_allow_html=True)
         
-        # Tech stack
-        st.markdown("<h3 style='color: #f8fafc; font-size: 15px; margin: 20px 0 5px;'>Tech Stack</h3>", unsafe_allow_html=True)
-        st.markdown("""
+        <h3 style='color: #f8fafc; font-size: 15px; margin: 20px 0 5px;'>Tech Stack</h3>
         <div style="display: flex; flex-wrap: wrap; gap: 5px;">
             <span class="tech-badge">Python</span>
             <span class="tech-badge">Streamlit</span>
@@ -895,22 +414,47 @@ def main():
             <span class="tech-badge">PyTest</span>
             <span class="tech-badge">Git</span>
         </div>
-        """, unsafe_allow_html=True)
+        """), unsafe_allow_html=True)
+        
+        # Diagnostics: rule snapshot and shared AI cache counters
+        with st.expander("⚙️ Diagnostics"):
+            cache_stats = get_response_cache().stats()
+            snapshot = get_rule_store().snapshot()
+            st.caption(f"Rules version {snapshot.version}")
+            for pattern, (rule_id, problem) in snapshot.engine.disabled.items():
+                st.caption(f"⚠️ Rule {rule_id} pattern `{pattern}` disabled: {problem}")
+            st.caption(f"AI cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+                       f"{cache_stats['evictions']} evictions · {cache_stats['entries']} entries")
+            ai_stats = get_ai_client().stats()
+            st.caption(f"AI upstream: breaker {ai_stats['breaker_state']} · {ai_stats['retries']} retries · "
+                       f"{ai_stats['short_circuits']} fast-fails · {ai_stats['coalesced']} coalesced")
+            if 'shed' in ai_stats:
+                st.caption(f"AI scheduler: {ai_stats['waiting']} waiting · {ai_stats['shed'] + ai_stats['expired']} shed · "
+                           f"{ai_stats['usage_tokens']} tokens used")
+            if get_semantic_cache() is not None:
+                semantic_stats = get_semantic_cache().stats()
+                st.caption(f"Semantic cache: {semantic_stats['hits']} hits · {semantic_stats['misses']} misses · "
+                           f"{semantic_stats['entries']} entries")
+            messages = st.session_state.messages
+            sessions = memory_report()
+            st.caption(f"Messages: {messages.memory_bytes() // 1024} KB of {messages.max_bytes // 1024} KB in memory · "
+                       f"{messages.spilled} on disk · {sessions['sessions']} sessions, {sessions['bytes'] // 1024} KB total")
+            if get_conversation_store() is not None:
+                log_stats = get_conversation_store().stats()
+                st.caption(f"Conversation log: {log_stats['written']} turns in {log_stats['batches']} batches · "
+                           f"{log_stats['pending']} pending · {log_stats['dropped']} dropped")
         st.markdown('</div>', unsafe_allow_html=True)
     
     # Main content - rule-based AI assistant
     st.markdown('<div class="chat-interface">', unsafe_allow_html=True)
 
-    # Simple welcome banner highlighting rule-based functionality
-    st.markdown("""
+    # Simple welcome banner highlighting rule-based functionality, and pattern examples
+    st.markdown(static_html("""
     <div class="welcome-banner">
         <h1>Rule-Based AI Assistant</h1>
         <p>Pattern matching chatbot with predefined responses and AI capabilities for complex queries</p>
     </div>
-    """, unsafe_allow_html=True)
-
-    # Add pattern examples section
-    st.markdown("""
+    
     <div class="patterns-section">
         <div style="color: #e2e8f0; font-size: 14px; margin-bottom: 12px; font-weight: 500;">Try these patterns:</div>
         <div style="display: flex; flex-wrap: wrap; gap: 8px; justify-content: center;">
@@ -928,72 +472,26 @@ def main():
             <span class="pattern-indicator" onclick="document.getElementById('user-input').value='bye'; document.getElementById('user-input').focus();">bye</span>
         </div>
     </div>
-    """, unsafe_allow_html=True)
+    """), unsafe_allow_html=True)
 
     # Messages container
     st.markdown('<div class="messages-container">', unsafe_allow_html=True)
 
     # Display welcome message if no messages yet - focused on rule-based functionality
     if not st.session_state.messages:
-        st.markdown("""
+        st.markdown(static_html("""
         <div class="welcome-container">
             <img src="https://img.icons8.com/fluency/96/000000/chatbot.png" style="width: 80px; margin-bottom: 15px;" alt="Chatbot Icon">
             <p style="color: #f8fafc; font-size: 16px; margin-bottom: 8px;">Rule-Based AI Assistant Ready!</p>
             <p style="color: #94a3b8; font-size: 14px;">Ask me predefined questions or try more complex queries</p>
         </div>
-        """, unsafe_allow_html=True)
+        """), unsafe_allow_html=True)
     
     # Display chat messages with pattern indicators for rule-based responses
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            st.markdown(f'<div class="message user-message">{message["content"]}</div>', unsafe_allow_html=True)
-        else:
-            # Get content
-            content = message.get("content", "")
-            
-            # Only add emoji if content exists and doesn't already have an emoji
-            emoji_list = ['😊', '👋', '🤖', '💡', '🚀', '📊', '⚠️', '🤔', '👍', '✨', '🙏', '😄']
-            if content and not any(emoji in content[:4] for emoji in emoji_list):
-                # Add relevant emojis based on content
-                if "hello" in content.lower() or "hi" in content.lower():
-                    content = "👋 " + content
-                elif "thank" in content.lower():
-                    content = "😊 " + content
-                elif "sorry" in content.lower():
-                    content = "😔 " + content
-                elif "help" in content.lower() or "assist" in content.lower():
-                    content = "🤝 " + content
-                elif "created" in content.lower() or "developer" in content.lower():
-                    content = "👨‍💻 " + content
-                elif "capabilities" in content.lower() or "can you" in content.lower():
-                    content = "🚀 " + content
-                elif any(word in content.lower() for word in ["data", "weather", "temperature"]):
-                    content = "📊 " + content
-                elif "error" in content.lower() or "trouble" in content.lower():
-                    content = "⚠️ " + content
-                elif "?" in content:
-                    content = "🤔 " + content
-                elif any(word in content.lower() for word in ["yes", "sure", "correct", "right"]):
-                    content = "👍 " + content
-                elif any(word in content.lower() for word in ["welcome", "please", "glad"]):
-                    content = "🙏 " + content
-                elif any(word in content.lower() for word in ["joke", "funny", "laugh"]):
-                    content = "😄 " + content
-                elif any(word in content.lower() for word in ["awesome", "amazing", "excellent", "great"]):
-                    content = "✨ " + content
-                else:
-                    content = "💡 " + content
-            
-            # Check if this was a rule-based match and add the pattern indicator
-            pattern_indicator = ""
-            if message.get("matched_pattern", None):
-                pattern_indicator = f'<div style="margin-top: 12px; font-size: 12px; color: #94a3b8;"><span class="pattern-indicator" style="display: inline-block; background-color: rgba(59, 130, 246, 0.15); color: #bfdbfe; border-radius: 20px; padding: 4px 12px; font-size: 12px; border: 1px solid rgba(59, 130, 246, 0.3); margin-right: 5px;">rule</span> Matched pattern: <code style="background: rgba(30, 41, 59, 0.6); padding: 2px 6px; border-radius: 4px; font-size: 11px;">{message["matched_pattern"]}</code></div>'
-            
-            # Add AI indicator for non-rule responses
-            elif "is_pattern_match" in message and not message["is_pattern_match"]:
-                pattern_indicator = '<div style="margin-top: 12px; font-size: 12px; color: #94a3b8;"><span class="pattern-indicator" style="display: inline-block; background-color: rgba(236, 72, 153, 0.15); color: #fbcfe8; border-radius: 20px; padding: 4px 12px; font-size: 12px; border: 1px solid rgba(236, 72, 153, 0.3); margin-right: 5px;">ai</span> No rule pattern matched - using AI response</div>'
-                
-            st.markdown(f'<div class="message bot-message">{content}{pattern_indicator}</div>', unsafe_allow_html=True)
+    render_traced_messages()
+    
+    # Slot for the turn being answered, so a streamed reply appears below the history
+    pending_turn = st.empty()
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -1019,7 +517,7 @@ def main():
             submitted = st.form_submit_button("Submit", type="primary", help="Send message")
         
         # Footer info
-        st.markdown("""
+        st.markdown(static_html("""
         <div class="footer-info">
             © 2024 Nandesh Kalashetti | Rule-Based Chat Assistant | 
             <span style="color: #a7f3d0;">✓</span> Functionality 
@@ -1027,44 +525,69 @@ def main():
             <span style="color: #a7f3d0;">✓</span> Testing 
             <span style="color: #a7f3d0;">✓</span> Code Quality
         </div>
-        """, unsafe_allow_html=True)
+        """), unsafe_allow_html=True)
         
     st.markdown('</div>', unsafe_allow_html=True)  # Close input-area div
 
     # Handle form submission
     if submitted and user_input and user_input.strip():
-        # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        # A sampled turn is traced from here until the next run has rendered it
+        trace = get_tracer().start_trace("chat.turn", {"chat.input_chars": len(user_input)})
+        with use_span(trace):
+            # Add user message to chat
+            user_message = add_message("user", user_input)
         
-        # Add to sidebar chat history
-        add_to_chat_history(user_input)
+            # Add to sidebar chat history
+            add_to_chat_history(user_input)
         
-        # Get and display response
-        is_pattern_match = False
-        matched_pattern = None
+            # Get and display response
+            is_pattern_match = False
+            matched_pattern = None
+            source = "rule"
         
-        # Try to find a pattern match first
-        for rule in st.session_state.rules:
-            for pattern in rule['patterns']:
-                if re.search(pattern, user_input.lower().strip()):
-                    response = random.choice(rule['responses'])
-                    is_pattern_match = True
-                    matched_pattern = pattern
-                    break
-            if is_pattern_match:
-                break
+            # Try to find a pattern match first, pinned to one rule snapshot
+            snapshot = get_rule_store().snapshot()
+            turn = match_rule(user_input, snapshot)
+            if turn:
+                response = turn.response
+                is_pattern_match = True
+                matched_pattern = turn.pattern
         
-        # If no pattern match, use Groq API
-        if not is_pattern_match:
-            response = get_ai_response(user_input)
+            # If no pattern match, use Groq API
+            timing = {}
+            if not is_pattern_match:
+                # Earlier turns (all but the message just added) under the token budget
+                messages = st.session_state.messages
+                context = st.session_state.context.build(messages, len(messages) - 1)
+                if STREAM_AI_RESPONSES:
+                    with pending_turn.container():
+                        st.markdown(user_message.html, unsafe_allow_html=True)
+                        response, ttft, generation_time, cache_status = render_ai_stream(user_input, st.empty(), st.session_state.session_id, context)
+                else:
+                    start = time.perf_counter()
+                    response, cache_status = fetch_ai_response(user_input, st.session_state.session_id, context)
+                    ttft = generation_time = time.perf_counter() - start
+                timing = {"ttft": ttft, "generation_time": generation_time, "cache_status": cache_status}
+                source = ai_source(response)
+                TURNS.inc(source)
         
-        # Add response with metadata about pattern matching
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": response,
-            "is_pattern_match": is_pattern_match,
-            "matched_pattern": matched_pattern
-        })
+            # Add response with metadata about pattern matching
+            add_message(
+                "assistant",
+                response,
+                is_pattern_match=is_pattern_match,
+                matched_pattern=matched_pattern,
+                rules_version=snapshot.version,
+                source=source,
+                **timing
+            )
+
+            trace.set_attribute("chat.source", source)
+            trace.set_attribute("rule.pattern", matched_pattern)
+            trace.set_attribute("rules.version", snapshot.version)
+            trace.set_attribute("cache.status", timing.get("cache_status"))
+        if trace.recording:
+            st.session_state.pending_trace = (trace, time.perf_counter_ns())
         
         # Rerun to update the UI
         st.rerun()
@@ -0,0 +1,107 @@
+# benchmarks/bench_fuzzy.py
+# Fuzzy tier benchmark: how many typo'd rule queries it answers without the
+# AI (and how many it answers wrong) per confidence threshold, and the
+# latency it adds to a rule miss
+#
+#   python benchmarks/bench_fuzzy.py
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rule_engine import scaled_rules
+from chatbot import DEFAULT_RULES, RuleEngine
+from chatbot.fuzzy import _WORD, FuzzyIndex
+
+THRESHOLDS = (0.7, 0.75, 0.8, 0.9)
+QUERIES = {
+    'typo_hit': "tel me a jok",
+    'miss': "explain quantum entanglement in simple terms",
+    'long_miss': "could you please walk me through how photosynthesis works in desert plants",
+}
+
+
+# Function to make a typo in one word: a dropped, swapped, doubled or wrong letter
+def typo(word, rng):
+    i = rng.randrange(len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 2:
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz'.replace(word[i], '')) + word[i + 1:]
+
+
+# Function to build misspelled queries from the default rules' keywords:
+# (query, rule id the correctly spelled keyword gets), one or two words
+# changed
+def typo_queries(engine, per_keyword=5, seed=0):
+    rng = random.Random(seed)
+    queries = []
+    for entry in engine.entries:
+        for keyword in sorted(engine._compiled[entry.pattern].literals or ()):
+            words = _WORD.findall(keyword)
+            long_words = [i for i, word in enumerate(words) if len(word) >= 4]
+            if not long_words:
+                continue
+            for _ in range(per_keyword):
+                changed = list(words)
+                for i in rng.sample(long_words, min(len(long_words), rng.choice((1, 2)))):
+                    changed[i] = typo(changed[i], rng)
+                query = " ".join(changed)
+                # The right answer is what the keyword itself gets, which is
+                # an earlier rule when one of its patterns matches inside it
+                if engine.lookup(query) is None:
+                    queries.append((query, engine.lookup(keyword).rule_id))
+    return queries
+
+
+def bench(fn, number=2000):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    engine = RuleEngine(DEFAULT_RULES)
+    queries = typo_queries(engine)
+    print(f"{len(queries)} misspelled rule queries that no pattern matches")
+    print(f"{'threshold':>9} {'answered':>9} {'right rule':>11} {'wrong rule':>11}")
+    for threshold in THRESHOLDS:
+        tier = RuleEngine(DEFAULT_RULES, fuzzy_threshold=threshold)
+        found = [(tier.fuzzy_match(query), rule_id) for query, rule_id in queries]
+        answered = [(match, rule_id) for match, rule_id in found if match]
+        right = sum(match.rule_id == rule_id for match, rule_id in answered)
+        print(f"{threshold:>9} {len(answered) / len(queries):>9.1%} {right / len(queries):>11.1%}"
+              f" {(len(answered) - right) / len(queries):>11.1%}")
+
+    print(f"\n{'rules':>7} {'build ms':>9} {'index ms':>9} {'words':>6} {'case':<10} {'match us':>9}"
+          f" {'fuzzy us':>9} {'cold us':>8}")
+    for count in (len(DEFAULT_RULES), 10000):
+        rules = scaled_rules(count)
+        start = time.perf_counter()
+        engine = RuleEngine(rules)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        FuzzyIndex(literal for compiled in engine._compiled.values() for literal in compiled.literals or ())
+        index_ms = (time.perf_counter() - start) * 1000
+        for case, query in QUERIES.items():
+            match_us = bench(lambda: engine.match(query))
+            # What a miss turn pays on top of the exact match: warm, and with
+            # every word of the query new to the correction memo
+            fuzzy_us = bench(lambda: engine.fuzzy_match(query))
+
+            def cold():
+                engine.fuzzy._memo.clear()
+                engine.fuzzy_match(query)
+
+            cold_us = bench(cold, 500)
+            print(f"{count:>7} {build_ms:>9.1f} {index_ms:>9.1f} {len(engine.fuzzy.words):>6} {case:<10}"
+                  f" {match_us:>9.2f} {fuzzy_us:>9.2f} {cold_us:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_history.py
+# Sidebar history benchmark: add and ranked prefix search over many past
+# queries, from rare terms to terms found in most queries
+#
+#   python benchmarks/bench_history.py --queries 50000
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.history import QueryHistory
+
+
+# Function to make `count` queries over a Zipf-distributed vocabulary, so a
+# few words appear in most queries the way "what" and "how" do
+def make_queries(count, vocabulary_size, rng):
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+                  for _ in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    queries = [" ".join(rng.choices(vocabulary, weights, k=rng.randint(3, 10))) for _ in range(count)]
+    return vocabulary, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sidebar history benchmark")
+    parser.add_argument('--queries', type=int, default=50000)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50, help="timed runs per search")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary, queries = make_queries(args.queries, args.vocabulary, rng)
+    history = QueryHistory(max_entries=args.queries)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        history.add(query, i)
+    elapsed = time.perf_counter() - start
+    print(f"{len(history)} distinct queries, add {elapsed / len(queries) * 1e6:.2f} us each")
+
+    searches = {
+        'most common word': vocabulary[0],
+        'common prefix': vocabulary[0][:2],
+        'two common words': f"{vocabulary[0]} {vocabulary[1]}",
+        'common + prefix': f"{vocabulary[0]} {vocabulary[1][:3]}",
+        'rare word': vocabulary[-1],
+        'no match': "zzzzzz",
+    }
+    for name, text in searches.items():
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results = history.search(text)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        print(f"  {name:<18} {len(results):>3} results  p50 {samples[len(samples) // 2] * 1000:>7.3f} ms"
+              f"  max {samples[-1] * 1000:>7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# benchmarks/bench_match_many.py
+# Throughput of match_many over a synthetic query corpus, serial vs process pool
+#
+#   python benchmarks/bench_match_many.py [queries]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import get_engine, match_many
+
+SAMPLES = [
+    "hello", "Tell me a joke", "what is machine learning?", "how about blockchain",
+    "explain quantum entanglement", "what's the capital of peru", "future of AI",
+    "can you summarize this article for me", "bye", "tell me something in हिन्दी",
+]
+
+
+def corpus(count, seed=7):
+    rng = random.Random(seed)
+    return [f"{rng.choice(SAMPLES)} {rng.randrange(1000)}" for _ in range(count)]
+
+
+def run(queries, workers):
+    start = time.perf_counter()
+    hits = sum(1 for result in match_many(queries, workers=workers, min_parallel=1) if result.rule_id is not None)
+    elapsed = time.perf_counter() - start
+    return hits, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    queries = corpus(count)
+    get_engine()
+    for workers in sorted({1, os.cpu_count() or 1}):
+        hits, elapsed = run(queries, workers)
+        print(f"workers={workers:<3} queries={count} hits={hits} "
+              f"elapsed={elapsed:.2f}s rate={count / elapsed * 60 / 1e6:.2f}M queries/min")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/bench_page_bytes.py
+# Elements and serialized bytes the app sends per script rerun, as a chat grows
+#
+#   python benchmarks/bench_page_bytes.py            # CSS inlined
+#   python benchmarks/bench_page_bytes.py --static   # CSS served from static/
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+from streamlit import config
+from streamlit.testing.v1 import AppTest
+
+# Rule-matched questions, so the run needs no network
+QUESTIONS = ["hello", "who are you", "tell me a joke", "what can you do", "thanks", "how are you",
+             "who created you", "what is ai", "tell me a fun fact", "bye", "what is machine learning",
+             "what is python"]
+
+
+def walk(node):
+    yield node
+    for child in getattr(node, 'children', {}).values():
+        yield from walk(child)
+
+
+# Function to count the elements and protobuf bytes of the last rerun
+def measure(at):
+    protos = [node.proto for node in walk(at._tree) if getattr(node, 'proto', None) is not None]
+    return len(protos), sum(len(proto.SerializeToString()) for proto in protos)
+
+
+def main():
+    if "--static" in sys.argv:
+        config.set_option("server.enableStaticServing", True)
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60).run()
+    elements, size = measure(at)
+    print(f"{'turn':>4} {'elements':>9} {'bytes':>8}")
+    print(f"{0:>4} {elements:>9} {size:>8}")
+    for turn, question in enumerate(QUESTIONS, 1):
+        at.text_input(key="user_input").input(question)
+        next(button for button in at.button if button.label == "Submit").click()
+        at.run()
+        elements, size = measure(at)
+        print(f"{turn:>4} {elements:>9} {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_persistence.py
+# Conversation log benchmark: time added to the request path by record()
+# and sustained write throughput, against committing each turn inline
+#
+#   python benchmarks/bench_persistence.py --turns 20000 --sessions 50
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.messages import Message
+from chatbot.persistence import ConversationStore
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_messages(turns):
+    messages = []
+    for i in range(turns):
+        if i % 2 == 0:
+            messages.append(Message("user", f"what is the weather like in city number {i}"))
+        else:
+            messages.append(Message("assistant", "Hello! How can I help you today?", "hello|hi", "rule", 1,
+                                    rule_response=True))
+    return messages
+
+
+# Function to time record() per turn, then how long the writer needs to drain
+def run_batched(path, messages, sessions, batch_size):
+    store = ConversationStore(path, batch_size=batch_size, max_queue=len(messages) + 1)
+    samples = []
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        t = time.perf_counter_ns()
+        store.record(f"{i % sessions:032x}", message)
+        samples.append(time.perf_counter_ns() - t)
+    enqueued = time.perf_counter() - start
+    store.flush(timeout=300)
+    total = time.perf_counter() - start
+    stats = store.stats()
+    store.close()
+    return sorted(samples), enqueued, total, stats
+
+
+# Function to time the naive alternative: one INSERT and commit per turn on
+# the request path
+def run_inline(path, messages, sessions):
+    store = ConversationStore(path)
+    store.close()
+    db = sqlite3.connect(path)
+    samples = []
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        t = time.perf_counter_ns()
+        with db:
+            db.execute("INSERT INTO turns (session, created, role, content, source, pattern, rules_version) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)", (f"{i % sessions:032x}", time.time(), message.role,
+                                                        message.content, message.source, message.pattern,
+                                                        message.rules_version))
+        samples.append(time.perf_counter_ns() - t)
+    total = time.perf_counter() - start
+    db.close()
+    return sorted(samples), total
+
+
+def report(name, samples, total, turns):
+    print(f"{name:<22} request path p50 {percentile(samples, 0.5) / 1000:>8.2f} us  "
+          f"p99 {percentile(samples, 0.99) / 1000:>8.2f} us   {turns / total:>9.0f} turns/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation log benchmark")
+    parser.add_argument('--turns', type=int, default=20000)
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--inline-turns', type=int, default=2000, help="turns for the commit-per-turn baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        messages = make_messages(args.turns)
+        samples, enqueued, total, stats = run_batched(os.path.join(directory, 'batched.db'), messages,
+                                                      args.sessions, args.batch_size)
+        report("batched writer", samples, total, args.turns)
+        print(f"{'':<22} {enqueued * 1000:.1f} ms to enqueue, {total * 1000:.1f} ms until on disk, "
+              f"{stats['batches']} batches, {stats['dropped']} dropped")
+
+        inline = make_messages(args.inline_turns)
+        samples, total = run_inline(os.path.join(directory, 'inline.db'), inline, args.sessions)
+        report("commit per turn", samples, total, args.inline_turns)
+
+
+if __name__ == "__main__":
+    main()
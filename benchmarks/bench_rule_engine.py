@@ -0,0 +1,64 @@
+# benchmarks/bench_rule_engine.py
+# Compare the RuleEngine (linear and prefiltered) with the old per-pattern re.search loop
+#
+#   python benchmarks/bench_rule_engine.py
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import DEFAULT_RULES, RuleEngine
+
+QUERIES = {
+    'hit-first': "hello there",
+    'hit-last': "so how about blockchain then",
+    'miss': "explain quantum entanglement in simple terms",
+    'exact': "bye",
+}
+
+
+# The matching loop app.py used before the engine existed
+def legacy_lookup(rules, text):
+    for rule in rules:
+        for pattern in rule['patterns']:
+            if re.search(pattern, text):
+                return pattern
+    return None
+
+
+# Scale the real rule set with unique synthetic rules appended at lowest priority
+def scaled_rules(count):
+    rules = list(DEFAULT_RULES)
+    n = 0
+    while len(rules) < count:
+        rules.append({
+            'id': f'synthetic_{n}',
+            'patterns': [rf'synthetic topic {n}|made up question {n}'],
+            'responses': ["synthetic"],
+        })
+        n += 1
+    return rules
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"{'rules':>6} {'case':<10} {'legacy us':>10} {'linear us':>10} {'filtered us':>12} {'speedup':>8}")
+    for count in (len(DEFAULT_RULES), 500, 2000):
+        rules = scaled_rules(count)
+        linear = RuleEngine(rules, prefilter=False)
+        filtered = RuleEngine(rules)
+        number = max(20, 20000 // count)
+        for case, query in QUERIES.items():
+            legacy = bench(lambda: legacy_lookup(rules, query), number)
+            plain = bench(lambda: linear.lookup(query), number)
+            fast = bench(lambda: filtered.lookup(query), number)
+            print(f"{count:>6} {case:<10} {legacy:>10.2f} {plain:>10.2f} {fast:>12.2f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# benchmarks/bench_semantic_cache.py
+# Lookup latency of the semantic AI cache at different fill levels
+#
+#   python benchmarks/bench_semantic_cache.py
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.semantic_cache import SemanticCache
+
+WORDS = ("quantum computing neural network galaxy recipe python history ocean climate music "
+         "football economy vaccine volcano language planet bitcoin poetry chemistry robot").split()
+
+
+def main():
+    rng = random.Random(3)
+    for size in (1000, 10000, 50000):
+        cache = SemanticCache(capacity=size)
+        for i in range(size):
+            cache.add(f"what about {' '.join(rng.sample(WORDS, 3))} {i}", "answer")
+        queries = [f"explain {' '.join(rng.sample(WORDS, 2))}" for _ in range(200)]
+        start = time.perf_counter()
+        for query in queries:
+            cache.lookup(query)
+        elapsed = (time.perf_counter() - start) / len(queries) * 1000
+        print(f"entries={size:<6} lookup={elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_tone.py
+# Time per classified message: classify_tone vs the old per-branch decoration chain
+#
+#   python benchmarks/bench_tone.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.tone import classify_tone
+
+SENTENCE = "Photosynthesis converts light into chemical energy stored in sugars; "
+
+# Long AI-style answers (~4 KB) whose deciding keyword sits early, late or nowhere
+ANSWERS = {
+    'short': "Quantum computing uses qubits to solve some problems faster.",
+    'long-early': "Hello! " + SENTENCE * 60,
+    'long-late': SENTENCE * 60 + "Great question.",
+    'long-none': SENTENCE * 60,
+}
+
+
+# The chain main() ran for every assistant message on every rerun
+def legacy_decoration(content):
+    emoji_list = ['😊', '👋', '🤖', '💡', '🚀', '📊', '⚠️', '🤔', '👍', '✨', '🙏', '😄']
+    if content and not any(emoji in content[:4] for emoji in emoji_list):
+        if "hello" in content.lower() or "hi" in content.lower():
+            return "👋"
+        elif "thank" in content.lower():
+            return "😊"
+        elif "sorry" in content.lower():
+            return "😔"
+        elif "help" in content.lower() or "assist" in content.lower():
+            return "🤝"
+        elif "created" in content.lower() or "developer" in content.lower():
+            return "👨‍💻"
+        elif "capabilities" in content.lower() or "can you" in content.lower():
+            return "🚀"
+        elif any(word in content.lower() for word in ["data", "weather", "temperature"]):
+            return "📊"
+        elif "error" in content.lower() or "trouble" in content.lower():
+            return "⚠️"
+        elif "?" in content:
+            return "🤔"
+        elif any(word in content.lower() for word in ["yes", "sure", "correct", "right"]):
+            return "👍"
+        elif any(word in content.lower() for word in ["welcome", "please", "glad"]):
+            return "🙏"
+        elif any(word in content.lower() for word in ["joke", "funny", "laugh"]):
+            return "😄"
+        elif any(word in content.lower() for word in ["awesome", "amazing", "excellent", "great"]):
+            return "✨"
+        else:
+            return "💡"
+    return ""
+
+
+def bench(fn, text, number=2000):
+    return min(timeit.repeat(lambda: fn(text), number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"{'answer':<11} {'chars':>6} {'legacy us':>10} {'classify us':>12} {'speedup':>8}")
+    for name, text in ANSWERS.items():
+        assert classify_tone(text) == legacy_decoration(text)
+        legacy = bench(legacy_decoration, text)
+        fast = bench(classify_tone, text)
+        print(f"{name:<11} {len(text):>6} {legacy:>10.2f} {fast:>12.2f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
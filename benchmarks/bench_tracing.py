@@ -0,0 +1,104 @@
+# benchmarks/bench_tracing.py
+# Tracing overhead benchmark: what an unsampled turn, a traced turn and the
+# background export of its spans cost, and so what tracing adds to an
+# average turn at a sample rate
+#
+#   python benchmarks/bench_tracing.py --sample 0.01
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urllib.request
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_turn import CASES, run_case
+from chatbot import DEFAULT_RULES, RuleEngine, tracing
+from chatbot.rules import RuleSnapshot
+from chatbot.server import make_server
+
+
+# Function to time the per-turn work tracing does when a turn isn't sampled
+# (the sampling decision, then one current_span() per instrumented stage)
+def unsampled_ns(stages=3):
+    tracer = tracing.Tracer(tracing.BatchExporter(lambda batch: None), 0.0)
+
+    def turn():
+        span = tracer.start_trace("chat.turn")
+        if not span.recording:
+            for _ in range(stages):
+                tracing.current_span()
+
+    number = 200000
+    return min(timeit.repeat(turn, number=number, repeat=5)) / number * 1e9
+
+
+# Function to time a rule-hit /chat request over loopback (median, in us),
+# the turn a loaded server actually serves
+def http_turn_us(requests=1000):
+    server = make_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/chat"
+    body = json.dumps({"message": CASES['hit']}).encode('utf-8')
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        request = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+        samples.append(time.perf_counter() - start)
+    server.shutdown()
+    return sorted(samples)[len(samples) // 2] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracing overhead benchmark")
+    parser.add_argument('--sample', type=float, default=0.01, help="sample rate to report the average cost for")
+    parser.add_argument('--turns', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5, help="interleaved runs per setting; the best is kept")
+    args = parser.parse_args()
+
+    snapshot = RuleSnapshot(1, RuleEngine(DEFAULT_RULES), None, None)
+    spans = []
+    collector = tracing.BatchExporter(spans.extend, max_queue=10 ** 7)
+    settings = {'off': tracing.Tracer(None), 'traced': tracing.Tracer(collector, 1.0)}
+
+    # In-thread cost of a fully traced turn, and how many spans it makes
+    traced = {}
+    for case in ('hit', 'devanagari_hit', 'miss'):
+        # Unique misses fill the semantic cache, so every lookup gets slower
+        turns = min(args.turns, 2000) if case.endswith('miss') else args.turns
+        best = {}
+        for _ in range(args.rounds):
+            for name, tracer in settings.items():
+                del spans[:]
+                with patch.object(tracing, '_tracer', tracer):
+                    stats = run_case(snapshot, CASES[case], turns, unique=case.endswith('miss'))
+                collector.flush(60)
+                best[name] = min(best.get(name, float('inf')), stats['mean_us'])
+        traced[case] = (best['off'], best['traced'] - best['off'], len(spans) / (turns + turns // 10))
+
+    # CPU the export thread spends per span, writing OTLP JSON to a file
+    with tempfile.TemporaryDirectory() as directory:
+        sink = tracing.FileSink(os.path.join(directory, 'traces.jsonl'))
+        start = time.perf_counter()
+        for i in range(0, len(spans), 512):
+            sink(spans[i:i + 512])
+        export_us = (time.perf_counter() - start) / len(spans) * 1e6
+
+    traced['http_hit'] = (http_turn_us(),) + traced['hit'][1:]
+    unsampled_us = unsampled_ns() / 1000
+    print(f"unsampled turn {unsampled_us * 1000:.0f} ns, export {export_us:.2f} us per span")
+    for case, (turn_us, extra_us, per_turn) in traced.items():
+        average_us = unsampled_us + args.sample * (extra_us + per_turn * export_us)
+        print(f"{case:<15} turn {turn_us:>8.2f} us  traced +{extra_us:>6.2f} us ({per_turn:.0f} spans)"
+              f"  at sample {args.sample:g}: +{average_us:.2f} us a turn ({average_us / turn_us * 100:.2f}%)")
+
+
+if __name__ == "__main__":
+    main()
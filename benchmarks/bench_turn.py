@@ -0,0 +1,204 @@
+# benchmarks/bench_turn.py
+# End-to-end chat turn benchmark (normalize, match, cached/stubbed AI, tone,
+# append to a session MessageStore) across rule set sizes, with JSON output
+# and a baseline regression check
+#
+#   python benchmarks/bench_turn.py                       # run, compare with baseline.json
+#   python benchmarks/bench_turn.py --rules 42,10000      # smaller run
+#   python benchmarks/bench_turn.py --update-baseline     # after an intended change
+#
+# Each case is run --repeats times and its fastest median is kept. Exits
+# with status 1 when any case's median turn time is more than --tolerance
+# plus --slack-us slower than the baseline, and still is when the slow
+# cases are run again. Baselines are machine
+# specific: regenerate them on the machine that runs the check.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rule_engine import scaled_rules
+from chatbot import DEFAULT_RULES, RuleEngine
+from chatbot.cache import ResponseCache
+from chatbot.messages import Message, MessageStore
+from chatbot.pipeline import answer
+from chatbot.rules import RuleSnapshot
+from chatbot.semantic_cache import SemanticCache
+from chatbot.tone import classify_tone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, 'baseline.json')
+
+# ~4 KB of text that no rule matches (rules match substrings, so no "hi" etc.)
+FILLER = "seven purple elephants sang quietly near ancient stone bridges under pale autumn skies " * 50
+
+# Case name -> query. Misses are made unique per turn and their semantic
+# cache never hits, so every turn really reaches the AI.
+CASES = {
+    'hit': "hello there",
+    'miss': "explain quantum entanglement in simple terms",
+    'long_hit': FILLER + "tell me a joke",
+    'long_miss': FILLER,
+    'devanagari_hit': "tell me something in हिन्दी",
+    'devanagari_miss': "भारत की राजधानी क्या है और वहाँ की जनसंख्या कितनी है",
+}
+RULE_COUNTS = (len(DEFAULT_RULES), 10000, 100000)
+
+
+class StubAIClient:
+    # Answers instantly, so AI turns measure only our own overhead
+    def __init__(self):
+        self.calls = 0
+
+    def complete(self, messages, session=None, usage=None):
+        self.calls += 1
+        return "This is a stubbed AI answer."
+
+
+# Function to time `turns` full chat turns for one query; returns stats in microseconds.
+# Messages are kept the way the app keeps them: Message records, with the
+# assistant's tone decoration, in a session MessageStore.
+def run_case(snapshot, query, turns, unique):
+    client = StubAIClient()
+    # "<query> turn <i>" variants are near-duplicates the semantic cache
+    # would answer; a threshold above any similarity still runs its lookup
+    # and add but never hits
+    semantic = SemanticCache(capacity=turns + 100, threshold=1.01 if unique else 0.85)
+    total = turns + turns // 10  # the first tenth is warm-up
+    with patch('chatbot.pipeline.get_response_cache', return_value=ResponseCache()), \
+            patch('chatbot.pipeline.get_semantic_cache', return_value=semantic), \
+            patch('chatbot.pipeline.get_ai_client', return_value=client), \
+            tempfile.TemporaryDirectory() as spill_dir:
+        messages = MessageStore("bench", spill_dir=spill_dir)
+        samples = []
+        for i in range(total):
+            text = f"{query} turn {i}" if unique else query
+            start = time.perf_counter_ns()
+            turn = answer(text, "bench", snapshot)
+            messages.append(Message("user", text))
+            reply = Message("assistant", turn.response, turn.pattern, turn.source, turn.rules_version,
+                            rule_response=turn.source == "rule")
+            reply.decoration = classify_tone(turn.response)
+            messages.append(reply)
+            samples.append(time.perf_counter_ns() - start)
+        samples = sorted(samples[turns // 10:])
+    assert not unique or client.calls == total, f"{client.calls} of {total} miss turns reached the AI"
+    return {
+        'median_us': samples[len(samples) // 2] / 1000,
+        'p95_us': samples[int(len(samples) * 0.95)] / 1000,
+        'mean_us': statistics.fmean(samples) / 1000,
+        'turns': turns,
+        'source': turn.source,
+        'ai_calls': client.calls,
+    }
+
+
+# Function to run every case (or only `cases`) on each rule set size,
+# keeping the fastest median of `repeats` runs
+def run(rule_counts, turns, repeats=1, cases=None):
+    results = {}
+    build_ms = {}
+    for count in rule_counts:
+        rules = scaled_rules(count)
+        start = time.perf_counter()
+        engine = RuleEngine(rules)
+        build_ms[str(count)] = (time.perf_counter() - start) * 1000
+        snapshot = RuleSnapshot(1, engine, None, None)
+        # The fastest of several runs: a busy machine only ever makes a run
+        # slower. Rounds go through every case in turn, so one slow spell
+        # doesn't cover all the runs of a case.
+        best = {}
+        for _ in range(repeats):
+            for case, query in CASES.items():
+                if cases is not None and case not in cases:
+                    continue
+                stats = run_case(snapshot, query, turns, unique=case.endswith('miss'))
+                if case not in best or stats['median_us'] < best[case]['median_us']:
+                    best[case] = stats
+        for case, stats in best.items():
+            results[f"{count}/{case}"] = dict(stats, rules=count, case=case)
+            print(f"{count:>7} {case:<16} {stats['source']:<5} median {stats['median_us']:>9.2f} us"
+                  f"   p95 {stats['p95_us']:>9.2f} us", flush=True)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'build_ms': build_ms,
+        'results': results,
+    }
+
+
+# Function to list cases whose median is more than `tolerance` slower than
+# the baseline. `slack_us` ignores differences too small to be more than
+# noise: a few-microsecond median can double when the scheduler intervenes.
+def regressions(report, baseline, tolerance, slack_us=10.0):
+    slower = []
+    for key, base in baseline['results'].items():
+        current = report['results'].get(key)
+        if current is None:
+            continue
+        limit = base['median_us'] * (1 + tolerance) + slack_us
+        if current['median_us'] > limit:
+            slower.append((key, base['median_us'], current['median_us']))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end chat turn benchmark")
+    parser.add_argument('--rules', default=','.join(map(str, RULE_COUNTS)),
+                        help="comma-separated rule set sizes")
+    parser.add_argument('--turns', type=int, default=2000)
+    parser.add_argument('--repeats', type=int, default=3, help="runs per case; the fastest median is kept")
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed median slowdown before failing, as a fraction")
+    parser.add_argument('--slack-us', type=float, default=10.0,
+                        help="absolute slowdown always allowed on top of --tolerance")
+    args = parser.parse_args()
+
+    report = run([int(n) for n in args.rules.split(',')], args.turns, args.repeats)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    slower = regressions(report, baseline, args.tolerance, args.slack_us)
+    # Only a slowdown that shows up again on a second run is reported
+    if slower:
+        keys = [key for key, _, _ in slower]
+        print(f"Re-running {', '.join(keys)} to confirm", flush=True)
+        counts = sorted({int(key.split('/')[0]) for key in keys})
+        recheck = run(counts, args.turns, args.repeats, cases={key.split('/')[1] for key in keys})
+        for key in keys:
+            current = recheck['results'].get(key)
+            if current and current['median_us'] < report['results'][key]['median_us']:
+                report['results'][key] = current
+        slower = regressions(report, baseline, args.tolerance, args.slack_us)
+    for key, before, after in slower:
+        print(f"REGRESSION {key}: median {before:.2f} us -> {after:.2f} us")
+    if not slower:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%} + {args.slack_us:g} us)")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
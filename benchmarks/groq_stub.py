@@ -0,0 +1,188 @@
+# benchmarks/groq_stub.py
+# Local Groq/OpenAI-compatible chat completions server for offline load tests
+#
+#   python benchmarks/groq_stub.py --port 9000 --latency lognormal:0.4:0.5 --error-rate 0.01
+#   GROQ_BASE_URL=http://127.0.0.1:9000 GROQ_API_KEY=stub streamlit run app.py
+#
+# Serves POST /openai/v1/chat/completions (blocking and streamed as SSE),
+# GET /openai/v1/models for the client pre-warm and GET /stats with call
+# counters. Latency specs: fixed:S, uniform:LO:HI or lognormal:MEDIAN:SIGMA
+# (seconds). Failures are injected as 500s (--error-rate) and 429s
+# (--rate-limit-rate, or every request past --rpm in a minute).
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER_WORDS = ("Here is a short stub answer about {topic}. It has no real content but it is "
+                "shaped like one, with a few sentences and some **bold** text for the renderer.").split()
+
+
+# Function to turn a latency spec into a zero-argument sampler (seconds)
+def parse_latency(spec):
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(':')] if args else []
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"unknown latency spec {spec!r}")
+
+
+class StubState:
+    def __init__(self, latency, token_delay, error_rate, rate_limit_rate, rpm):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self.counters = {'completions': 0, 'streams': 0, 'errors': 0, 'rate_limited': 0, 'models': 0}
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    # Decide this request's injected failure, if any: 429, 500 or None
+    def failure(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if self.rpm and len(self._recent) >= self.rpm:
+                self.counters['rate_limited'] += 1
+                return 429
+            self._recent.append(now)
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.count('rate_limited')
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.count('errors')
+            return 500
+        return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_stub_server
+
+    def do_GET(self):
+        if self.path.endswith('/models'):
+            self.state.count('models')
+            return self._json(200, {"object": "list", "data": [{"id": "llama3-8b-8192", "object": "model"}]})
+        if self.path == '/stats':
+            return self._json(200, self.state.counters)
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if not self.path.endswith('/chat/completions'):
+            return self._json(404, {"error": {"message": "not found"}})
+        stream = bool(body.get('stream'))
+        self.state.count('streams' if stream else 'completions')
+        time.sleep(max(0.0, self.state.latency()))
+
+        status = self.state.failure()
+        if status == 429:
+            return self._json(429, {"error": {"message": "Rate limit reached", "type": "tokens"}},
+                              {"retry-after": "1"})
+        if status == 500:
+            return self._json(500, {"error": {"message": "Injected upstream error"}})
+
+        messages = body.get('messages') or [{}]
+        question = str(messages[-1].get('content', ''))
+        words = ' '.join(ANSWER_WORDS).format(topic=question[:60] or 'nothing').split(' ')
+        usage = {"prompt_tokens": sum(len(str(m.get('content', ''))) // 4 for m in messages),
+                 "completion_tokens": len(words)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"stub-{random.getrandbits(48):x}", "created": int(time.time()),
+                "model": body.get('model', 'stub')}
+        if not stream:
+            return self._json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": ' '.join(words)},
+            }]))
+
+        # Server-sent events over chunked transfer encoding, so keep-alive survives
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else ' ' + word}
+            self._event(dict(base, object="chat.completion.chunk",
+                             choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+            if self.state.token_delay:
+                time.sleep(self.state.token_delay)
+        self._event(dict(base, object="chat.completion.chunk", x_groq={"id": base["id"], "usage": usage},
+                         choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _event(self, payload):
+        self._chunk(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+# Function to create a stub server; port 0 picks a free port
+def make_stub_server(port=0, latency='fixed:0.2', token_delay=0.0, error_rate=0.0, rate_limit_rate=0.0, rpm=0):
+    state = StubState(parse_latency(latency), token_delay, error_rate, rate_limit_rate, rpm)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    return StubServer(('127.0.0.1', port), handler)
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', default=os.getenv('STUB_LATENCY', 'lognormal:0.3:0.4'),
+                        help="fixed:S, uniform:LO:HI or lognormal:MEDIAN:SIGMA (seconds)")
+    parser.add_argument('--token-delay', type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument('--rpm', type=int, default=0, help="answer 429 past this many requests a minute")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Groq-compatible stub server")
+    parser.add_argument('--port', type=int, default=9000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = make_stub_server(args.port, args.latency, args.token_delay, args.error_rate,
+                              args.rate_limit_rate, args.rpm)
+    print(f"Groq stub listening on http://127.0.0.1:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
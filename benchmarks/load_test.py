@@ -0,0 +1,185 @@
+# benchmarks/load_test.py
+# Drive concurrent simulated users through the chat turn pipeline against a
+# local Groq stub, then report throughput, latency percentiles and upstream calls
+#
+#   python benchmarks/load_test.py --users 50 --turns 20
+#   python benchmarks/load_test.py --users 20 --stream --latency uniform:0.2:0.8 --rate-limit-rate 0.05
+#   python benchmarks/load_test.py --base-url http://127.0.0.1:9000   # an already running stub
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from groq_stub import add_arguments
+
+RULE_QUERIES = ["hello", "who are you", "tell me a joke", "thanks", "what can you do", "bye"]
+POPULAR_QUESTIONS = ["what is a black hole", "how do vaccines work", "explain photosynthesis",
+                     "what causes inflation", "how does gps work"]
+TOPICS = ("volcanoes quantum tea jazz glaciers bridges bees compilers tides origami chess coral "
+          "satellites bread typhoons dna lighthouses").split()
+
+
+# Function to start the stub in its own process (so it doesn't share our GIL)
+def start_stub(args):
+    command = [sys.executable, os.path.join(HERE, 'groq_stub.py'), '--port', '0',
+               '--latency', args.latency, '--token-delay', str(args.token_delay),
+               '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate),
+               '--rpm', str(args.rpm)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip().rsplit(' ', 1)[-1]
+    return process, url
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+# Function to pick one user message from the configured mix
+def next_query(rng, args):
+    roll = rng.random()
+    if roll < args.hit_ratio:
+        return rng.choice(RULE_QUERIES)
+    if roll < args.hit_ratio + args.repeat_ratio:
+        return rng.choice(POPULAR_QUESTIONS)
+    return f"tell me about {rng.choice(TOPICS)} and {rng.choice(TOPICS)} number {rng.getrandbits(32)}"
+
+
+# Function to run one streamed turn the way the app does; returns (source,
+# time to first token), the latter only for answers streamed from upstream
+def stream_turn(message, session, snapshot):
+    from chatbot.ai import build_messages, get_ai_client
+    from chatbot.pipeline import lookup_ai_cache, match_rule, store_ai_response
+    from chatbot.scheduler import BusyError
+
+    start = time.perf_counter()
+    if match_rule(message, snapshot) is not None:
+        return "rule", None
+    cached, _ = lookup_ai_cache(message)
+    if cached is not None:
+        return "ai", None
+    ttft = None
+    parts = []
+    try:
+        for delta in get_ai_client().stream(build_messages(message), session=session):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(delta)
+    except BusyError:
+        return "busy", None
+    except Exception:
+        return "error", None
+    store_ai_response(message, "".join(parts))
+    return "ai", ttft
+
+
+def user(index, args, snapshot, samples, lock):
+    from chatbot.pipeline import answer
+
+    rng = random.Random(args.seed * 1000 + index)
+    session = f"user-{index}"
+    for _ in range(args.turns):
+        message = next_query(rng, args)
+        start = time.perf_counter()
+        if args.stream:
+            source, ttft = stream_turn(message, session, snapshot)
+        else:
+            source, ttft = answer(message, session, snapshot).source, None
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.append((source, elapsed, ttft))
+        if args.think_time:
+            time.sleep(rng.uniform(0, 2 * args.think_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat pipeline load generator")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--turns', type=int, default=20, help="turns per user")
+    parser.add_argument('--think-time', type=float, default=0.0, help="mean seconds between a user's turns")
+    parser.add_argument('--hit-ratio', type=float, default=0.3, help="share of rule-matched messages")
+    parser.add_argument('--repeat-ratio', type=float, default=0.3, help="share of popular repeated questions")
+    parser.add_argument('--stream', action='store_true', help="stream AI answers like the app does")
+    parser.add_argument('--base-url', help="use this Groq-compatible server instead of starting the stub")
+    parser.add_argument('--scheduler-rpm', type=int, default=0,
+                        help="CHATBOT_AI_RPM for our own scheduler (0 disables it)")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help="also write the report as JSON here")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    stub = None
+    base_url = args.base_url
+    if base_url is None:
+        stub, base_url = start_stub(args)
+    os.environ['GROQ_BASE_URL'] = base_url
+    os.environ.setdefault('GROQ_API_KEY', 'stub')
+    os.environ['CHATBOT_AI_RPM'] = str(args.scheduler_rpm)
+
+    from chatbot.ai import get_ai_client
+    from chatbot.rules import get_rule_store
+
+    try:
+        get_ai_client()
+        snapshot = get_rule_store().snapshot()
+        samples = []
+        lock = threading.Lock()
+        threads = [threading.Thread(target=user, args=(i, args, snapshot, samples, lock))
+                   for i in range(args.users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        with urllib.request.urlopen(base_url + '/stats') as response:
+            upstream = json.load(response)
+    finally:
+        if stub is not None:
+            stub.terminate()
+
+    by_source = defaultdict(list)
+    for source, elapsed, _ in samples:
+        by_source[source].append(elapsed)
+    latencies = sorted(elapsed for _, elapsed, _ in samples)
+    ttfts = sorted(ttft for _, _, ttft in samples if ttft is not None)
+    client = get_ai_client().stats()
+    report = {
+        'users': args.users,
+        'turns': len(samples),
+        'wall_seconds': wall,
+        'turns_per_second': len(samples) / wall,
+        'latency_ms': {f'p{int(q * 100)}': percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99)},
+        'by_source': {source: {'count': len(values),
+                               'p50_ms': percentile(sorted(values), 0.5) * 1000,
+                               'p99_ms': percentile(sorted(values), 0.99) * 1000}
+                      for source, values in sorted(by_source.items())},
+        'ttft_ms': {f'p{int(q * 100)}': percentile(ttfts, q) * 1000 for q in (0.5, 0.95, 0.99)} if ttfts else None,
+        'upstream': upstream,
+        'client': {key: client[key] for key in ('requests', 'upstream_calls', 'coalesced', 'retries',
+                                                'failures', 'short_circuits', 'breaker_state')},
+    }
+
+    print(f"{report['turns']} turns by {args.users} users in {wall:.2f}s: {report['turns_per_second']:.1f} turns/s")
+    print("latency  " + "  ".join(f"{k} {v:.1f} ms" for k, v in report['latency_ms'].items()))
+    if report['ttft_ms']:
+        print("ttft     " + "  ".join(f"{k} {v:.1f} ms" for k, v in report['ttft_ms'].items()))
+    for source, stats in report['by_source'].items():
+        print(f"  {source:<6} {stats['count']:>6} turns  p50 {stats['p50_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms")
+    print(f"upstream {upstream}")
+    print(f"client   {report['client']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# chatbot/__init__.py
+# Streamlit-free chatbot core: rules, normalization and matching
+from chatbot.batch import MatchResult, match_many
+from chatbot.engine import FuzzyMatch, RuleEngine, RuleMatch
+from chatbot.rules import (
+    DEFAULT_RULES, RuleSnapshot, RuleStore, get_engine, get_rule_store, load_rules, normalize_input,
+)
@@ -0,0 +1,316 @@
+# chatbot/ai.py
+# Async Groq layer on a dedicated event loop thread, shared by all sessions.
+# groq and httpx are imported when the client starts, not with this module.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+
+from chatbot.resilience import ResiliencePolicy
+from chatbot.scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+# Groq request settings shared by the blocking and streaming calls
+SYSTEM_PROMPT = "You are a helpful, friendly assistant created by Nandesh Kalashetti. Keep your answers very concise, informative and engaging. Use emojis when appropriate but don't overdo it. Format important information with bold when needed. Be conversational yet efficient. Keep responses under 100 words when possible."
+AI_MODEL = "llama3-8b-8192"  # Efficient model
+AI_PARAMS = {
+    "max_tokens": 500,  # Reduced for faster responses
+    "temperature": 0.7,  # Good creativity balance
+    "top_p": 0.95,  # Better quality without sacrificing speed
+}
+AI_TIMEOUT = 10  # Seconds; the latency budget for one AI request, retries included
+
+
+# Function to build the chat messages for a query, after any prior turns
+# (see chatbot.context)
+def build_messages(query, history=None):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *(history or ()),
+        {"role": "user", "content": query},
+    ]
+
+
+# Function to estimate the prompt tokens of a message list: ~4 UTF-8 bytes a
+# token, so scripts like Devanagari (3 bytes a character) aren't undercounted
+def estimate_tokens(messages):
+    return sum(len(message["content"].encode('utf-8')) // 4 + 4 for message in messages)
+
+
+# Function to read the total tokens Groq reports on a completion or on the
+# final stream chunk (where it arrives under x_groq); None if absent
+def usage_tokens(response):
+    usage = getattr(response, 'usage', None) or getattr(getattr(response, 'x_groq', None), 'usage', None)
+    total = getattr(usage, 'total_tokens', None)
+    return total if isinstance(total, int) else None
+
+
+class _Broadcast:
+    # One upstream stream fanned out to every caller asking the same thing.
+    # Late joiners replay the chunks received so far, then follow live.
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.used = None  # total tokens reported on the last chunk
+        self.changed = asyncio.Condition()
+
+    async def publish(self, chunk=None, done=False, error=None):
+        async with self.changed:
+            if chunk is not None:
+                self.chunks.append(chunk)
+            self.done = self.done or done
+            self.error = self.error or error
+            self.changed.notify_all()
+
+    async def follow(self):
+        index = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                chunks = self.chunks[index:]
+                done, error = self.done, self.error
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if done and index == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class AIClient:
+    # Groq client running on its own asyncio loop thread. Script threads
+    # call the blocking complete()/stream() wrappers, which hand work to the
+    # loop instead of holding a socket each. Requests go over one pooled,
+    # kept-alive httpx connection pool that is pre-warmed on start().
+    # Identical requests already in flight are coalesced (single-flight):
+    # N concurrent askers share one upstream call and its result or stream.
+    # Upstream calls go through a ResiliencePolicy (retries, breaker, hedging)
+    # bounded by `timeout` as the per-request latency budget. With a
+    # `scheduler`, every upstream attempt is first admitted by it (rate
+    # limits, fair per-session queuing, load shedding).
+    def __init__(self, api_key=None, base_url=None, model=AI_MODEL, params=None,
+                 timeout=AI_TIMEOUT, max_connections=32, prewarm=True, policy=None, scheduler=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.params = dict(AI_PARAMS if params is None else params)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.prewarm = prewarm
+        self.policy = policy or ResiliencePolicy(budget=timeout)
+        self.scheduler = scheduler
+        self._loop = None
+        self._client = None
+        self._inflight = {}  # key -> Future or _Broadcast; touched only on the loop thread
+        self._started = threading.Lock()
+        self._counters = {'requests': 0, 'upstream_calls': 0, 'coalesced': 0}
+
+    def start(self):
+        with self._started:
+            if self._loop is not None:
+                return self
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ai-event-loop", daemon=True).start()
+            self._loop = loop
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+        return self
+
+    async def _open(self):
+        import httpx
+        from groq import AsyncGroq
+
+        http_client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=120,
+            ),
+        )
+        # Retries are handled by self.policy, not the SDK
+        self._client = AsyncGroq(api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                                 timeout=self.timeout, http_client=http_client)
+        if self.prewarm:
+            asyncio.ensure_future(self._prewarm())
+
+    # Open a connection (TCP + TLS) ahead of the first user request
+    async def _prewarm(self):
+        try:
+            await self._client.models.list()
+        except Exception as e:
+            logger.info("AI connection pre-warm failed: %s", e)
+
+    # The single place a request reaches Groq
+    async def _create(self, messages, stream):
+        self._counters['upstream_calls'] += 1
+        return await self._client.chat.completions.create(
+            messages=messages, model=self.model, stream=stream, **self.params
+        )
+
+    # One upstream attempt, admitted by the scheduler when there is one. The
+    # reservation is prompt estimate + max_tokens; completions settle it
+    # with the reported usage here, streams once their last chunk arrives.
+    async def _admitted(self, messages, stream, session):
+        if self.scheduler is None:
+            return await self._create(messages, stream=stream)
+        import groq
+
+        reserved = self._reservation(messages)
+        await self.scheduler.acquire(session, reserved)
+        try:
+            result = await self._create(messages, stream=stream)
+        except groq.RateLimitError:
+            self.scheduler.on_rate_limited()
+            raise
+        if not stream:
+            self.scheduler.record_usage(reserved, usage_tokens(result))
+        return result
+
+    def _reservation(self, messages):
+        return estimate_tokens(messages) + self.params.get("max_tokens", 0)
+
+    # An upstream call with retries, breaker and (non-streaming) hedging
+    async def _call(self, messages, stream, session=None):
+        return await self.policy.call(lambda: self._admitted(messages, stream, session), hedgeable=not stream)
+
+    def _key(self, messages, stream):
+        payload = json.dumps([messages, self.model, self.params, stream], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def _complete(self, messages, session=None, usage=None):
+        self._counters['requests'] += 1
+        key = self._key(messages, False)
+        future = self._inflight.get(key)
+        if future is not None:
+            self._counters['coalesced'] += 1
+            content, used = await asyncio.shield(future)
+            if usage is not None:
+                usage.update(total_tokens=used, coalesced=True)
+            return content
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            completion = await self._call(messages, stream=False, session=session)
+            future.set_result((completion.choices[0].message.content, usage_tokens(completion)))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            del self._inflight[key]
+        # Awaiting our own future re-raises any error for this caller too
+        content, used = await future
+        if usage is not None:
+            usage.update(total_tokens=used, coalesced=False)
+        return content
+
+    async def _stream(self, messages, session=None, usage=None):
+        self._counters['requests'] += 1
+        key = self._key(messages, True)
+        broadcast = self._inflight.get(key)
+        coalesced = broadcast is not None
+        if coalesced:
+            self._counters['coalesced'] += 1
+        else:
+            broadcast = self._inflight[key] = _Broadcast()
+            asyncio.ensure_future(self._pump(key, broadcast, messages, session))
+        async for chunk in broadcast.follow():
+            yield chunk
+        if usage is not None:
+            usage.update(total_tokens=broadcast.used, coalesced=coalesced)
+
+    async def _pump(self, key, broadcast, messages, session):
+        try:
+            used = None
+            async for chunk in await self._call(messages, stream=True, session=session):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    await broadcast.publish(chunk.choices[0].delta.content)
+                used = usage_tokens(chunk) or used
+            broadcast.used = used
+            if self.scheduler is not None:
+                self.scheduler.record_usage(self._reservation(messages), used)
+            await broadcast.publish(done=True)
+        except Exception as e:
+            await broadcast.publish(done=True, error=e)
+        finally:
+            del self._inflight[key]
+
+    # Function to get a complete answer; blocks the calling thread only.
+    # `session` identifies the asker for fair queuing. A `usage` dict is
+    # filled with the reported total_tokens and whether the call was coalesced.
+    def complete(self, messages, session=None, usage=None):
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, session, usage), self._loop)
+        return future.result(self.timeout + 1)
+
+    # Function to stream an answer, yielding text deltas as they arrive;
+    # `usage` is filled as in complete() once the stream ends
+    def stream(self, messages, session=None, usage=None):
+        self.start()
+        deltas = queue.Queue()
+
+        async def pump():
+            try:
+                async for delta in self._stream(messages, session, usage):
+                    deltas.put((True, delta))
+                deltas.put((False, None))
+            except Exception as e:
+                deltas.put((False, e))
+
+        asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        while True:
+            try:
+                more, value = deltas.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No AI response data for {self.timeout}s")
+            if not more:
+                if value is not None:
+                    raise value
+                return
+            yield value
+
+    def stats(self):
+        stats = dict(self._counters, inflight=len(self._inflight), **self.policy.stats())
+        if self.scheduler is not None:
+            stats.update(self.scheduler.stats())
+        return stats
+
+
+_ai_client = None
+_ai_client_lock = threading.Lock()
+
+
+# Function to get the process-wide AI client, started (and pre-warmed) on first use.
+# CHATBOT_AI_RETRIES, CHATBOT_AI_BUDGET (seconds) and CHATBOT_AI_HEDGE=1 tune
+# the resilience policy; CHATBOT_AI_RPM, CHATBOT_AI_TPM and
+# CHATBOT_AI_MAX_WAIT (seconds) the scheduler, which CHATBOT_AI_RPM=0 disables.
+# The RPM and TPM limits are for the whole deployment: each process gets
+# its share of them, split over the CHATBOT_AI_WORKERS processes that
+# call Groq with the same key (the HTTP API sets it to its --workers).
+def get_ai_client():
+    global _ai_client
+    if _ai_client is None:
+        with _ai_client_lock:
+            if _ai_client is None:
+                policy = ResiliencePolicy(
+                    max_retries=int(os.getenv("CHATBOT_AI_RETRIES", 2)),
+                    budget=float(os.getenv("CHATBOT_AI_BUDGET", AI_TIMEOUT)),
+                    hedge=os.getenv("CHATBOT_AI_HEDGE", "0") == "1",
+                )
+                scheduler = None
+                workers = max(1, int(os.getenv("CHATBOT_AI_WORKERS", 1)))
+                if int(os.getenv("CHATBOT_AI_RPM", 30)) > 0:
+                    scheduler = FairScheduler(
+                        requests_per_minute=int(os.getenv("CHATBOT_AI_RPM", 30)) / workers,
+                        tokens_per_minute=int(os.getenv("CHATBOT_AI_TPM", 30000)) / workers,
+                        max_wait=float(os.getenv("CHATBOT_AI_MAX_WAIT", 5)),
+                    )
+                _ai_client = AIClient(api_key=os.getenv("GROQ_API_KEY"),
+                                      base_url=os.getenv("GROQ_BASE_URL") or None,
+                                      timeout=policy.budget, policy=policy, scheduler=scheduler).start()
+    return _ai_client
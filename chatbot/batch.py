@@ -0,0 +1,73 @@
+# chatbot/batch.py
+# Offline rule matching for large query corpora (no Streamlit, no AI calls)
+import os
+from collections import deque, namedtuple
+from itertools import chain, islice
+
+from chatbot.engine import RuleEngine
+from chatbot.rules import get_engine, normalize_input
+
+# Match metadata for one query; rule_id and pattern are None on a miss
+MatchResult = namedtuple('MatchResult', ['query', 'rule_id', 'pattern'])
+
+_worker_engine = None
+
+
+def _init_worker(rules):
+    global _worker_engine
+    _worker_engine = RuleEngine(rules)
+
+
+# Match one chunk; returns entry positions (-1 for a miss) so only ints
+# travel back to the parent process
+def _match_chunk(queries, engine=None):
+    lookup = (engine or _worker_engine).lookup
+    return [entry.position if entry else -1 for entry in map(lookup, map(normalize_input, queries))]
+
+
+def _results(engine, queries, positions):
+    entries = engine.entries
+    for query, position in zip(queries, positions):
+        if position < 0:
+            yield MatchResult(query, None, None)
+        else:
+            entry = entries[position]
+            yield MatchResult(query, entry.rule_id, entry.pattern)
+
+
+def _chunks(iterator, size):
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Function to match an iterable of raw queries, streaming MatchResults in
+# input order. Small inputs (fewer than min_parallel queries) are matched
+# in-process; larger ones are spread over a process pool with a bounded
+# number of chunks in flight, so memory stays flat for any corpus size.
+def match_many(queries, engine=None, workers=None, chunk_size=5000, min_parallel=50000):
+    engine = engine or get_engine()
+    workers = workers or os.cpu_count() or 1
+    iterator = iter(queries)
+    head = list(islice(iterator, min_parallel))
+
+    if workers == 1 or len(head) < min_parallel:
+        for chunk in _chunks(chain(head, iterator), chunk_size):
+            yield from _results(engine, chunk, _match_chunk(chunk, engine))
+        return
+
+    # Only paid for by callers that actually go parallel
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine.rules,)) as pool:
+        pending = deque()
+        for chunk in _chunks(chain(head, iterator), chunk_size):
+            pending.append((chunk, pool.submit(_match_chunk, chunk)))
+            if len(pending) >= workers * 2:
+                chunk, future = pending.popleft()
+                yield from _results(engine, chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            yield from _results(engine, chunk, future.result())
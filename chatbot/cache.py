@@ -0,0 +1,136 @@
+# chatbot/cache.py
+# Process-wide AI response cache: LRU + TTL in memory, optional SQLite tier
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Function to build a cache key from everything that shapes an AI answer
+def make_cache_key(query, model, system_prompt, params):
+    payload = json.dumps([query, model, system_prompt, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    # Thread-safe LRU cache bounded by entry count and total bytes, with a
+    # per-entry TTL. With `path` set, entries are also written to SQLite and
+    # read back on a memory miss, so they survive restarts. Disk I/O uses its
+    # own lock so memory hits never wait on it.
+    def __init__(self, max_entries=5000, max_bytes=32 * 1024 * 1024, ttl=3600, path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'disk_hits': 0}
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM ai_cache WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if item[1] > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return item[0]
+                self._remove(key)
+                self._counters['expirations'] += 1
+
+        row = self._read_disk(key, now)
+        with self._lock:
+            if row is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._counters['disk_hits'] += 1
+            self._store(key, row[0], row[1])
+        return row[0]
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO ai_cache VALUES (?, ?, ?)", (key, value, expires_at))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM ai_cache")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), bytes=self._bytes)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _read_disk(self, key, now):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM ai_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return row
+
+    # Callers hold self._lock
+    def _store(self, key, value, expires_at):
+        size = len(key) + len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters['evictions'] += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Function to get the process-wide AI response cache, configured from the
+# environment: CHATBOT_AI_CACHE_ENTRIES, CHATBOT_AI_CACHE_BYTES,
+# CHATBOT_AI_CACHE_TTL (seconds) and CHATBOT_AI_CACHE_PATH (SQLite file)
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=int(os.getenv('CHATBOT_AI_CACHE_ENTRIES', 5000)),
+                    max_bytes=int(os.getenv('CHATBOT_AI_CACHE_BYTES', 32 * 1024 * 1024)),
+                    ttl=float(os.getenv('CHATBOT_AI_CACHE_TTL', 3600)),
+                    path=os.getenv('CHATBOT_AI_CACHE_PATH') or None,
+                )
+    return _cache
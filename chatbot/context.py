@@ -0,0 +1,97 @@
+# chatbot/context.py
+# Prior turns for the AI fallback under a prompt token budget, with older
+# turns folded into a rolling extractive summary
+import os
+import re
+from collections import deque
+
+from chatbot.ai import estimate_tokens
+
+# Replies that carry no conversation content
+SKIPPED_SOURCES = frozenset(("busy", "error"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s")
+
+
+# Function to shorten a message to its first sentence, at most `limit` chars
+def first_sentence(text, limit):
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END.split(text, 1)[0]
+    if len(sentence) > limit:
+        sentence = sentence[:limit - 3].rstrip() + "..."
+    return sentence
+
+
+class ConversationContext:
+    # One session's prompt context. build() picks the newest turns that fit
+    # in `budget` tokens (at most `max_turns` of them) and keeps a summary
+    # of everything before them: one line per folded message, newest last,
+    # trimmed from the oldest end to `summary_tokens`. The summary only
+    # moves forward: each call folds just the messages that have left the
+    # window since the last call, so its cost doesn't grow with the
+    # conversation and the prompt stays under budget + summary_tokens.
+    def __init__(self, budget=1500, summary_tokens=300, max_turns=20, line_chars=160):
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.max_turns = max_turns
+        self.line_chars = line_chars
+        self.covered = 0  # messages before this index are in the summary
+        self._lines = deque()
+        self._summary_size = 0
+
+    # Prompt messages for the turns in history[:end] (a list of Message or a
+    # MessageStore): the summary as a system message, then recent turns
+    def build(self, history, end=None):
+        end = len(history) if end is None else end
+        first = max(self.covered, end - self.max_turns)
+        recent = []
+        used = 0
+        start = end
+        candidates = history[first:end] if first < end else []
+        for offset in range(len(candidates) - 1, -1, -1):
+            message = candidates[offset]
+            if message.source in SKIPPED_SOURCES:
+                start = first + offset
+                continue
+            turn = {"role": message.role, "content": message.content}
+            tokens = estimate_tokens([turn])
+            if used + tokens > self.budget:
+                break
+            recent.append(turn)
+            used += tokens
+            start = first + offset
+        recent.reverse()
+
+        # Fold whatever left the window since the last call, a page at a time
+        while self.covered < start:
+            stop = min(start, self.covered + 200)
+            for message in history[self.covered:stop]:
+                self._fold(message)
+            self.covered = stop
+
+        summary = self.summary()
+        if summary:
+            return [{"role": "system", "content": summary}] + recent
+        return recent
+
+    def _fold(self, message):
+        if message.source in SKIPPED_SOURCES or not message.content.strip():
+            return
+        speaker = "User" if message.role == "user" else "Assistant"
+        line = f"{speaker}: {first_sentence(message.content, self.line_chars)}"
+        self._lines.append(line)
+        self._summary_size += estimate_tokens([{"content": line}])
+        while self._summary_size > self.summary_tokens and self._lines:
+            self._summary_size -= estimate_tokens([{"content": self._lines.popleft()}])
+
+    def summary(self):
+        if not self._lines:
+            return ""
+        return "Summary of the earlier conversation:\n" + "\n".join(self._lines)
+
+
+# Function to build a session context with the CHATBOT_CONTEXT_* limits
+def new_conversation_context():
+    return ConversationContext(budget=int(os.getenv('CHATBOT_CONTEXT_TOKENS', 1500)),
+                               summary_tokens=int(os.getenv('CHATBOT_CONTEXT_SUMMARY_TOKENS', 300)),
+                               max_turns=int(os.getenv('CHATBOT_CONTEXT_TURNS', 20)))
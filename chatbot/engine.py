@@ -0,0 +1,184 @@
+# chatbot/engine.py
+# Precompiled rule engine shared by every session in the process
+import logging
+import re
+import random
+import threading
+from collections import namedtuple
+
+from chatbot.fuzzy import DEFAULT_FUZZY_THRESHOLD, FUZZY_MAX_CHARS, FuzzyIndex, match_confidence
+from chatbot.metrics import FUZZY_LOOKUPS, RULE_TIMEOUTS
+from chatbot.prefilter import RulePrefilter, extract_literals
+from chatbot.redos import DEFAULT_MATCH_TIMEOUT, analyze_pattern, compile_search
+
+logger = logging.getLogger(__name__)
+
+# Result of a successful rule match
+RuleMatch = namedtuple('RuleMatch', ['rule_id', 'pattern', 'response'])
+
+# Result of a match after typo correction: the corrected text it matched
+# and the share of the matched text that needed no edits
+FuzzyMatch = namedtuple('FuzzyMatch', ['rule_id', 'pattern', 'response', 'corrected', 'confidence'])
+
+# One compiled pattern; entries are kept in match-priority order
+RuleEntry = namedtuple('RuleEntry', ['position', 'rule_index', 'rule_id', 'pattern', 'search'])
+
+# Per-pattern compile results, reusable across engine rebuilds. `problem`
+# is why the pattern is disabled (search is then None), or None.
+CompiledPattern = namedtuple('CompiledPattern', ['search', 'literals', 'problem'])
+
+_MISSING = object()
+
+
+# Search function of a disabled pattern
+def _never(text):
+    return None
+
+
+class RuleEngine:
+    # Compile the whole rule set once. Rule order is match priority: the
+    # first rule (and within it the first pattern) that matches wins.
+    # With prefilter=True only patterns whose required literals occur in
+    # the input are run, and inputs equal to a rule literal ("hi", "bye")
+    # are answered from a memo dict. Passing the previous engine as
+    # `previous` reuses its compiled patterns for an incremental rebuild.
+    #
+    # Patterns that can backtrack catastrophically never run: the ones the
+    # static analysis flags are disabled at build time, and patterns with
+    # quantifiers get `match_timeout` seconds per search, after which they
+    # are disabled too. Disabled patterns are listed in `disabled`
+    # ({pattern: (rule id, problem)}) and never match.
+    #
+    # fuzzy_match() retries a miss with typos corrected against the words
+    # of the patterns' literals; matches whose confidence is below
+    # `fuzzy_threshold` are dropped (0 turns it off).
+    def __init__(self, rules, prefilter=True, previous=None, match_timeout=DEFAULT_MATCH_TIMEOUT,
+                 fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD):
+        self.rules = tuple(rules)
+        self.match_timeout = match_timeout
+        self.fuzzy_threshold = fuzzy_threshold
+        reusable = previous._compiled if previous is not None and previous.match_timeout == match_timeout else {}
+        self._compiled = {}
+        self.disabled = {}
+        self._disable_lock = threading.Lock()
+        entries = []
+        for index, rule in enumerate(self.rules):
+            rule_id = rule.get('id', index)
+            for pattern in rule['patterns']:
+                compiled = self._compiled.get(pattern) or reusable.get(pattern)
+                if compiled is None:
+                    compiled = self._compile(pattern, rule_id, match_timeout)
+                    if compiled.problem:
+                        logger.warning("Rule %r: disabled pattern %r (%s)", rule_id, pattern, compiled.problem)
+                self._compiled[pattern] = compiled
+                if compiled.problem:
+                    self.disabled.setdefault(pattern, (rule_id, compiled.problem))
+                # Keep the bound method so a lookup never goes through re's cache
+                entries.append(RuleEntry(len(entries), index, rule_id, pattern, compiled.search or _never))
+        # A list only so a pattern that times out can be switched off in place
+        self.entries = entries
+
+        self.prefilter = None
+        self._exact = {}
+        self._exact_keys = frozenset()
+        if prefilter:
+            literals = [self._compiled[entry.pattern].literals if entry.search is not _never else frozenset()
+                        for entry in self.entries]
+            self.prefilter = RulePrefilter(literals)
+            self._exact_keys = frozenset(
+                literal.strip() for group in literals for literal in group or () if literal.strip()
+            )
+
+        self.fuzzy = None
+        if fuzzy_threshold:
+            self.fuzzy = FuzzyIndex(literal for entry in self.entries if entry.search is not _never
+                                    for literal in self._compiled[entry.pattern].literals or ())
+
+    @staticmethod
+    def _compile(pattern, rule_id, match_timeout=DEFAULT_MATCH_TIMEOUT):
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern {pattern!r} in rule {rule_id!r}: {e}")
+        problems = analyze_pattern(pattern)
+        if problems:
+            return CompiledPattern(None, None, "; ".join(problems))
+        return CompiledPattern(compile_search(pattern, match_timeout), extract_literals(pattern), None)
+
+    # Switch off a pattern that ran out of time, for this engine and any
+    # rebuilt from it, so it can't stall another request
+    def _timed_out(self, entry):
+        problem = f"timed out after {self.match_timeout}s"
+        with self._disable_lock:
+            if self.entries[entry.position].search is _never:
+                return
+            self.entries[entry.position] = entry._replace(search=_never)
+            self.disabled.setdefault(entry.pattern, (entry.rule_id, problem))
+            self._compiled[entry.pattern] = CompiledPattern(None, None, problem)
+            self._exact.clear()
+        RULE_TIMEOUTS.inc(entry.rule_id, entry.pattern)
+        logger.warning("Rule %r: disabled pattern %r (%s)", entry.rule_id, entry.pattern, problem)
+
+    def _lookup_filtered(self, text):
+        entries = self.entries
+        for position in self.prefilter.candidates(text):
+            entry = entries[position]
+            try:
+                if entry.search(text):
+                    return entry
+            except TimeoutError:
+                self._timed_out(entry)
+        return None
+
+    # Return the RuleEntry of the first matching pattern, or None
+    def lookup(self, text):
+        if self.prefilter is not None:
+            entry = self._exact.get(text, _MISSING)
+            if entry is not _MISSING:
+                return entry
+            entry = self._lookup_filtered(text)
+            if text in self._exact_keys:
+                self._exact[text] = entry
+            return entry
+        for entry in self.entries:
+            try:
+                if entry.search(text):
+                    return entry
+            except TimeoutError:
+                self._timed_out(entry)
+        return None
+
+    # Match normalized input and pick one of the rule's responses
+    def match(self, text):
+        entry = self.lookup(text)
+        if entry is None:
+            return None
+        return RuleMatch(entry.rule_id, entry.pattern, random.choice(self.rules[entry.rule_index]['responses']))
+
+    # Match text that no pattern matched after correcting its typos. Returns
+    # a FuzzyMatch, or None when nothing was corrected, the corrected text
+    # matches nothing either, or the match is below fuzzy_threshold.
+    def fuzzy_match(self, text):
+        if self.fuzzy is None or len(text) > FUZZY_MAX_CHARS:
+            return None
+        corrected = self.fuzzy.correct(text)
+        found = None
+        if corrected is not None:
+            text, corrections = corrected
+            entry = self.lookup(text)
+            if entry is not None:
+                try:
+                    found = entry.search(text)
+                except TimeoutError:
+                    self._timed_out(entry)
+        if found is None:
+            FUZZY_LOOKUPS.inc("miss")
+            return None
+        confidence = match_confidence(found.span(), corrections)
+        if confidence < self.fuzzy_threshold:
+            FUZZY_LOOKUPS.inc("rejected")
+            return None
+        FUZZY_LOOKUPS.inc("hit")
+        response = random.choice(self.rules[entry.rule_index]['responses'])
+        return FuzzyMatch(entry.rule_id, entry.pattern, response, text, confidence)
+
@@ -0,0 +1,151 @@
+# chatbot/fuzzy.py
+# Typo tolerance for rule matching: a SymSpell-style deletion index over
+# the words of rule keywords, used to correct misspelled input words
+import re
+
+# Share of each corrected word in a match that must have needed no edits
+# (0 turns the fuzzy tier off). One edit in a four-letter word passes, one
+# in a three-letter word doesn't.
+DEFAULT_FUZZY_THRESHOLD = 0.75
+# Longer inputs are real questions for the AI, not typos of a rule
+FUZZY_MAX_CHARS = 200
+# Corrections remembered per index before the memo starts over
+MAX_MEMO = 20000
+# Only deletions of a word's first characters are indexed, as in SymSpell:
+# long words then cost as little to index and look up as short ones, and
+# candidates are checked against the whole word anyway
+PREFIX_LENGTH = 7
+
+# Words are runs of anything but whitespace and common punctuation, so
+# Devanagari words with vowel signs stay whole
+_WORD = re.compile(r'''[^\s.,!?;:'"()\[\]{}<>]+''')
+
+
+# Function to get how many edits a word of `length` characters may be
+# corrected by: none for 1-2 characters, one for 3-7, two from 8. Two edits
+# turn too many short real words into keywords (cooking -> coding).
+def allowed_edits(length, max_edits=2):
+    return min(max_edits, 0 if length < 3 else 1 if length < 8 else 2)
+
+
+# Function to get every string `depth` or fewer deletions away from word
+def deletes(word, depth):
+    found = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+# Function to get the edit distance between two strings, counting an
+# adjacent transposition as one edit (optimal string alignment)
+def edit_distance(a, b):
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+# Function to score a match in corrected text: the lowest share of any
+# corrected word in it that was typed as is. Each word is scored on its
+# own, so correctly typed words around it can't make up for a rewritten
+# one. `span` is the match's (start, end); corrections are (start, end,
+# edits) per word.
+def match_confidence(span, corrections):
+    start, end = span
+    confidence = 1.0
+    for word_start, word_end, word_edits in corrections:
+        if word_start < end and word_end > start:
+            confidence = min(confidence, max(0.0, 1.0 - word_edits / (word_end - word_start)))
+    return confidence
+
+
+class FuzzyIndex:
+    # Deletion dictionary over the words of rule keywords (the literals the
+    # prefilter extracts). A word is looked up by generating its own
+    # deletions, so finding every vocabulary word within a few edits costs
+    # a few dozen dict lookups whatever the vocabulary size. Words already
+    # in the vocabulary, short words and numbers are never changed; a typo
+    # equally close to two words is corrected to the one more keywords
+    # use, and left alone on a tie.
+    def __init__(self, keywords, max_edits=2):
+        self.max_edits = max_edits
+        counts = {}
+        for keyword in keywords:
+            for word in set(_WORD.findall(keyword)):
+                counts[word] = counts.get(word, 0) + 1
+        self.words = counts
+        self._deletes = {}
+        for word in counts:
+            if word.isdecimal():
+                continue
+            for deleted in deletes(word[:PREFIX_LENGTH], allowed_edits(len(word), max_edits)):
+                self._deletes.setdefault(deleted, []).append(word)
+        self._memo = {}
+
+    # The vocabulary word closest to `word` as (word, edits), or None
+    def suggest(self, word):
+        suggestion = self._memo.get(word, False)
+        if suggestion is not False:
+            return suggestion
+        suggestion = None
+        limit = allowed_edits(len(word), self.max_edits)
+        if limit and word not in self.words and not word.isdecimal():
+            best = []
+            best_edits = limit + 1
+            seen = set()
+            for deleted in deletes(word[:PREFIX_LENGTH], limit):
+                for candidate in self._deletes.get(deleted, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    if abs(len(candidate) - len(word)) > min(limit, allowed_edits(len(candidate), self.max_edits)):
+                        continue
+                    edits = edit_distance(word, candidate)
+                    if edits > allowed_edits(len(candidate), self.max_edits):
+                        continue
+                    if edits < best_edits:
+                        best, best_edits = [candidate], edits
+                    elif edits == best_edits:
+                        best.append(candidate)
+            if best:
+                best.sort(key=lambda candidate: -self.words[candidate])
+                if len(best) == 1 or self.words[best[0]] > self.words[best[1]]:
+                    suggestion = (best[0], best_edits)
+        if len(self._memo) >= MAX_MEMO:
+            self._memo.clear()
+        self._memo[word] = suggestion
+        return suggestion
+
+    # Correct every word of text that is a near miss of a keyword word.
+    # Returns (corrected text, [(start, end, edits)] per corrected word in
+    # it), or None when nothing was corrected.
+    def correct(self, text):
+        pieces = []
+        corrections = []
+        last = 0
+        length = 0
+        for found in _WORD.finditer(text):
+            suggestion = self.suggest(found.group())
+            if suggestion is None:
+                continue
+            word, edits = suggestion
+            gap = text[last:found.start()]
+            pieces.append(gap)
+            pieces.append(word)
+            length += len(gap)
+            corrections.append((length, length + len(word), edits))
+            length += len(word)
+            last = found.end()
+        if not corrections:
+            return None
+        pieces.append(text[last:])
+        return "".join(pieces), corrections
@@ -0,0 +1,128 @@
+# chatbot/history.py
+# Searchable history of a user's past queries: recency order plus an
+# incremental inverted index for ranked prefix search
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WORD = re.compile(r"\w+")
+
+
+# Function to split text into lowercase index terms (Unicode aware, so
+# Devanagari words are terms too)
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+class QueryHistory:
+    # Every distinct query a user has asked, most recent last. A query asked
+    # again moves to the end instead of being added twice (dict lookups).
+    # Each query's terms go into an inverted index when it is first added;
+    # the sorted vocabulary turns a prefix into a contiguous slice found by
+    # bisect, so search never rescans past queries. Past max_entries the
+    # least recently asked query is forgotten.
+    def __init__(self, max_entries=50000, min_prefix=2):
+        self.max_entries = max_entries
+        self.min_prefix = min_prefix
+        self._recent = OrderedDict()  # query -> (doc id, timestamp)
+        self._queries = {}            # doc id -> query
+        self._postings = {}           # term -> set of doc ids
+        self._vocabulary = []         # sorted terms
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    # Add a query, or move a repeated one to the most recent end. Doc ids
+    # grow with recency: a repeated query is re-indexed under a new id.
+    def add(self, query, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            entry = self._recent.pop(query, None)
+            if entry is not None:
+                self._unindex(query, entry[0])
+            doc = self._next_id
+            self._next_id += 1
+            self._recent[query] = (doc, timestamp)
+            self._queries[doc] = query
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = set()
+                    bisect.insort(self._vocabulary, term)
+                postings.add(doc)
+            while len(self._recent) > self.max_entries:
+                query, (doc, _) = self._recent.popitem(last=False)
+                self._unindex(query, doc)
+
+    # Remove a query's doc from the index; callers hold self._lock
+    def _unindex(self, query, doc):
+        del self._queries[doc]
+        for term in set(tokenize(query)):
+            postings = self._postings[term]
+            postings.discard(doc)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    # The `limit` most recently asked queries as (query, timestamp), newest first
+    def recent(self, limit=15):
+        with self._lock:
+            items = []
+            for query in reversed(self._recent):
+                if len(items) == limit:
+                    break
+                items.append((query, self._recent[query][1]))
+        return items
+
+    # Vocabulary terms starting with `prefix`. A single character only
+    # matches itself: as a prefix it would select nearly every query.
+    def _expand(self, prefix):
+        if len(prefix) < self.min_prefix:
+            return [prefix] if prefix in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        stop = bisect.bisect_left(self._vocabulary, prefix + '\U0010ffff')
+        return self._vocabulary[start:stop]
+
+    # Queries containing every search term as a word prefix, as (query,
+    # timestamp). Whole-word matches rank above prefix matches, rarer terms
+    # count for more, and ties go to the most recently asked. The most
+    # selective term runs first, so later terms only score its candidates.
+    def search(self, text, limit=15):
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms:
+            return self.recent(limit)
+        with self._lock:
+            expanded = sorted(((term, self._expand(term)) for term in terms),
+                              key=lambda item: sum(len(self._postings[word]) for word in item[1]))
+            scores = None
+            for term, words in expanded:
+                # Lowest weight first, so a doc matching several words keeps its best
+                weighted = sorted((self._weight(term, word), word) for word in words)
+                term_scores = {}
+                for weight, word in weighted:
+                    postings = self._postings[word]
+                    if scores is not None:
+                        postings = postings.intersection(scores) if len(scores) < len(postings) else \
+                            [doc for doc in postings if doc in scores]
+                    term_scores.update(dict.fromkeys(postings, weight))
+                if scores is not None:
+                    term_scores = {doc: scores[doc] + score for doc, score in term_scores.items()}
+                scores = term_scores
+                if not scores:
+                    return []
+            # Highest score first. Doc ids grow with recency (see add) and are
+            # unique, so on equal scores the most recently asked query wins
+            # and the order never depends on how scores was filled.
+            best = heapq.nlargest(limit, ((score, doc) for doc, score in scores.items()))
+            return [(self._queries[doc], self._recent[self._queries[doc]][1]) for _, doc in best]
+
+    def _weight(self, term, word):
+        return (2.0 if word == term else 1.0) / len(self._postings[word]) ** 0.5
+
+    def __len__(self):
+        return len(self._recent)
+
+    def __bool__(self):
+        return bool(self._recent)
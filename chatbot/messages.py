@@ -0,0 +1,246 @@
+# chatbot/messages.py
+# Compact per-session message store: slotted records, shared rule response
+# texts, a bounded in-memory window and an on-disk append log for older turns
+import json
+import os
+import sys
+import tempfile
+import threading
+import weakref
+from array import array
+from collections import deque
+
+
+class ResponseTable:
+    # Process-wide table of rule response texts. Messages answered by a rule
+    # keep the small id instead of their own reference to the text, and equal
+    # texts from later rule reloads get the same id, so a response is held
+    # once no matter how many sessions were given it.
+    def __init__(self):
+        self._ids = {}
+        self._texts = []
+        self._lock = threading.Lock()
+
+    def intern(self, text):
+        response_id = self._ids.get(text)
+        if response_id is None:
+            with self._lock:
+                response_id = self._ids.get(text)
+                if response_id is None:
+                    response_id = len(self._texts)
+                    self._texts.append(text)
+                    self._ids[text] = response_id
+        return response_id
+
+    def text(self, response_id):
+        return self._texts[response_id]
+
+    def __len__(self):
+        return len(self._texts)
+
+
+_responses = ResponseTable()
+
+
+class Message:
+    # One chat message. Roles and patterns are interned, and a rule answer
+    # stores its response id (`text` stays None). `source` is "rule", "ai",
+    # "busy" or "error" for assistant messages answered by the pipeline;
+    # `timing` is an optional (ttft, generation_time, cache_status) tuple.
+    # `html` is the rendered bubble, filled in by the UI while the message
+    # is in memory.
+    __slots__ = ('role', 'text', 'response_id', 'pattern', 'source', 'rules_version', 'decoration', 'timing', 'html')
+
+    def __init__(self, role, content, pattern=None, source=None, rules_version=None, decoration="",
+                 timing=None, html=None, rule_response=False):
+        self.role = sys.intern(role)
+        if rule_response:
+            self.text = None
+            self.response_id = _responses.intern(content)
+        else:
+            self.text = content
+            self.response_id = None
+        self.pattern = sys.intern(pattern) if pattern else None
+        self.source = sys.intern(source) if source else None
+        self.rules_version = rules_version
+        self.decoration = decoration
+        self.timing = timing
+        self.html = html
+
+    @property
+    def content(self):
+        if self.text is None:
+            return _responses.text(self.response_id)
+        return self.text
+
+    # Approximate bytes this message holds on its own (shared texts, interned
+    # strings and small ints are not counted)
+    def size(self):
+        total = sys.getsizeof(self)
+        if self.text is not None:
+            total += sys.getsizeof(self.text)
+        if self.html is not None:
+            total += sys.getsizeof(self.html)
+        if self.timing is not None:
+            total += sys.getsizeof(self.timing)
+        return total
+
+    # Log line for the spill file. Response ids are only meaningful inside
+    # this process, which is also the lifetime of the log.
+    def dump(self):
+        record = {'role': self.role}
+        if self.text is None:
+            record['response_id'] = self.response_id
+        else:
+            record['content'] = self.text
+        for name in ('pattern', 'source', 'rules_version', 'decoration', 'timing'):
+            value = getattr(self, name)
+            if value:
+                record[name] = value
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    @classmethod
+    def load(cls, line):
+        record = json.loads(line)
+        message = cls(record['role'], record.get('content'), record.get('pattern'), record.get('source'),
+                      record.get('rules_version'), record.get('decoration', ""),
+                      tuple(record['timing']) if 'timing' in record else None)
+        if 'response_id' in record:
+            message.response_id = record['response_id']
+        return message
+
+
+_spill_dir = None
+_spill_lock = threading.Lock()
+_stores = weakref.WeakSet()
+
+
+# Function to get the directory for spill logs: CHATBOT_SPILL_DIR, or a
+# fresh temporary directory for this process
+def get_spill_dir():
+    global _spill_dir
+    if _spill_dir is None:
+        with _spill_lock:
+            if _spill_dir is None:
+                path = os.getenv('CHATBOT_SPILL_DIR')
+                if path:
+                    os.makedirs(path, exist_ok=True)
+                else:
+                    path = tempfile.mkdtemp(prefix='chatbot-spill-')
+                _spill_dir = path
+    return _spill_dir
+
+
+# Function to delete a spill log once its store is gone
+def _remove_log(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class MessageStore:
+    # A session's messages, oldest first. At most `window` messages and about
+    # `max_bytes` of them stay in memory; older ones are moved, a batch at a
+    # time, to an append-only log and read back by offset when the UI asks
+    # for them. Messages are never edited once added. Indexing and slicing
+    # work over the whole conversation.
+    def __init__(self, session, window=200, max_bytes=256 * 1024, spill_dir=None, spill_batch=None):
+        self.session = session
+        self.window = max(1, window)
+        self.max_bytes = max_bytes
+        self.spill_batch = max(1, spill_batch or self.window // 4)
+        self.path = os.path.join(spill_dir or get_spill_dir(), f'{session}-{os.getpid()}.log')
+        self._memory = deque()
+        self._bytes = 0
+        self._offsets = array('Q', [0])  # start of spilled message i; the last is the log size
+        self._lock = threading.Lock()
+        weakref.finalize(self, _remove_log, self.path)
+        _stores.add(self)
+
+    def append(self, message):
+        with self._lock:
+            self._memory.append(message)
+            self._bytes += message.size()
+            if len(self._memory) > self.window or self._bytes > self.max_bytes:
+                self._spill()
+        return message
+
+    # Move the oldest in-memory messages to the log until both limits hold
+    # again (always keeping the newest message in memory)
+    def _spill(self):
+        lines = []
+        count = max(self.spill_batch, len(self._memory) - self.window)
+        while self._memory and (count > 0 or self._bytes > self.max_bytes) and len(self._memory) > 1:
+            message = self._memory.popleft()
+            self._bytes -= message.size()
+            lines.append(message.dump())
+            count -= 1
+        mode = 'ab' if len(self._offsets) > 1 else 'wb'
+        with open(self.path, mode) as f:
+            f.write(b''.join(lines))
+        end = self._offsets[-1]
+        for line in lines:
+            end += len(line)
+            self._offsets.append(end)
+
+    @property
+    def spilled(self):
+        return len(self._offsets) - 1
+
+    # Bytes held in memory by this session's messages
+    def memory_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return self.spilled + len(self._memory)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self[:][index]
+            return self._range(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        return self._range(index, index + 1)[0]
+
+    def _range(self, start, stop):
+        with self._lock:
+            spilled = self.spilled
+            memory = list(self._memory)
+            older = []
+            if start < min(stop, spilled):
+                begin, end = self._offsets[start], self._offsets[min(stop, spilled)]
+                with open(self.path, 'rb') as f:
+                    f.seek(begin)
+                    older = [Message.load(line) for line in f.read(end - begin).splitlines()]
+        return older + memory[max(0, start - spilled):max(0, stop - spilled)]
+
+
+# Function to build a session store with the CHATBOT_SESSION_* limits
+def new_message_store(session):
+    return MessageStore(session, window=int(os.getenv('CHATBOT_SESSION_WINDOW', 200)),
+                        max_bytes=int(os.getenv('CHATBOT_SESSION_MAX_BYTES', 256 * 1024)))
+
+
+# Function to report message memory across the live sessions of this process
+def memory_report():
+    stores = list(_stores)
+    sizes = [store.memory_bytes() for store in stores]
+    return {
+        'sessions': len(stores),
+        'bytes': sum(sizes),
+        'max_session_bytes': max(sizes, default=0),
+        'in_memory': sum(len(store._memory) for store in stores),
+        'spilled': sum(store.spilled for store in stores),
+        'responses': len(_responses),
+    }
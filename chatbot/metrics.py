@@ -0,0 +1,246 @@
+# chatbot/metrics.py
+# Process-wide counters and latency histograms in Prometheus text format
+#
+#   CHATBOT_METRICS_PORT=9464 streamlit run app.py
+#   curl -s localhost:9464/metrics
+import bisect
+import os
+import threading
+import weakref
+
+# Latency buckets in seconds: 10 us to 10 s
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Function to escape a Prometheus label value
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _ShardOwner:
+    # Lives in a thread's thread-local storage next to its shard; it is
+    # dropped when the thread ends, which retires the shard
+    __slots__ = ('__weakref__',)
+
+
+class _Sharded:
+    # Each thread writes only its own shard (a plain dict), so recording
+    # takes no lock and session threads never wait on each other. Readers
+    # merge the shards; a value being written is seen now or on the next
+    # scrape. When a thread ends (Streamlit reruns and HTTP connections
+    # each get a new one) its shard is folded into a retired total, so the
+    # shard count stays at the number of live threads.
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards = {}  # id(shard) -> shard, live threads only
+        self._retired = {}
+        self._lock = threading.Lock()  # only taken when a thread makes or retires its shard
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            owner = self._local.owner = _ShardOwner()
+            with self._lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(owner, self._retire, shard)
+            return shard
+
+    # Fold the shard of a thread that has ended into the retired total
+    def _retire(self, shard):
+        with self._lock:
+            self._shards.pop(id(shard), None)
+            for key, value in shard.items():
+                merged = self._retired.get(key)
+                self._retired[key] = value if merged is None else self._merge(merged, value)
+
+    def _snapshot(self):
+        with self._lock:
+            shards = [self._retired] + list(self._shards.values())
+            return [dict(shard) for shard in shards]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    @staticmethod
+    def _merge(total, value):
+        return total + value
+
+    def inc(self, *label_values, amount=1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    # {label values: total} across every thread
+    def values(self):
+        totals = {}
+        for shard in self._snapshot():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def total(self):
+        return sum(self.values().values())
+
+    def render(self):
+        return [f"{self.name}{format_labels(self.labels, key)} {value}"
+                for key, value in sorted(self.values().items(), key=lambda item: str(item[0]))]
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    # A new list, so a snapshot taken earlier never sees it change
+    @staticmethod
+    def _merge(total, counts):
+        return [a + b for a, b in zip(total, counts)]
+
+    def observe(self, value, *label_values):
+        shard = self._shard()
+        counts = shard.get(label_values)
+        if counts is None:
+            # One slot per bucket plus +Inf, then the sum
+            counts = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    # {label values: (per-bucket counts, sum)} across every thread
+    def values(self):
+        totals = {}
+        for shard in self._snapshot():
+            for key, counts in shard.items():
+                counts = list(counts)
+                merged = totals.get(key)
+                totals[key] = counts if merged is None else [a + b for a, b in zip(merged, counts)]
+        return {key: (counts[:-1], counts[-1]) for key, counts in totals.items()}
+
+    def render(self):
+        lines = []
+        for key, (counts, total) in sorted(self.values().items(), key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    # A value computed when scraped
+    kind = "gauge"
+
+    def __init__(self, name, help, compute):
+        self.name = name
+        self.help = help
+        self.compute = compute
+
+    def render(self):
+        return [f"{self.name} {self.compute()}"]
+
+
+# Turn metrics shared by the app, the HTTP API and the pipeline
+RULE_HITS = Counter("chatbot_rule_hits_total", "Messages answered by each rule pattern", ("rule_id", "pattern"))
+TURNS = Counter("chatbot_turns_total", "Answered messages by source (rule, ai, busy, error)", ("source",))
+AI_CACHE_LOOKUPS = Counter("chatbot_ai_cache_lookups_total", "AI cache lookups by result (exact, semantic, miss)",
+                           ("result",))
+STAGE_SECONDS = Histogram("chatbot_stage_seconds", "Time spent in each stage of a turn", ("stage",))
+RULE_TIMEOUTS = Counter("chatbot_rule_timeouts_total", "Rule patterns disabled after running out of time",
+                        ("rule_id", "pattern"))
+FUZZY_LOOKUPS = Counter("chatbot_fuzzy_lookups_total",
+                        "Rule misses retried with typos corrected, by result (hit, rejected, miss)", ("result",))
+
+
+def _ratio(part, whole):
+    return part / whole if whole else 0.0
+
+
+def _fallback_ratio():
+    turns = TURNS.values()
+    return _ratio(sum(value for (source,), value in turns.items() if source != "rule"), sum(turns.values()))
+
+
+def _cache_hit_ratio():
+    lookups = AI_CACHE_LOOKUPS.values()
+    return _ratio(sum(value for (result,), value in lookups.items() if result != "miss"), sum(lookups.values()))
+
+
+def _disabled_patterns():
+    from chatbot.rules import get_rule_store
+
+    return len(get_rule_store().snapshot().engine.disabled)
+
+
+METRICS = [
+    RULE_HITS, TURNS, AI_CACHE_LOOKUPS, STAGE_SECONDS, RULE_TIMEOUTS, FUZZY_LOOKUPS,
+    Gauge("chatbot_ai_fallback_ratio", "Share of answered messages that no rule matched", _fallback_ratio),
+    Gauge("chatbot_ai_cache_hit_ratio", "Share of AI cache lookups answered from a cache", _cache_hit_ratio),
+    Gauge("chatbot_rules_disabled", "Rule patterns disabled as backtracking risks or after timing out",
+          _disabled_patterns),
+]
+
+
+# Function to render every metric in the Prometheus text exposition format
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Function to serve /metrics from a background thread, once per process.
+# Listens on 127.0.0.1:CHATBOT_METRICS_PORT; does nothing when it isn't set.
+def start_metrics_server():
+    global _server
+    port = os.getenv('CHATBOT_METRICS_PORT')
+    if not port or _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            server = ThreadingHTTPServer((os.getenv('CHATBOT_METRICS_HOST', '127.0.0.1'), int(port)), MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="chatbot-metrics", daemon=True).start()
+            _server = server
+    return _server
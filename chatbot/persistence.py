@@ -0,0 +1,218 @@
+# chatbot/persistence.py
+# Durable conversation log in SQLite (WAL), written by a background thread
+#
+#   python -m chatbot.persistence export --db chat.db [--session ID] > turns.jsonl
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from chatbot.messages import Message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    turns INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    created REAL NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    source TEXT,
+    pattern TEXT,
+    rules_version INTEGER,
+    ttft REAL,
+    generation_time REAL,
+    cache_status TEXT
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns (session, id);
+"""
+
+TURN_COLUMNS = ('id', 'session', 'created', 'role', 'content', 'source', 'pattern', 'rules_version',
+                'ttft', 'generation_time', 'cache_status')
+
+_FLUSH = object()
+_STOP = object()
+
+
+class ConversationStore:
+    # Append-only record of every chat message, by session. record() only
+    # puts the message on a queue; one writer thread takes whatever has
+    # queued up (up to batch_size) and inserts it in a single transaction,
+    # so callers never wait on disk and busy periods cost one commit per
+    # batch instead of one per message. If the queue is full the message is
+    # dropped and counted rather than blocking the caller. Readers use their
+    # own connections; WAL lets them run while the writer commits.
+    def __init__(self, path, batch_size=256, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._counters = {'queued': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        db.commit()
+        self._writer_db = db
+        self._writer = threading.Thread(target=self._write_loop, name="chatbot-persistence", daemon=True)
+        self._writer.start()
+
+    # Queue one message of `session` for writing; never blocks
+    def record(self, session, message):
+        timing = message.timing or (None, None, None)
+        row = (session, time.time(), message.role, message.content, message.source, message.pattern,
+               message.rules_version, timing[0], timing[1], timing[2])
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    # Wait until everything queued so far is on disk; False on timeout
+    def flush(self, timeout=5.0):
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._writer.is_alive():
+            self._queue.put((_STOP, None))
+            self._writer.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._queue.qsize())
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if item[0] is not _FLUSH and item[0] is not _STOP]
+            if rows:
+                self._write(rows)
+            for item in batch:
+                if item[0] is _FLUSH:
+                    item[1].set()
+            if any(item[0] is _STOP for item in batch):
+                self._writer_db.close()
+                return
+
+    def _write(self, rows):
+        sessions = {}
+        for row in rows:
+            first, last, count = sessions.get(row[0], (row[1], row[1], 0))
+            sessions[row[0]] = (first, row[1], count + 1)
+        try:
+            with self._writer_db:
+                self._writer_db.executemany(
+                    "INSERT INTO turns (session, created, role, content, source, pattern, rules_version, "
+                    "ttft, generation_time, cache_status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._writer_db.executemany(
+                    "INSERT INTO sessions (id, created, updated, turns) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET updated = excluded.updated, turns = turns + excluded.turns",
+                    [(session, first, last, count) for session, (first, last, count) in sessions.items()])
+        except sqlite3.Error:
+            self._count('errors')
+            return
+        with self._lock:
+            self._counters['written'] += len(rows)
+            self._counters['batches'] += 1
+
+    # Per-thread read connection
+    def _reader(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path)
+        return db
+
+    def has_session(self, session):
+        return self._reader().execute("SELECT 1 FROM sessions WHERE id = ?", (session,)).fetchone() is not None
+
+    # Stream turns as dicts in write order, one page of `page_size` rows at
+    # a time (keyset pagination on id, so each page is an index range scan).
+    # Pass the last id seen as `after` to resume an interrupted export.
+    def iter_turns(self, session=None, after=0, page_size=500):
+        db = self._reader()
+        where = "id > ?" + (" AND session = ?" if session is not None else "")
+        while True:
+            params = (after, session) if session is not None else (after,)
+            page = db.execute(f"SELECT {', '.join(TURN_COLUMNS)} FROM turns WHERE {where} "
+                              "ORDER BY id LIMIT ?", params + (page_size,)).fetchall()
+            for row in page:
+                yield dict(zip(TURN_COLUMNS, row))
+            if len(page) < page_size:
+                return
+            after = page[-1][0]
+
+    # Rebuild a session's messages, oldest first
+    def load_messages(self, session):
+        for turn in self.iter_turns(session):
+            timing = None
+            if turn['ttft'] is not None:
+                timing = (turn['ttft'], turn['generation_time'], turn['cache_status'])
+            yield Message(turn['role'], turn['content'], turn['pattern'], turn['source'], turn['rules_version'],
+                          timing=timing, rule_response=turn['source'] == "rule")
+
+    # A session's user queries as (query, timestamp), oldest first
+    def user_queries(self, session, page_size=500):
+        for turn in self.iter_turns(session, page_size=page_size):
+            if turn['role'] == "user":
+                yield turn['content'], turn['created']
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Function to get the process-wide conversation store, or None when
+# CHATBOT_DB_PATH (the SQLite file) is not set
+def get_conversation_store():
+    global _store
+    path = os.getenv('CHATBOT_DB_PATH')
+    if not path:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(path, batch_size=int(os.getenv('CHATBOT_DB_BATCH', 256)))
+    return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conversation log tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write turns as JSON lines to stdout")
+    export.add_argument("--db", default=os.getenv('CHATBOT_DB_PATH'), required=not os.getenv('CHATBOT_DB_PATH'))
+    export.add_argument("--session", help="only this session")
+    export.add_argument("--after", type=int, default=0, help="only turns with a larger id")
+    args = parser.parse_args(argv)
+
+    store = ConversationStore(args.db)
+    try:
+        for turn in store.iter_turns(args.session, args.after):
+            sys.stdout.write(json.dumps(turn, ensure_ascii=False) + "\n")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# chatbot/pipeline.py
+# One chat turn without Streamlit: rules first, then cached or live AI
+import logging
+import re
+import time
+from collections import namedtuple
+
+from chatbot.ai import AI_MODEL, AI_PARAMS, SYSTEM_PROMPT, build_messages, estimate_tokens, get_ai_client
+from chatbot.cache import get_response_cache, make_cache_key
+from chatbot.metrics import AI_CACHE_LOOKUPS, RULE_HITS, STAGE_SECONDS, TURNS
+from chatbot.rules import get_rule_store, normalize_input
+from chatbot.scheduler import BusyError
+from chatbot.semantic_cache import get_semantic_cache
+from chatbot.tracing import current_span, get_tracer
+
+logger = logging.getLogger(__name__)
+
+AI_ERROR_MESSAGE = "😕 I'm having trouble connecting right now. Please try again in a moment."
+AI_BUSY_MESSAGE = "🚦 I'm answering a lot of questions right now. Please try again in a few seconds."
+
+# The outcome of one turn. source is "rule", "ai", "busy" or "error";
+# cache_status is "exact", "semantic" or "miss" for AI turns, None for rules.
+Turn = namedtuple('Turn', ['response', 'source', 'rule_id', 'pattern', 'rules_version', 'cache_status'])
+
+
+# Words that make a question lean on earlier turns ("and its moons?"),
+# and openers that do ("what about mars?")
+FOLLOW_UP_WORDS = frozenset("""
+it its it's they them their theirs this that these those he him his she her hers there
+and also but so then same else more
+""".split())
+FOLLOW_UP_OPENERS = ("what about", "how about", "why not")
+# User questions a follow-up's answer is cached under
+CACHE_CONTEXT_QUESTIONS = 2
+
+_CACHE_WORD = re.compile(r"[\w']+")
+
+
+# Function to tell whether a question depends on the turns before it: it is
+# very short, or uses a pronoun or an opener that refers back
+def is_follow_up(query):
+    query = normalize_input(query)
+    words = _CACHE_WORD.findall(query)
+    return len(words) <= 2 or query.startswith(FOLLOW_UP_OPENERS) or not FOLLOW_UP_WORDS.isdisjoint(words)
+
+
+# Function to get the part of the prior turns an AI answer is cached under.
+# A question that stands on its own is cached under itself alone, so every
+# session shares its answer (exactly and semantically), although prior
+# turns were sent with it and could have nudged the reply: one session
+# may get an answer written for another conversation. A follow-up is keyed
+# on the last few user questions only, not the whole context, whose
+# assistant replies (often a random pick among a rule's responses) would
+# make nearly every key unique.
+def cache_context(query, context):
+    if not context or not is_follow_up(query):
+        return None
+    questions = [normalize_input(turn["content"]) for turn in context if turn["role"] == "user"]
+    if not questions:
+        return [turn["content"] for turn in context]
+    return questions[-CACHE_CONTEXT_QUESTIONS:]
+
+
+# Cache key for an AI answer: normalized query plus every request setting,
+# and for a follow-up the recent questions it follows (see cache_context)
+def ai_cache_key(query, context=None):
+    window = cache_context(query, context)
+    if window:
+        return make_cache_key([normalize_input(query), window], AI_MODEL, SYSTEM_PROMPT, AI_PARAMS)
+    return make_cache_key(normalize_input(query), AI_MODEL, SYSTEM_PROMPT, AI_PARAMS)
+
+
+# Semantic cache entries are only shared between identical request settings
+AI_CACHE_NAMESPACE = make_cache_key(None, AI_MODEL, SYSTEM_PROMPT, AI_PARAMS)
+
+
+# Function to look up a previous AI answer: the exact query first, then a
+# near-duplicate one. Returns (text, "exact" | "semantic") or (None, "miss").
+# A follow-up (see is_follow_up) only matches exactly: a similar question
+# in another conversation may mean something else.
+def lookup_ai_cache(query, context=None):
+    span = current_span()
+    if span is None:
+        return _lookup_ai_cache(query, context)
+    start = time.perf_counter_ns()
+    cached, cache_status = _lookup_ai_cache(query, context)
+    span.child("ai.cache", start, time.perf_counter_ns(), {"cache.status": cache_status})
+    return cached, cache_status
+
+
+def _lookup_ai_cache(query, context):
+    key = ai_cache_key(query, context)
+    cached = get_response_cache().get(key)
+    if cached is not None:
+        AI_CACHE_LOOKUPS.inc("exact")
+        return cached, "exact"
+    semantic = get_semantic_cache()
+    if semantic is not None and not cache_context(query, context):
+        cached, _ = semantic.lookup(normalize_input(query), AI_CACHE_NAMESPACE)
+        if cached is not None:
+            # Promote so the next identical query skips the vector search
+            get_response_cache().set(key, cached)
+            AI_CACHE_LOOKUPS.inc("semantic")
+            return cached, "semantic"
+    AI_CACHE_LOOKUPS.inc("miss")
+    return None, "miss"
+
+
+# Function to remember a complete AI answer in both caches
+def store_ai_response(query, response, context=None):
+    get_response_cache().set(ai_cache_key(query, context), response)
+    semantic = get_semantic_cache()
+    if semantic is not None and not cache_context(query, context):
+        semantic.add(normalize_input(query), response, AI_CACHE_NAMESPACE)
+
+
+# Function to get an AI answer through the shared caches, optionally after
+# prior turns (the messages a ConversationContext built). Returns the text
+# and the cache status; upstream errors and BusyError are raised.
+def ask_ai(query, session=None, context=None):
+    cached, cache_status = lookup_ai_cache(query, context)
+    if cached is not None:
+        return cached, cache_status
+    span = current_span()
+    usage = {} if span is not None else None
+    messages = build_messages(query, context)
+    error = None
+    start = time.perf_counter_ns()
+    try:
+        response = get_ai_client().complete(messages, session=session, usage=usage)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        end = time.perf_counter_ns()
+        STAGE_SECONDS.observe((end - start) / 1e9, "ai")
+        if span is not None:
+            span.child("ai.call", start, end, ai_span_attributes(messages, usage, cache_status), error)
+    store_ai_response(query, response, context)
+    return response, cache_status
+
+
+# Function to describe an AI call on its trace span: model, prompt size,
+# the usage Groq reported (see AIClient.complete) and the cache status
+def ai_span_attributes(messages, usage, cache_status, stream=False):
+    attributes = {"ai.model": AI_MODEL, "ai.stream": stream, "ai.prompt_messages": len(messages),
+                  "ai.prompt_tokens_estimate": estimate_tokens(messages), "cache.status": cache_status}
+    if usage:
+        if usage.get("total_tokens") is not None:
+            attributes["ai.usage.total_tokens"] = usage["total_tokens"]
+        attributes["ai.coalesced"] = usage.get("coalesced", False)
+    return attributes
+
+
+# Function to answer a message from the rules alone, retrying a miss with
+# its typos corrected (see RuleEngine.fuzzy_match); None on a miss
+def match_rule(message, snapshot):
+    start = time.perf_counter_ns()
+    text = normalize_input(message)
+    normalized = time.perf_counter_ns()
+    match = snapshot.engine.match(text)
+    matched = time.perf_counter_ns()
+    STAGE_SECONDS.observe((normalized - start) / 1e9, "normalize")
+    STAGE_SECONDS.observe((matched - normalized) / 1e9, "match")
+    span = current_span()
+    if span is not None:
+        span.child("normalize", start, normalized)
+        span.child("match", normalized, matched, {
+            "rule.matched": bool(match), "rules.version": snapshot.version,
+            "rule.id": match.rule_id if match else None, "rule.pattern": match.pattern if match else None})
+    if match is None and snapshot.engine.fuzzy is not None:
+        match = snapshot.engine.fuzzy_match(text)
+        corrected = time.perf_counter_ns()
+        STAGE_SECONDS.observe((corrected - matched) / 1e9, "fuzzy")
+        if span is not None:
+            span.child("fuzzy", matched, corrected, {
+                "rule.matched": bool(match), "rule.id": match.rule_id if match else None,
+                "rule.pattern": match.pattern if match else None,
+                "fuzzy.confidence": match.confidence if match else None})
+    if match:
+        RULE_HITS.inc(match.rule_id, match.pattern)
+        TURNS.inc("rule")
+        return Turn(match.response, "rule", match.rule_id, match.pattern, snapshot.version, None)
+    return None
+
+
+# Function to answer a rule miss with the AI. Never raises: failures become
+# "busy" or "error" turns carrying the matching fallback message.
+def answer_with_ai(message, session, snapshot):
+    try:
+        response, cache_status = ask_ai(message, session)
+        turn = Turn(response, "ai", None, None, snapshot.version, cache_status)
+    except BusyError:
+        turn = Turn(AI_BUSY_MESSAGE, "busy", None, None, snapshot.version, "miss")
+    except Exception as e:
+        logger.warning("AI request failed: %s", e)
+        turn = Turn(AI_ERROR_MESSAGE, "error", None, None, snapshot.version, "miss")
+    TURNS.inc(turn.source)
+    return turn
+
+
+# Function to answer one message, pinned to one rule snapshot (the current
+# one by default). A sampled turn is traced as a "chat.turn" span.
+def answer(message, session=None, snapshot=None):
+    snapshot = snapshot or get_rule_store().snapshot()
+    span = get_tracer().start_trace("chat.turn")
+    if not span.recording:
+        return match_rule(message, snapshot) or answer_with_ai(message, session, snapshot)
+    with span:
+        turn = match_rule(message, snapshot) or answer_with_ai(message, session, snapshot)
+        annotate_turn(span, turn)
+    return turn
+
+
+# Function to record a turn's outcome on its root span
+def annotate_turn(span, turn):
+    span.set_attribute("chat.source", turn.source)
+    span.set_attribute("rule.pattern", turn.pattern)
+    span.set_attribute("rules.version", turn.rules_version)
+    span.set_attribute("cache.status", turn.cache_status)
@@ -0,0 +1,170 @@
+# chatbot/prefilter.py
+# Literal prefilter: skip patterns whose required substrings are absent
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# Stop expanding literal alternatives past this many strings
+MAX_LITERAL_ALTERNATIVES = 64
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+# Pick the most selective of several "one of these must appear" sets
+def _best(candidates):
+    best = None
+    for literals in candidates:
+        if not literals or min(map(len, literals)) == 0:
+            continue
+        if best is None or (min(map(len, literals)), -len(literals)) > (min(map(len, best)), -len(best)):
+            best = literals
+    return best
+
+
+# Analyze a parsed node. Returns (exact, required):
+#   exact    - every string the node can match, when that set is small and finite
+#   required - a set of strings, one of which appears in every match
+def _analyze(op, av):
+    if op is sre_constants.LITERAL:
+        return {chr(av)}, {chr(av)}
+    if op is sre_constants.AT:
+        # Zero-width anchors keep neighbouring literals adjacent
+        return {''}, None
+    if op is sre_constants.SUBPATTERN:
+        add_flags = av[1]
+        if add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+            return None, None
+        return _analyze_sequence(av[-1])
+    if op is sre_constants.BRANCH:
+        results = [_analyze_sequence(branch) for branch in av[1]]
+        exact = None
+        if all(e is not None for e, _ in results):
+            exact = set().union(*(e for e, _ in results))
+            if len(exact) > MAX_LITERAL_ALTERNATIVES:
+                exact = None
+        required = None
+        if all(r is not None for _, r in results):
+            required = set().union(*(r for _, r in results))
+        return exact, required
+    if op in _REPEATS:
+        low, high, item = av
+        _, required = _analyze_sequence(item)
+        return None, (required if low >= 1 else None)
+    return None, None
+
+
+def _analyze_sequence(items):
+    candidates = []
+    run = {''}  # exact strings for the current run of literal-only nodes
+    closed = False
+    for op, av in items:
+        exact, required = _analyze(op, av)
+        if exact is not None and len(run) * len(exact) <= MAX_LITERAL_ALTERNATIVES:
+            run = {a + b for a in run for b in exact}
+            continue
+        candidates.append(run)
+        closed = True
+        if exact is not None:
+            run = set(exact)
+        else:
+            candidates.append(required)
+            run = {''}
+    candidates.append(run)
+    if not closed:
+        return run, _best(candidates)
+    return None, _best(candidates)
+
+
+# Function to extract literals one of which must occur in any match of pattern.
+# Returns None when no such set can be proven (the pattern must always run).
+def extract_literals(pattern):
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return None
+    _, required = _analyze_sequence(list(parsed))
+    return frozenset(required) if required else None
+
+
+class LiteralAutomaton:
+    # Aho-Corasick automaton over a {literal: values} mapping. find() reports
+    # the values of every literal occurring in the text, overlaps included,
+    # in a single pass over the text.
+    def __init__(self, keywords):
+        goto = [{}]
+        out = [set()]
+        for word, values in keywords.items():
+            node = 0
+            for ch in word:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(set())
+                node = nxt
+            out[node].update(values)
+
+        # Breadth-first fail links; each node inherits its suffix's outputs
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for ch, child in goto[node].items():
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fallback = goto[state].get(ch, 0)
+                fail[child] = fallback if fallback != child else 0
+                out[child] |= out[fail[child]]
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._out = [frozenset(values) for values in out]
+
+    def find(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for ch in text:
+            while True:
+                nxt = goto[node].get(ch)
+                if nxt is not None:
+                    node = nxt
+                    break
+                if not node:
+                    break
+                node = fail[node]
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+class RulePrefilter:
+    # Index pattern positions by their required literals (as returned by
+    # extract_literals); positions without literals are always candidates
+    def __init__(self, literal_sets):
+        keywords = {}
+        always = []
+        for position, literals in enumerate(literal_sets):
+            if literals is None:
+                always.append(position)
+                continue
+            for literal in literals:
+                keywords.setdefault(literal, set()).add(position)
+        self.always = frozenset(always)
+        self.automaton = LiteralAutomaton(keywords)
+
+    # Pattern positions that could match text, in priority order
+    def candidates(self, text):
+        found = self.automaton.find(text)
+        if self.always:
+            found |= self.always
+        return sorted(found)
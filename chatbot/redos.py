@@ -0,0 +1,314 @@
+# chatbot/redos.py
+# Catastrophic backtracking (ReDoS) guards for rule patterns: static
+# analysis at load time and time-limited matching
+import re
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# Seconds one pattern may spend on one input before it is given up on
+DEFAULT_MATCH_TIMEOUT = 0.05
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+# A pattern without any of these characters has no repetition or
+# alternation to analyze
+_BACKTRACK_CHARS = re.compile(r'[*+?{|]')
+# Ambiguous alternations one after another multiply the ways a match can
+# be tried: (a|a)(a|a)... takes 2**n attempts to fail
+MAX_AMBIGUOUS_ALTERNATIONS = 8
+# Possessive repeats and atomic groups never backtrack into themselves
+_NO_BACKTRACK = {getattr(sre_constants, name) for name in ('POSSESSIVE_REPEAT', 'ATOMIC_GROUP')
+                 if hasattr(sre_constants, name)}
+
+# Characters single-character matchers are compared on, plus every literal
+# of the pattern being analyzed
+_SAMPLE = frozenset([chr(i) for i in range(32, 127)] + ['\t', '\n', ' ', 'é', 'ß', 'न', '१', '中'])
+
+def _is_word(ch):
+    return ch.isalnum() or ch == '_'
+
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: str.isdecimal,
+    sre_constants.CATEGORY_NOT_DIGIT: lambda ch: not ch.isdecimal(),
+    sre_constants.CATEGORY_SPACE: str.isspace,
+    sre_constants.CATEGORY_NOT_SPACE: lambda ch: not ch.isspace(),
+    sre_constants.CATEGORY_WORD: _is_word,
+    sre_constants.CATEGORY_NOT_WORD: lambda ch: not _is_word(ch),
+}
+
+
+# Function to get the characters (of `alphabet`) one node matches, or None
+# when the node isn't a single-character matcher
+def _char_set(op, av, alphabet):
+    if op is sre_constants.LITERAL:
+        return frozenset((chr(av),))
+    if op is sre_constants.NOT_LITERAL:
+        return alphabet - {chr(av)}
+    if op is sre_constants.ANY:
+        return alphabet - {'\n'}
+    if op is sre_constants.IN:
+        negate = False
+        chars = set()
+        for item_op, item_av in av:
+            if item_op is sre_constants.NEGATE:
+                negate = True
+            elif item_op is sre_constants.LITERAL:
+                chars.add(chr(item_av))
+            elif item_op is sre_constants.RANGE:
+                chars.update(ch for ch in alphabet if item_av[0] <= ord(ch) <= item_av[1])
+            elif item_op is sre_constants.CATEGORY and item_av in _CATEGORIES:
+                chars.update(filter(_CATEGORIES[item_av], alphabet))
+            else:
+                return alphabet
+        return frozenset(alphabet - chars if negate else chars)
+    return None
+
+
+def _literals(items):
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            yield chr(av)
+        elif isinstance(av, (list, tuple)):
+            for value in av:
+                if isinstance(value, sre_parse.SubPattern):
+                    yield from _literals(value)
+                elif isinstance(value, list):
+                    for branch in value:
+                        if isinstance(branch, sre_parse.SubPattern):
+                            yield from _literals(branch)
+        elif isinstance(av, sre_parse.SubPattern):
+            yield from _literals(av)
+
+
+def _min_width(state, items):
+    return sre_parse.SubPattern(state, list(items)).getwidth()[0]
+
+
+class _Analysis:
+    # One walk over a parsed pattern, collecting problems
+    def __init__(self, pattern):
+        parsed = sre_parse.parse(pattern)
+        self.state = parsed.state
+        self.alphabet = _SAMPLE | frozenset(_literals(parsed))
+        self.problems = []
+        self.repeats = False
+        self.branches = False
+        self._walk(parsed)
+        if self.branches and self._ambiguous_run(parsed, self.alphabet) >= MAX_AMBIGUOUS_ALTERNATIONS:
+            self._report(f"ambiguous alternations in sequence: {MAX_AMBIGUOUS_ALTERNATIONS} or more alternations"
+                         " whose alternatives can match the same text")
+
+    def _report(self, problem):
+        if problem not in self.problems:
+            self.problems.append(problem)
+
+    def _walk(self, items):
+        for op, av in items:
+            if op in _REPEATS:
+                self.repeats = True
+                low, high, body = av
+                if high > 1:
+                    if self._repeats_inside(body):
+                        self._report("nested quantifier: a repeated group whose body is itself a repeat")
+                    if self._ambiguous_branch(body, self._first(body)):
+                        self._report("ambiguous alternation: alternatives under a quantifier can match the same text")
+                self._walk(body)
+            elif op in _NO_BACKTRACK:
+                self.repeats = True
+            elif op is sre_constants.SUBPATTERN:
+                self._walk(av[-1])
+            elif op is sre_constants.BRANCH:
+                self.branches = True
+                for branch in av[1]:
+                    self._walk(branch)
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                self._walk(av[1])
+            elif op is sre_constants.GROUPREF_EXISTS:
+                self.branches = True
+                for branch in av[1:]:
+                    if branch is not None:
+                        self._walk(branch)
+
+    def _required(self, items):
+        return [(op, av) for op, av in items if _min_width(self.state, [(op, av)]) > 0]
+
+    # True when one iteration of a repeated body can itself be a repeat,
+    # give or take optional parts and characters the inner repeat could
+    # also take: (a+)+, (a*)*, (\w+\s?)*, (x|y*z?)+, ([a-z]+.)+. Each
+    # iteration can then split the same run of text in exponentially many
+    # ways. (\w+\s)+ is fine: \s ends every iteration.
+    def _repeats_inside(self, items):
+        required = self._required(items)
+        if not required:
+            return any(self._nullable_repeat(op, av) for op, av in items)
+        repeats = [av for op, av in required if op in _REPEATS and av[1] > 1]
+        if len(repeats) == 1:
+            if len(required) == 1:
+                return True
+            inner, complete = self._chars(repeats[0][2])
+            if complete and len(inner) == 1:
+                others = [self._chars([(op, av)]) for op, av in required if op not in _REPEATS]
+                return len(others) == len(required) - 1 and \
+                    all(done and len(chars) == 1 and chars[0] & inner[0] for chars, done in others)
+            return False
+        if len(required) != 1:
+            return False
+        op, av = required[0]
+        if op is sre_constants.SUBPATTERN:
+            return self._repeats_inside(av[-1])
+        if op is sre_constants.BRANCH:
+            return any(self._repeats_inside(branch) for branch in av[1])
+        return False
+
+    def _nullable_repeat(self, op, av):
+        if op in _REPEATS:
+            return av[1] > 1
+        if op is sre_constants.SUBPATTERN:
+            return self._repeats_inside(av[-1])
+        if op is sre_constants.BRANCH:
+            return any(self._repeats_inside(branch) for branch in av[1])
+        return False
+
+    # Characters a sequence can start with (empty when it can match nothing
+    # but the empty string); the whole alphabet when unknown
+    def _first(self, items):
+        chars = set()
+        for op, av in items:
+            if op is sre_constants.AT:
+                continue
+            matched = _char_set(op, av, self.alphabet)
+            if matched is None:
+                if op is sre_constants.SUBPATTERN:
+                    matched = self._first(av[-1])
+                elif op in _REPEATS:
+                    matched = self._first(av[2])
+                elif op is sre_constants.BRANCH:
+                    matched = frozenset().union(*(self._first(branch) for branch in av[1]))
+                else:
+                    return self.alphabet
+            chars |= matched
+            if _min_width(self.state, [(op, av)]) > 0:
+                break
+        return frozenset(chars)
+
+    # Characters that can come right after items[index]: from the rest of
+    # the sequence, and from `after` when the rest can be empty
+    def _follow(self, items, index, after):
+        rest = items[index + 1:]
+        follow = self._first(rest)
+        if _min_width(self.state, rest) == 0:
+            follow |= after
+        return follow
+
+    # True when some alternation in a repeated body has two alternatives
+    # that can match the same text: (a|a)*, (a|aa)+, (.|\s)*. `after` is
+    # what can follow the items (the next iteration, at the top).
+    def _ambiguous_branch(self, items, after):
+        for index, (op, av) in enumerate(items):
+            if op is sre_constants.SUBPATTERN:
+                if self._ambiguous_branch(av[-1], self._follow(items, index, after)):
+                    return True
+            elif op is sre_constants.BRANCH:
+                branches = av[1]
+                follow = self._follow(items, index, after)
+                for i, first in enumerate(branches):
+                    for second in branches[i + 1:]:
+                        if self._overlap(first, second, follow):
+                            return True
+        return False
+
+    # Number of ambiguous alternations a match may have to go through one
+    # after another in a sequence, outside of repeats (those are checked
+    # on their own)
+    def _ambiguous_run(self, items, after):
+        count = 0
+        for index, (op, av) in enumerate(items):
+            if op is sre_constants.SUBPATTERN:
+                count += self._ambiguous_run(av[-1], self._follow(items, index, after))
+            elif op is sre_constants.BRANCH:
+                branches = av[1]
+                follow = self._follow(items, index, after)
+                if any(self._overlap(first, second, follow)
+                       for i, first in enumerate(branches) for second in branches[i + 1:]):
+                    count += 1
+                count += max(self._ambiguous_run(branch, follow) for branch in branches)
+        return count
+
+    # Single-character matchers a sequence starts with, and whether that is
+    # all of it
+    def _chars(self, items):
+        chars = []
+        for op, av in items:
+            if op is sre_constants.SUBPATTERN and len(av[-1]) == 1:
+                op, av = av[-1][0]
+            matched = _char_set(op, av, self.alphabet)
+            if matched is None:
+                return chars, False
+            chars.append(matched)
+        return chars, True
+
+    # True when two alternatives can match the same text, or one can match
+    # a prefix of the other's text and what is left could start what
+    # follows the alternation: (a|aa) before "a" is ambiguous, (a|ab) isn't
+    def _overlap(self, first, second, follow):
+        a, a_complete = self._chars(first)
+        b, b_complete = self._chars(second)
+        for x, y in zip(a, b):
+            if not x & y:
+                return False  # they part ways on a character
+        if len(a) > len(b) or (len(a) == len(b) and not a_complete):
+            a, a_complete, b, b_complete = b, b_complete, a, a_complete
+        if not a_complete or len(a) == len(b):
+            return True  # the same text, or can't be told apart statically
+        return bool(b[len(a)] & follow)
+
+
+# Function to find catastrophic backtracking risks in a pattern. Returns a
+# list of problems, empty when none were found.
+def analyze_pattern(pattern):
+    if not _BACKTRACK_CHARS.search(pattern):
+        return []
+    return _Analysis(pattern).problems
+
+
+class TimedSearch:
+    # A regex-module search with a time limit. Like re's bound search
+    # methods, two of them are equal when they run the same pattern.
+    __slots__ = ('compiled', 'timeout')
+
+    def __init__(self, compiled, timeout):
+        self.compiled = compiled
+        self.timeout = timeout
+
+    def __call__(self, text):
+        return self.compiled.search(text, timeout=self.timeout)
+
+    def __eq__(self, other):
+        return isinstance(other, TimedSearch) and (self.compiled, self.timeout) == (other.compiled, other.timeout)
+
+    def __hash__(self):
+        return hash((self.compiled, self.timeout))
+
+
+# Function to compile a pattern into a search function. Patterns without
+# repetition or alternation can't backtrack and use re directly; the rest
+# run on the regex module with a `timeout` (seconds) per search, raising
+# TimeoutError when it is exceeded.
+def compile_search(pattern, timeout=DEFAULT_MATCH_TIMEOUT):
+    compiled = re.compile(pattern)
+    if not timeout or not _BACKTRACK_CHARS.search(pattern):
+        return compiled.search
+    analysis = _Analysis(pattern)
+    if not analysis.repeats and not analysis.branches:
+        return compiled.search
+    try:
+        import regex
+    except ImportError:
+        raise ImportError("regex is required to match rule patterns with quantifiers or alternation:"
+                          " pip install regex")
+    return TimedSearch(regex.compile(pattern), timeout)
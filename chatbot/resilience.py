@@ -0,0 +1,180 @@
+# chatbot/resilience.py
+# Retries with jittered backoff, a circuit breaker and hedged requests for AI calls
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    # Raised instead of calling upstream while the breaker is open
+    pass
+
+
+# Function to decide whether an upstream error is worth another attempt
+def is_retryable(error):
+    import groq
+
+    if isinstance(error, (groq.APIConnectionError, asyncio.TimeoutError, TimeoutError)):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    # Closed: calls flow. After `failure_threshold` consecutive upstream
+    # failures it opens and fails fast for `reset_timeout` seconds, then
+    # lets a single probe through (half-open); the probe's outcome closes or
+    # re-opens it.
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    # Give back a half-open probe slot without judging upstream health
+    def release(self):
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class LatencyTracker:
+    # Rolling window of recent successful call latencies (seconds)
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, q, minimum_samples=20):
+        if len(self._samples) < minimum_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResiliencePolicy:
+    # Wraps an async upstream call with, in order: the circuit breaker, a
+    # per-request latency budget, retries with full-jitter exponential
+    # backoff for retryable errors and, optionally, a hedged second attempt
+    # fired when the first is slower than the recent p95. Each attempt and
+    # backoff sleep is bounded by what is left of the budget.
+    def __init__(self, max_retries=2, backoff_base=0.2, backoff_cap=2.0, budget=10.0,
+                 hedge=False, breaker=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.budget = budget
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._counters = {'calls': 0, 'retries': 0, 'failures': 0, 'short_circuits': 0,
+                          'hedges': 0, 'hedge_wins': 0}
+
+    # Run `attempt` (a zero-argument coroutine function). `hedgeable` is
+    # False for calls whose results hold resources, e.g. open streams.
+    async def call(self, attempt, hedgeable=True):
+        self._counters['calls'] += 1
+        if not self.breaker.allow():
+            self._counters['short_circuits'] += 1
+            raise CircuitOpenError("AI service temporarily unavailable (circuit open)")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget
+        retry = 0
+        while True:
+            remaining = deadline - loop.time()
+            started = loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError("AI latency budget exhausted")
+                if self.hedge and hedgeable:
+                    result = await asyncio.wait_for(self._hedged(attempt), remaining)
+                else:
+                    result = await asyncio.wait_for(attempt(), remaining)
+            except Exception as error:
+                if not is_retryable(error):
+                    if getattr(error, 'status_code', None) is not None:
+                        # Upstream answered (e.g. a 400); that says nothing about its health
+                        self.breaker.record_success()
+                    else:
+                        # Never reached upstream (e.g. shed by the scheduler)
+                        self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** retry))
+                if retry >= self.max_retries or loop.time() + delay >= deadline or not self.breaker.allow():
+                    self._counters['failures'] += 1
+                    raise
+                retry += 1
+                self._counters['retries'] += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.latency.record(loop.time() - started)
+            return result
+
+    async def _hedged(self, attempt):
+        delay = self.latency.percentile(0.95)
+        tasks = [asyncio.ensure_future(attempt())]
+        try:
+            if delay is None:
+                return await tasks[0]
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self._counters['hedges'] += 1
+                tasks.append(asyncio.ensure_future(attempt()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._counters['hedge_wins'] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the losing (or abandoned) attempt
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        p95 = self.latency.percentile(0.95)
+        return dict(self._counters, breaker_state=self.breaker.state, breaker_trips=self.breaker.trips,
+                    consecutive_failures=self.breaker.failures, p95_latency=p95)
@@ -0,0 +1,162 @@
+# chatbot/rules.py
+# Rule file loading, versioned rule snapshots and input normalization
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from chatbot.engine import RuleEngine
+from chatbot.fuzzy import DEFAULT_FUZZY_THRESHOLD
+from chatbot.redos import DEFAULT_MATCH_TIMEOUT
+
+# Bundled rule file; CHATBOT_RULES_FILE points the app at another one
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+
+# An immutable, compiled view of one version of the rule file
+RuleSnapshot = namedtuple('RuleSnapshot', ['version', 'engine', 'path', 'mtime'])
+
+
+# Function to check that a rule field is a non-empty list of strings. A
+# bare string would otherwise be split into one-letter patterns.
+def _is_string_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(item, str) for item in value)
+
+
+# Function to load and validate a JSON or YAML rule file. Rules come back
+# frozen (tuples instead of lists) so snapshots can be shared safely.
+def load_rules(path):
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required to load YAML rule files: pip install pyyaml")
+            try:
+                data = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path}: {e}")
+        else:
+            data = json.load(f)
+
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of rules")
+    rules = []
+    seen = set()
+    for index, rule in enumerate(data):
+        if not isinstance(rule, dict) or not _is_string_list(rule.get('patterns')) \
+                or not _is_string_list(rule.get('responses')):
+            raise ValueError(f"{path}: rule {index} needs 'patterns' and 'responses' as non-empty lists of strings")
+        rule_id = rule.get('id', index)
+        if not isinstance(rule_id, (str, int)) or isinstance(rule_id, bool):
+            raise ValueError(f"{path}: rule {index} id must be a string or an integer, not {rule_id!r}")
+        if rule_id in seen:
+            raise ValueError(f"{path}: duplicate rule id {rule_id!r}")
+        seen.add(rule_id)
+        rules.append({
+            'id': rule_id,
+            'patterns': tuple(rule['patterns']),
+            'responses': tuple(rule['responses']),
+        })
+    return tuple(rules)
+
+
+# Built-in rule set
+DEFAULT_RULES = load_rules(DEFAULT_RULES_FILE)
+
+
+class RuleStore:
+    # Serve the current RuleSnapshot and swap in a new one when the rule
+    # file's mtime changes. Readers never wait: a reload happens in the one
+    # caller that wins the lock, everyone else keeps the old snapshot, and
+    # requests already holding a snapshot finish on it. Rebuilds reuse the
+    # previous engine's compiled patterns, so editing one rule only
+    # compiles that rule. A broken file keeps the last good snapshot and
+    # is reported in last_error; patterns disabled as backtracking risks
+    # are in snapshot().engine.disabled.
+    def __init__(self, path, check_interval=1.0, match_timeout=DEFAULT_MATCH_TIMEOUT,
+                 fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD):
+        self.path = path
+        self.check_interval = check_interval
+        self.match_timeout = match_timeout
+        self.fuzzy_threshold = fuzzy_threshold
+        self.last_error = None
+        self._snapshot = None
+        self._version = 0
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._reload(raise_errors=True)
+            return self._snapshot
+
+        now = time.monotonic()
+        if now >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = now + self.check_interval
+                if self._mtime() != snapshot.mtime:
+                    self._reload()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload(self, raise_errors=False):
+        mtime = self._mtime()
+        previous = self._snapshot.engine if self._snapshot else None
+        try:
+            engine = RuleEngine(load_rules(self.path), previous=previous, match_timeout=self.match_timeout,
+                                fuzzy_threshold=self.fuzzy_threshold)
+        # Anything a bad edit can raise, not just the errors load_rules
+        # reports, must leave the last good snapshot serving
+        except Exception as e:
+            self.last_error = f"{self.path}: {e}"
+            if raise_errors:
+                raise
+            # Don't retry the same broken file until it changes again
+            if self._snapshot:
+                self._snapshot = self._snapshot._replace(mtime=mtime)
+            return
+        self.last_error = None
+        self._version += 1
+        # A single attribute assignment: readers see the old or the new snapshot
+        self._snapshot = RuleSnapshot(self._version, engine, self.path, mtime)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Function to get the process-wide rule store. CHATBOT_MATCH_TIMEOUT is the
+# seconds a pattern with quantifiers may take on one input, and
+# CHATBOT_FUZZY_THRESHOLD the confidence a typo-corrected match needs
+# (0 turns either off).
+def get_rule_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RuleStore(os.getenv('CHATBOT_RULES_FILE', DEFAULT_RULES_FILE),
+                                   match_timeout=float(os.getenv('CHATBOT_MATCH_TIMEOUT', DEFAULT_MATCH_TIMEOUT)),
+                                   fuzzy_threshold=float(os.getenv('CHATBOT_FUZZY_THRESHOLD',
+                                                                   DEFAULT_FUZZY_THRESHOLD)))
+    return _store
+
+
+# Function to get the current process-wide engine
+def get_engine():
+    return get_rule_store().snapshot().engine
+
+
+# Normalize raw user input before matching
+def normalize_input(text):
+    return text.lower().strip()
@@ -0,0 +1,139 @@
+# chatbot/scheduler.py
+# Process-wide rate limiting and fair per-session queuing for AI calls
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+
+class BusyError(Exception):
+    # Raised when a request would wait longer than the scheduler allows
+    pass
+
+
+class TokenBucket:
+    # Refills continuously at `per_minute` units per minute up to `capacity`.
+    # adjust() may push the level below zero to pay back under-estimates.
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` units are available (0 when they already are)
+    def wait_time(self, amount, now):
+        self._refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def adjust(self, delta):
+        self.level = min(self.capacity, self.level - delta)
+
+    def drain(self):
+        self.level = min(self.level, 0.0)
+
+
+class FairScheduler:
+    # Admits AI calls under a requests-per-minute and a tokens-per-minute
+    # limit. Waiting calls are queued per session and granted round-robin,
+    # so one heavy session cannot starve the others. A call whose predicted
+    # (or actual) queue wait exceeds `max_wait` seconds is shed with
+    # BusyError instead of waiting. Token reservations are estimates; the
+    # usage Groq reports is settled afterwards with record_usage(). Used
+    # only from the AI event loop thread.
+    def __init__(self, requests_per_minute=30, tokens_per_minute=30000, max_wait=5.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_wait = max_wait
+        self._queues = OrderedDict()  # session -> deque of [future, tokens]
+        self._queued = 0
+        self._queued_tokens = 0
+        self._dispatcher = None
+        self._counters = {'granted': 0, 'queued': 0, 'shed': 0, 'expired': 0, 'rate_limited': 0,
+                          'usage_tokens': 0}
+
+    async def acquire(self, session, tokens):
+        tokens = min(tokens, self.tokens.capacity)
+        now = time.monotonic()
+        if not self._queued and not self.requests.wait_time(1, now) and not self.tokens.wait_time(tokens, now):
+            self._grant(tokens, now)
+            return
+
+        predicted = max(self.requests.wait_time(self._queued + 1, now),
+                        self.tokens.wait_time(self._queued_tokens + tokens, now))
+        if predicted > self.max_wait:
+            self._counters['shed'] += 1
+            raise BusyError(f"AI queue wait of {predicted:.1f}s exceeds {self.max_wait:.1f}s")
+
+        item = [asyncio.get_running_loop().create_future(), tokens]
+        self._queues.setdefault(session, deque()).append(item)
+        self._queued += 1
+        self._queued_tokens += tokens
+        self._counters['queued'] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            await asyncio.wait_for(asyncio.shield(item[0]), self.max_wait)
+        except asyncio.TimeoutError:
+            self._counters['expired'] += 1
+            raise BusyError(f"AI queue wait exceeded {self.max_wait:.1f}s")
+        finally:
+            if not item[0].done():
+                item[0].cancel()
+                self._remove(session, item)
+
+    async def _dispatch(self):
+        while self._queues:
+            session, queue = next(iter(self._queues.items()))
+            item = queue[0]
+            if item[0].done():
+                self._remove(session, item)
+                continue
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(item[1], now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self._remove(session, item)
+            self._grant(item[1], now)
+            item[0].set_result(None)
+            # Round-robin: this session goes behind everyone else still waiting
+            if session in self._queues:
+                self._queues.move_to_end(session)
+
+    def _remove(self, session, item):
+        queue = self._queues.get(session)
+        if queue is None or item not in queue:
+            return
+        queue.remove(item)
+        self._queued -= 1
+        self._queued_tokens -= item[1]
+        if not queue:
+            del self._queues[session]
+
+    def _grant(self, tokens, now):
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+        self._counters['granted'] += 1
+
+    # Settle a reservation against the tokens Groq says were used
+    def record_usage(self, reserved, used):
+        if used is None:
+            return
+        self._counters['usage_tokens'] += used
+        self.tokens.adjust(used - min(reserved, self.tokens.capacity))
+
+    # Upstream said 429: stop admitting until the buckets refill
+    def on_rate_limited(self):
+        self._counters['rate_limited'] += 1
+        self.requests.drain()
+        self.tokens.drain()
+
+    def stats(self):
+        return dict(self._counters, waiting=self._queued, sessions_waiting=len(self._queues))
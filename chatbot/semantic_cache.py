@@ -0,0 +1,148 @@
+# chatbot/semantic_cache.py
+# Near-duplicate AI response cache using local hashed n-gram vectors
+import math
+import os
+import re
+import threading
+import time
+import zlib
+
+# Words that say little about what is being asked; they are down-weighted
+# the way a corpus IDF would down-weight them
+STOP_WORDS = frozenset("""
+a an the is are was were be of to in on for and or about me my you your i it its this that
+what whats how does do did can could would should please tell explain describe define
+give show know something anything
+""".split())
+
+_WORD = re.compile(r"\w+")
+
+
+# Weight of a bigram of adjacent content words. Unigrams and trigrams
+# ignore word order, so without these "convert 5 km to miles" and
+# "convert 5 miles to km" would embed identically.
+BIGRAM_WEIGHT = 2.0
+
+
+# Function to embed text as an L2-normalized hashed feature vector: word
+# unigrams, character trigrams and bigrams of adjacent content words (stop
+# words skipped, so "what's X Y" and "explain X Y" share them), sublinear
+# term frequency, stop words down-weighted and numbers up-weighted. crc32
+# keeps it deterministic across processes. NumPy is imported on first use,
+# not with this module.
+def embed(text, dimensions=512):
+    import numpy as np
+
+    features = {}
+    previous = None
+    for word in _WORD.findall(text.lower()):
+        weight = 0.2 if word in STOP_WORDS else (3.0 if word.isdigit() else 1.0)
+        features['w:' + word] = features.get('w:' + word, 0.0) + weight
+        padded = f' {word} '
+        for i in range(len(padded) - 2):
+            gram = 'c:' + padded[i:i + 3]
+            features[gram] = features.get(gram, 0.0) + 0.5 * weight
+        if word not in STOP_WORDS:
+            if previous is not None:
+                bigram = f'b:{previous} {word}'
+                features[bigram] = features.get(bigram, 0.0) + BIGRAM_WEIGHT
+            previous = word
+
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, count in features.items():
+        h = zlib.crc32(feature.encode('utf-8'))
+        sign = 1.0 if (h >> 16) & 1 else -1.0  # signed hashing offsets collisions
+        vector[h % dimensions] += sign * (1.0 + math.log(count) if count > 1 else count)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    # Fixed-capacity ring of (vector, answer) rows held in one NumPy matrix.
+    # A lookup is a single matrix-vector product; the best row is returned
+    # when its cosine similarity reaches `threshold`. Rows expire after
+    # `ttl` seconds and the oldest row is overwritten when full. Entries are
+    # partitioned by namespace (model, prompt and sampling settings).
+    def __init__(self, capacity=20000, threshold=0.85, ttl=3600, dimensions=512):
+        import numpy as np
+
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.dimensions = dimensions
+        self._vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._namespaces = [None] * capacity
+        self._answers = [None] * capacity
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0}
+
+    # Return (answer, similarity) for the closest live entry, or (None, best)
+    def lookup(self, query, namespace=None):
+        import numpy as np
+
+        vector = embed(query, self.dimensions)
+        with self._lock:
+            if not self._size:
+                self._counters['misses'] += 1
+                return None, 0.0
+            scores = self._vectors[:self._size] @ vector
+            scores[self._expires[:self._size] <= time.time()] = -1.0
+            # Try the best few rows until one in our namespace clears the bar
+            k = min(8, self._size)
+            top = np.argpartition(scores, -k)[-k:]
+            for row in top[np.argsort(scores[top])[::-1]]:
+                score = float(scores[row])
+                if score < self.threshold:
+                    break
+                if self._namespaces[row] == namespace:
+                    self._counters['hits'] += 1
+                    return self._answers[row], score
+            self._counters['misses'] += 1
+            return None, float(scores.max())
+
+    def add(self, query, answer, namespace=None):
+        vector = embed(query, self.dimensions)
+        with self._lock:
+            row = self._next
+            self._vectors[row] = vector
+            self._expires[row] = time.time() + self.ttl
+            self._namespaces[row] = namespace
+            self._answers[row] = answer
+            self._next = (row + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def clear(self):
+        with self._lock:
+            self._answers = [None] * self.capacity
+            self._namespaces = [None] * self.capacity
+            self._size = 0
+            self._next = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=self._size)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Function to get the process-wide semantic cache, or None when disabled
+# (CHATBOT_SEMANTIC_CACHE=0). CHATBOT_SEMANTIC_THRESHOLD sets the
+# similarity cut-off and CHATBOT_SEMANTIC_CAPACITY the number of rows.
+def get_semantic_cache():
+    global _cache
+    if os.getenv('CHATBOT_SEMANTIC_CACHE', '1') == '0':
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache(
+                    capacity=int(os.getenv('CHATBOT_SEMANTIC_CAPACITY', 20000)),
+                    threshold=float(os.getenv('CHATBOT_SEMANTIC_THRESHOLD', 0.85)),
+                    ttl=float(os.getenv('CHATBOT_AI_CACHE_TTL', 3600)),
+                )
+    return _cache
@@ -0,0 +1,222 @@
+# chatbot/server.py
+# Headless HTTP chat API: the same rules and AI fallback as the app, no Streamlit
+#
+#   python -m chatbot.server --port 8000 --workers 4
+#
+#   POST /chat        {"message": "hi", "session": "optional id"}
+#   POST /chat/batch  {"messages": ["hi", "what is ai"], "session": "optional id"}
+#   GET  /health      rules version and any disabled rule patterns
+#   GET  /metrics     Prometheus text format, for this worker process
+import argparse
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chatbot.metrics import CONTENT_TYPE, render_metrics
+from chatbot.pipeline import answer, answer_with_ai, match_rule
+from chatbot.rules import get_rule_store
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH_MESSAGES = 1000
+# Concurrent AI fallbacks per batch request (rule hits never use it)
+BATCH_AI_CONCURRENCY = 8
+
+_ai_pool = None
+_ai_pool_lock = threading.Lock()
+
+
+class BadRequest(Exception):
+    pass
+
+
+# Function to turn a Turn into the JSON reply for one message
+def turn_to_json(message, turn):
+    return {
+        "message": message,
+        "response": turn.response,
+        "source": turn.source,
+        "rule_id": turn.rule_id,
+        "pattern": turn.pattern,
+        "rules_version": turn.rules_version,
+        "cache": turn.cache_status,
+    }
+
+
+# Function to answer one /chat body
+def chat(body):
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise BadRequest("'message' must be a non-empty string")
+    return turn_to_json(message, answer(message, body.get("session")))
+
+
+# Function to get the thread pool batch requests share for AI fallbacks,
+# created once on first use
+def get_ai_pool():
+    global _ai_pool
+    if _ai_pool is None:
+        with _ai_pool_lock:
+            if _ai_pool is None:
+                _ai_pool = ThreadPoolExecutor(BATCH_AI_CONCURRENCY, thread_name_prefix="batch-ai")
+    return _ai_pool
+
+
+# Function to answer one /chat/batch body. Every message is matched against
+# the same rule snapshot; only rule misses go to the AI, a few at a time.
+def chat_batch(body):
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        raise BadRequest("'messages' must be a list of strings")
+    if len(messages) > MAX_BATCH_MESSAGES:
+        raise BadRequest(f"at most {MAX_BATCH_MESSAGES} messages per batch")
+    session = body.get("session")
+    snapshot = get_rule_store().snapshot()
+    results = [None] * len(messages)
+    misses = []
+    for i, message in enumerate(messages):
+        turn = match_rule(message, snapshot)
+        if turn is None:
+            misses.append(i)
+        else:
+            results[i] = turn_to_json(message, turn)
+    if misses:
+        turns = get_ai_pool().map(lambda i: answer_with_ai(messages[i], session, snapshot), misses)
+        for i, turn in zip(misses, turns):
+            results[i] = turn_to_json(messages[i], turn)
+    return {"results": results}
+
+
+ROUTES = {
+    "/chat": chat,
+    "/chat/batch": chat_batch,
+}
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    server_version = "RuleBasedChatbot/1.0"
+
+    def do_POST(self):
+        started = time.perf_counter()
+        route = ROUTES.get(self.path.split("?", 1)[0])
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        # Replies sent before the body is read close the connection: the
+        # unread body would otherwise be taken for the next request
+        if route is None:
+            self.close_connection = True
+            return self._reply(404, {"error": "not found"}, started)
+        if length < 0:
+            self.close_connection = True
+            return self._reply(400, {"error": "invalid Content-Length"}, started)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._reply(413, {"error": "request body too large"}, started)
+        try:
+            body = json.loads(self.rfile.read(length) or b"null")
+            if not isinstance(body, dict):
+                raise BadRequest("request body must be a JSON object")
+            result = route(body)
+        except (ValueError, BadRequest) as e:
+            return self._reply(400, {"error": str(e)}, started)
+        except Exception:
+            logger.exception("Chat request failed")
+            return self._reply(500, {"error": "internal error"}, started)
+        self._reply(200, result, started)
+
+    def do_GET(self):
+        started = time.perf_counter()
+        if self.path == "/metrics":
+            return self._reply(200, render_metrics().encode("utf-8"), started, CONTENT_TYPE)
+        if self.path != "/health":
+            return self._reply(404, {"error": "not found"}, started)
+        snapshot = get_rule_store().snapshot()
+        disabled = [{"rule_id": rule_id, "pattern": pattern, "problem": problem}
+                    for pattern, (rule_id, problem) in snapshot.engine.disabled.items()]
+        self._reply(200, {"status": "ok", "rules_version": snapshot.version, "disabled_patterns": disabled}, started)
+
+    def _reply(self, status, payload, started, content_type="application/json; charset=utf-8"):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        # Time spent in the server, excluding the network
+        self.send_header("Server-Timing", f"app;dur={(time.perf_counter() - started) * 1000:.3f}")
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Per-request access logs on stderr would cost more than a rule match
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class ChatServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+# Function to create a server bound to host:port (port 0 picks a free one)
+def make_server(host="127.0.0.1", port=8000):
+    return ChatServer((host, port), ChatRequestHandler)
+
+
+# Function to serve forever with `workers` processes sharing one listening
+# socket. Each worker forks before any rules, caches or AI client exist,
+# so every process builds its own on first use; CHATBOT_AI_WORKERS tells
+# each AI client to take only its share of the rate limits, unless it is
+# already set for a larger deployment. Threads serve the connections
+# inside each process.
+def serve(host="127.0.0.1", port=8000, workers=1):
+    server = make_server(host, port)
+    logger.info("Chat API listening on http://%s:%d with %d worker(s)", host, server.server_port, workers)
+    children = []
+    if workers > 1 and hasattr(os, "fork"):
+        os.environ.setdefault("CHATBOT_AI_WORKERS", str(workers))
+        for _ in range(workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                children = []
+                break
+            children.append(pid)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless HTTP API for the rule-based chatbot")
+    parser.add_argument("--host", default=os.getenv("CHATBOT_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("CHATBOT_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CHATBOT_WORKERS", os.cpu_count() or 1)))
+    args = parser.parse_args()
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
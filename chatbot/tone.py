@@ -0,0 +1,43 @@
+# chatbot/tone.py
+# Emoji decoration for assistant responses, picked from keywords by priority
+
+# Emojis that already open a response, so it isn't decorated twice
+DECORATION_EMOJIS = ('😊', '👋', '🤖', '💡', '🚀', '📊', '⚠️', '🤔', '👍', '✨', '🙏', '😄')
+
+# (emoji, keywords) from highest to lowest priority: the first tone with a
+# keyword anywhere in the lowercased response wins
+TONES = (
+    ("👋", ("hello", "hi")),
+    ("😊", ("thank",)),
+    ("😔", ("sorry",)),
+    ("🤝", ("help", "assist")),
+    ("👨‍💻", ("created", "developer")),
+    ("🚀", ("capabilities", "can you")),
+    ("📊", ("data", "weather", "temperature")),
+    ("⚠️", ("error", "trouble")),
+    ("🤔", ("?",)),
+    ("👍", ("yes", "sure", "correct", "right")),
+    ("🙏", ("welcome", "please", "glad")),
+    ("😄", ("joke", "funny", "laugh")),
+    ("✨", ("awesome", "amazing", "excellent", "great")),
+)
+DEFAULT_TONE = "💡"
+
+# Flattened (keyword, emoji) table in priority order
+_KEYWORDS = tuple((keyword, emoji) for emoji, keywords in TONES for keyword in keywords)
+
+
+# Function to pick the emoji that prefixes an assistant response ("" for
+# none). Lowercases once, then stops at the first keyword in priority order.
+def classify_tone(content):
+    if not content:
+        return ""
+    head = content[:4]
+    for emoji in DECORATION_EMOJIS:
+        if emoji in head:
+            return ""
+    lowered = content.lower()
+    for keyword, emoji in _KEYWORDS:
+        if keyword in lowered:
+            return emoji
+    return DEFAULT_TONE
@@ -0,0 +1,274 @@
+# chatbot/tracing.py
+# Per-turn tracing: one span per stage, sampled per turn, exported in
+# batches (OTLP JSON) to a local file or an OTLP/HTTP collector
+#
+#   CHATBOT_TRACE_FILE=traces.jsonl CHATBOT_TRACE_SAMPLE=0.05 streamlit run app.py
+#   CHATBOT_TRACE_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces python -m chatbot.server
+import contextlib
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Span being recorded in this thread (or task); None when the turn isn't sampled
+_current = contextvars.ContextVar('chatbot_span', default=None)
+
+# Spans time with perf_counter_ns (the clock the metrics use); this converts
+# to Unix time on export
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+
+class Span:
+    # One timed stage of a turn. Used as a context manager it becomes the
+    # parent of spans started inside it and ends on exit, marking errors.
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'start', 'end_time', 'attributes',
+                 'error', '_token')
+    recording = True
+
+    # Ids are kept as ints and only formatted as hex on export
+    def __init__(self, tracer, trace_id, parent_id, name, start=None, attributes=None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter_ns() if start is None else start
+        self.end_time = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    # Start a child span; with `end` it is recorded as already finished
+    def child(self, name, start=None, end=None, attributes=None, error=None):
+        span = Span(self.tracer, self.trace_id, self.span_id, name, start, attributes)
+        span.error = error
+        if end is not None:
+            span.end(end)
+        return span
+
+    def end(self, at=None):
+        if self.end_time is None:
+            self.end_time = time.perf_counter_ns() if at is None else at
+            self.tracer.exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    # Stands in for a span of an unsampled turn; every call does nothing
+    recording = False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def child(self, name, start=None, end=None, attributes=None, error=None):
+        return self
+
+    def end(self, at=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# Function to get the span being recorded here, or None. Instrumented code
+# checks this first, so an unsampled turn costs one context variable read
+# (bound directly, without a Python-level call).
+current_span = _current.get
+
+
+# Function to make `span` the current span inside a with block without
+# ending it on exit, for a span that outlives one call (a Streamlit turn
+# stays open across st.rerun())
+@contextlib.contextmanager
+def use_span(span):
+    if not span.recording:
+        yield span
+        return
+    token = _current.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+
+
+class Tracer:
+    # Decides per turn whether to trace it (`sample_rate`, 0..1) and hands
+    # finished spans to `exporter`. Without an exporter nothing is sampled.
+    def __init__(self, exporter=None, sample_rate=0.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate if exporter is not None else 0.0
+
+    def start_trace(self, name, attributes=None):
+        if self.sample_rate <= 0.0 or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return NOOP_SPAN
+        return Span(self, random.getrandbits(128), None, name, attributes=attributes)
+
+
+# Function to turn an attribute value into an OTLP AnyValue
+def _any_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# Function to build an OTLP/JSON ExportTraceServiceRequest for a batch of spans
+def otlp_payload(spans, service_name="rule-based-chatbot"):
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{
+            "scope": {"name": "chatbot"},
+            "spans": [{
+                "traceId": f"{span.trace_id:032x}",
+                "spanId": f"{span.span_id:016x}",
+                "parentSpanId": f"{span.parent_id:016x}" if span.parent_id is not None else "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start + _EPOCH_OFFSET_NS),
+                "endTimeUnixNano": str(span.end_time + _EPOCH_OFFSET_NS),
+                "attributes": [{"key": key, "value": _any_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            } for span in spans],
+        }],
+    }]}
+
+
+class FileSink:
+    # Appends one OTLP/JSON request per batch, as a line of JSON
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, spans):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(otlp_payload(spans), separators=(',', ':')) + '\n')
+
+
+class OTLPHttpSink:
+    # POSTs each batch to an OTLP/HTTP JSON endpoint (.../v1/traces)
+    def __init__(self, endpoint, timeout=5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def __call__(self, spans):
+        import urllib.request
+
+        data = json.dumps(otlp_payload(spans), separators=(',', ':')).encode('utf-8')
+        request = urllib.request.Request(self.endpoint, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchExporter:
+    # Collects finished spans and writes them from one background thread
+    # every `interval` seconds, max_batch spans per sink call, so the turn
+    # never waits on I/O. Exporting is a deque append: no lock, no wakeup.
+    # Past max_queue pending spans new ones are dropped and counted; a
+    # failing sink loses its batch.
+    def __init__(self, sink, max_batch=512, interval=1.0, max_queue=20000):
+        self.sink = sink
+        self.max_batch = max_batch
+        self.interval = interval
+        self.max_queue = max_queue
+        self._spans = deque()
+        self._flushes = []
+        self._wake = threading.Event()
+        self._counters = {'exported': 0, 'batches': 0, 'dropped': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="chatbot-tracing", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        if len(self._spans) < self.max_queue:
+            self._spans.append(span)
+        else:
+            with self._lock:
+                self._counters['dropped'] += 1
+
+    # Wait until every span exported so far has been handed to the sink
+    def flush(self, timeout=5.0):
+        done = threading.Event()
+        with self._lock:
+            self._flushes.append(done)
+        self._wake.set()
+        return done.wait(timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=len(self._spans))
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                flushes, self._flushes = self._flushes, []
+            # Only what is here now, so a steady stream of spans can't hold up flushes
+            pending = len(self._spans)
+            while pending:
+                batch = [self._spans.popleft() for _ in range(min(pending, self.max_batch))]
+                pending -= len(batch)
+                self._write(batch)
+            for done in flushes:
+                done.set()
+
+    def _write(self, batch):
+        try:
+            self.sink(batch)
+        except Exception:
+            with self._lock:
+                self._counters['errors'] += 1
+            return
+        with self._lock:
+            self._counters['exported'] += len(batch)
+            self._counters['batches'] += 1
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+# Function to get the process-wide tracer. CHATBOT_TRACE_FILE (JSON lines)
+# or CHATBOT_TRACE_OTLP_ENDPOINT turn it on; CHATBOT_TRACE_SAMPLE is the
+# share of turns traced (default 0.01).
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                sink = None
+                if os.getenv('CHATBOT_TRACE_OTLP_ENDPOINT'):
+                    sink = OTLPHttpSink(os.getenv('CHATBOT_TRACE_OTLP_ENDPOINT'))
+                elif os.getenv('CHATBOT_TRACE_FILE'):
+                    sink = FileSink(os.getenv('CHATBOT_TRACE_FILE'))
+                exporter = BatchExporter(sink) if sink is not None else None
+                _tracer = Tracer(exporter, float(os.getenv('CHATBOT_TRACE_SAMPLE', 0.01)))
+    return _tracer
@@ -1,61 +1,903 @@
-import pytest
-import re
-import os
-from unittest.mock import patch, MagicMock
-
-# Import functions from app.py
-# We need to mock streamlit
-with patch('streamlit.session_state', new_callable=dict):
-    import app
-
-# Test rule pattern matching
-def test_pattern_matching():
-    # Setup test environment
-    with patch('streamlit.session_state', {'rules': [
-        {
-            'patterns': [r'hello|hi|hey|greetings', r'^hi$'],
-            'responses': ["Hello! How can I help you today?", "Hi there! What can I assist you with?"]
-        },
-        {
-            'patterns': [r'who are you|what are you|tell me about yourself'],
-            'responses': ["I'm a rule-based chatbot with AI capabilities."]
-        },
-    ]}):
-        # Test hello pattern
-        with patch('random.choice', return_value="Hello! How can I help you today?"):
-            response = app.find_response("hello")
-            assert response == "Hello! How can I help you today?"
-        
-        # Test "who are you" pattern
-        with patch('random.choice', return_value="I'm a rule-based chatbot with AI capabilities."):
-            response = app.find_response("who are you")
-            assert response == "I'm a rule-based chatbot with AI capabilities."
-        
-        # Test that unknown queries are handled by AI
-        with patch('app.get_ai_response', return_value="This is an AI response"):
-            response = app.find_response("something completely random")
-            assert response == "This is an AI response"
-
-# Test AI fallback
-def test_ai_fallback():
-    # Mock Groq API response
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "This is a mock AI response"
-    
-    # Test successful API call
-    with patch('streamlit.spinner', MagicMock()):
-        with patch('groq.Groq.chat.completions.create', return_value=mock_response):
-            response = app.get_ai_response("complex query")
-            assert response == "This is a mock AI response"
-    
-    # Test API error handling
-    with patch('streamlit.spinner', MagicMock()):
-        with patch('groq.Groq.chat.completions.create', side_effect=Exception("API Error")):
-            with patch('streamlit.error', MagicMock()):
-                response = app.get_ai_response("complex query")
-                assert "I'm having trouble connecting" in response
-
-# Run the tests
-if __name__ == "__main__":
+import pytest
+import re
+import os
+import json
+import asyncio
+import threading
+import gc
+import tempfile
+import time
+from unittest.mock import patch, MagicMock
+
+# Import functions from app.py (importing it has no Streamlit side effects)
+import app
+
+from chatbot import DEFAULT_RULES, MatchResult, RuleEngine, RuleMatch, RuleStore, match_many
+from chatbot.ai import AIClient, build_messages, estimate_tokens
+from chatbot.context import ConversationContext
+from chatbot.resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy
+from chatbot.scheduler import BusyError, FairScheduler
+from chatbot.cache import ResponseCache, make_cache_key
+from chatbot.history import QueryHistory
+from chatbot.messages import Message, MessageStore, memory_report
+from chatbot.persistence import ConversationStore
+from chatbot.pipeline import ai_cache_key, answer
+from chatbot.prefilter import LiteralAutomaton, extract_literals
+from chatbot.semantic_cache import SemanticCache, embed
+from chatbot.tone import TONES, classify_tone
+
+# Give every test its own empty AI response caches and an offline AI client
+@pytest.fixture(autouse=True)
+def fresh_ai_cache():
+    cache = ResponseCache()
+    semantic = SemanticCache(capacity=100)
+    client = AIClient(api_key="test", prewarm=False)
+    with patch('app.get_response_cache', return_value=cache), \
+            patch('chatbot.pipeline.get_response_cache', return_value=cache), \
+            patch('app.get_semantic_cache', return_value=semantic), \
+            patch('chatbot.pipeline.get_semantic_cache', return_value=semantic), \
+            patch('app.get_ai_client', return_value=client), \
+            patch('chatbot.pipeline.get_ai_client', return_value=client):
+        yield cache
+
+async def async_iter(items):
+    for item in items:
+        yield item
+
+# Test rule pattern matching
+def test_pattern_matching():
+    # Setup test environment
+    engine = RuleEngine([
+        {
+            'patterns': [r'hello|hi|hey|greetings', r'^hi$'],
+            'responses': ["Hello! How can I help you today?", "Hi there! What can I assist you with?"]
+        },
+        {
+            'patterns': [r'who are you|what are you|tell me about yourself'],
+            'responses': ["I'm a rule-based chatbot with AI capabilities."]
+        },
+    ])
+    with patch('app.get_engine', return_value=engine):
+        # Test hello pattern
+        with patch('random.choice', return_value="Hello! How can I help you today?"):
+            response = app.find_response("hello")
+            assert response == "Hello! How can I help you today?"
+        
+        # Test "who are you" pattern
+        with patch('random.choice', return_value="I'm a rule-based chatbot with AI capabilities."):
+            response = app.find_response("who are you")
+            assert response == "I'm a rule-based chatbot with AI capabilities."
+        
+        # Test that unknown queries are handled by AI
+        with patch('app.get_ai_response', return_value="This is an AI response"):
+            response = app.find_response("explain quantum entanglement")
+            assert response == "This is an AI response"
+
+# Test AI fallback
+def test_ai_fallback(fresh_ai_cache):
+    # Mock Groq API response
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = "This is a mock AI response"
+    
+    # Test successful API call
+    with patch('streamlit.spinner', MagicMock()):
+        with patch.object(app.get_ai_client(), '_create', return_value=mock_response):
+            response = app.get_ai_response("complex query")
+            assert response == "This is a mock AI response"
+    
+    # Test API error handling
+    fresh_ai_cache.clear()
+    app.get_semantic_cache().clear()
+    with patch('streamlit.spinner', MagicMock()):
+        with patch.object(app.get_ai_client(), '_create', side_effect=Exception("API Error")):
+            with patch('streamlit.error', MagicMock()):
+                response = app.get_ai_response("complex query")
+                assert "I'm having trouble connecting" in response
+
+# Test streaming AI responses into a placeholder
+def test_ai_streaming():
+    def chunk(text):
+        c = MagicMock()
+        c.choices = [MagicMock()]
+        c.choices[0].delta.content = text
+        return c
+
+    placeholder = MagicMock()
+    chunks = [chunk("Quantum "), chunk(None), chunk("computing"), chunk("!")]
+    with patch.object(app.get_ai_client(), '_create', return_value=async_iter(chunks)) as create:
+        text, ttft, total, cache_hit = app.render_ai_stream("what is quantum computing", placeholder)
+    assert text == "Quantum computing!"
+    assert 0 <= ttft <= total
+    assert cache_hit == "miss"
+    assert create.call_args.kwargs['stream'] is True
+    assert placeholder.markdown.called
+
+    # The completed answer is served from the cache next time
+    with patch.object(app.get_ai_client(), '_create') as create:
+        text, _, _, cache_hit = app.render_ai_stream("What is quantum computing ", MagicMock())
+    assert (text, cache_hit) == ("Quantum computing!", "exact")
+    create.assert_not_called()
+
+    with patch.object(app.get_ai_client(), '_create', side_effect=Exception("API Error")):
+        with patch('streamlit.error', MagicMock()):
+            text, ttft, total, cache_hit = app.render_ai_stream("complex query", MagicMock())
+    assert "I'm having trouble connecting" in text
+
+# Test that concurrent identical AI requests share one upstream call
+def test_ai_single_flight():
+    client = AIClient(api_key="test", prewarm=False).start()
+    release = threading.Event()
+
+    async def slow_create(messages, stream):
+        client._counters['upstream_calls'] += 1
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+        if stream:
+            return async_iter([MagicMock(choices=[MagicMock(delta=MagicMock(content=t))]) for t in ("a", "b")])
+        return MagicMock(choices=[MagicMock(message=MagicMock(content="shared"))])
+
+    with patch.object(client, '_create', side_effect=slow_create):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.complete([{"role": "user", "content": "q"}])))
+                   for _ in range(5)]
+        threads += [threading.Thread(target=lambda: results.append("".join(client.stream([{"role": "user", "content": "q"}]))))
+                    for _ in range(3)]
+        for t in threads:
+            t.start()
+        while client.stats()['requests'] < 8:
+            threading.Event().wait(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+
+    assert sorted(results) == ["ab"] * 3 + ["shared"] * 5
+    assert client.stats()['upstream_calls'] == 2
+    assert client.stats()['coalesced'] == 6
+
+# Test retries, the circuit breaker and hedged requests
+def test_resilience_policy():
+    import groq
+    import httpx
+
+    def connection_error():
+        return groq.APIConnectionError(request=httpx.Request("POST", "https://api.groq.com"))
+
+    async def run(policy, attempt, **kwargs):
+        return await policy.call(attempt, **kwargs)
+
+    # Retryable errors are retried, then succeed
+    calls = []
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise connection_error()
+        return "ok"
+    policy = ResiliencePolicy(max_retries=2, backoff_base=0.001)
+    assert asyncio.run(run(policy, flaky)) == "ok"
+    assert policy.stats()['retries'] == 2
+
+    # Non-retryable errors are raised at once
+    async def bad_request():
+        raise ValueError("bad request")
+    with pytest.raises(ValueError):
+        asyncio.run(run(policy, bad_request))
+
+    # Consecutive failures open the breaker, which then fails fast
+    async def down():
+        raise connection_error()
+    policy = ResiliencePolicy(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+        with pytest.raises(groq.APIConnectionError):
+            asyncio.run(run(policy, down))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(run(policy, flaky))
+    assert policy.stats()['breaker_state'] == 'open'
+    assert policy.stats()['short_circuits'] == 1
+
+    # Half-open after the reset timeout: one probe closes it again
+    policy.breaker.opened_at -= 61
+    assert asyncio.run(run(policy, flaky)) == "ok"
+    assert policy.stats()['breaker_state'] == 'closed'
+
+    # The budget bounds slow attempts
+    async def slow():
+        await asyncio.sleep(1)
+    policy = ResiliencePolicy(max_retries=5, budget=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run(policy, slow))
+
+    # A hedge fires once an attempt is slower than the recent p95
+    policy = ResiliencePolicy(hedge=True)
+    for _ in range(20):
+        policy.latency.record(0.01)
+    delays = [1.0, 0.0]
+    async def sometimes_slow():
+        await asyncio.sleep(delays.pop(0))
+        return "fast"
+    assert asyncio.run(run(policy, sometimes_slow)) == "fast"
+    assert policy.stats()['hedges'] == 1 and policy.stats()['hedge_wins'] == 1
+
+# Test the AI scheduler: round-robin across sessions, shedding and usage accounting
+def test_fair_scheduler():
+    # 20 requests/second once the burst is used up
+    scheduler = FairScheduler(requests_per_minute=1200, tokens_per_minute=10**6, max_wait=2.0)
+    scheduler.requests.level = 0
+    order = []
+
+    async def ask(session):
+        await scheduler.acquire(session, 10)
+        order.append(session)
+
+    async def run():
+        await asyncio.gather(*[ask("a") for _ in range(4)], *[ask("b") for _ in range(2)])
+    asyncio.run(run())
+    assert order == ["a", "b", "a", "b", "a", "a"]
+    assert scheduler.stats()['waiting'] == 0
+
+    # A wait longer than max_wait is shed at once
+    scheduler = FairScheduler(requests_per_minute=60, max_wait=0.5)
+    scheduler.requests.level = 0
+    with pytest.raises(BusyError):
+        asyncio.run(scheduler.acquire("a", 10))
+    assert scheduler.stats()['shed'] == 1
+
+    # Reported usage settles the reservation
+    scheduler = FairScheduler(requests_per_minute=60, tokens_per_minute=1000, max_wait=0.5)
+    asyncio.run(scheduler.acquire("a", 600))
+    scheduler.record_usage(600, 100)
+    assert scheduler.tokens.level == pytest.approx(900, abs=1)
+
+    # A shed AI call never reaches Groq, leaves the breaker alone and gets the busy message
+    client = app.get_ai_client()
+    client.scheduler = scheduler
+    scheduler.requests.level = 0
+    with patch.object(client, '_create') as create:
+        assert app.fetch_ai_response("what is dark matter", "session-1") == (app.AI_BUSY_MESSAGE, "miss")
+    create.assert_not_called()
+    assert client.stats()['breaker_state'] == 'closed'
+    assert app.get_response_cache().get(ai_cache_key("what is dark matter")) is None
+
+    # Each of several worker processes takes its share of the deployment's limits
+    from chatbot import ai
+    with patch.object(ai, '_ai_client', None), patch.object(ai.AIClient, 'start', lambda self: self), \
+            patch.dict(os.environ, {"CHATBOT_AI_RPM": "40", "CHATBOT_AI_TPM": "40000", "CHATBOT_AI_WORKERS": "4"}):
+        shared = ai.get_ai_client().scheduler
+    assert (shared.requests.capacity, shared.tokens.capacity) == (10, 10000)
+
+# Test LRU, TTL and byte bounds of the AI response cache
+def test_response_cache(tmp_path):
+    cache = ResponseCache(max_entries=2, max_bytes=10**6, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.stats()['evictions'] == 1
+
+    small = ResponseCache(max_bytes=40)
+    small.set("k1", "x" * 30)
+    small.set("k2", "y" * 30)
+    assert small.get("k1") is None and small.get("k2") == "y" * 30
+
+    with patch('time.time', return_value=10**12):
+        assert cache.get("a") is None
+    assert cache.stats()['expirations'] == 1
+
+    key = make_cache_key("q", "model", "prompt", {"temperature": 0.7})
+    assert key != make_cache_key("q", "model", "prompt", {"temperature": 0.2})
+
+    # The SQLite tier survives a restart
+    path = str(tmp_path / "cache.db")
+    ResponseCache(path=path).set(key, "persisted")
+    reopened = ResponseCache(path=path)
+    assert reopened.get(key) == "persisted"
+    assert reopened.stats()['disk_hits'] == 1
+
+# Test that paraphrased queries hit the semantic cache and unrelated ones don't
+def test_semantic_cache():
+    cache = SemanticCache(capacity=3, threshold=0.85)
+    cache.add("what's quantum computing?", "qc", namespace="n")
+    assert cache.lookup("explain quantum computing", namespace="n")[0] == "qc"
+    assert cache.lookup("explain quantum computing", namespace="other")[0] is None
+    assert cache.lookup("what is quantum physics", namespace="n")[0] is None
+    assert cache.lookup("who won the world cup 2018", namespace="n")[0] is None
+    # Word order matters: swapped units are a different question
+    cache.add("convert 5 km to miles", "3.1 miles", namespace="n")
+    assert cache.lookup("convert 5 miles to km", namespace="n")[0] is None
+    assert embed("convert 5 km to miles") @ embed("convert 5 miles to km") < 0.85
+    assert cache.lookup("please convert 5 km to miles", namespace="n")[0] == "3.1 miles"
+    assert embed("same text") @ embed("same text") == pytest.approx(1.0)
+
+    # Full ring: the oldest row is overwritten
+    for i in range(3):
+        cache.add(f"filler question number {i}", "f", namespace="n")
+    assert cache.lookup("explain quantum computing", namespace="n")[0] is None
+    assert cache.stats()['entries'] == 3
+
+    with patch.object(app.get_ai_client(), '_create') as create:
+        app.store_ai_response("What's quantum computing?", "cached qc")
+        assert app.fetch_ai_response("explain quantum computing") == ("cached qc", "semantic")
+        create.assert_not_called()
+
+# Test that the combined matcher keeps first-match priority
+def test_rule_engine_priority():
+    engine = RuleEngine(DEFAULT_RULES)
+    queries = [
+        "hello", "hi", "what is ai", "what is ml, hello", "tell me a joke",
+        "future of ai", "tell me something in हिन्दी", "something completely random",
+        "what is machine learning and why", "is ai dangerous?", "",
+    ]
+    for query in queries:
+        expected = None
+        for rule in DEFAULT_RULES:
+            pattern = next((p for p in rule['patterns'] if re.search(p, query)), None)
+            if pattern:
+                expected = (rule['id'], pattern)
+                break
+        match = engine.match(query)
+        assert (match and (match.rule_id, match.pattern)) == (expected or None)
+
+    with patch('random.choice', return_value="picked"):
+        assert engine.match("bye") == RuleMatch('farewell', r'bye|goodbye|see you|farewell', "picked")
+
+# Test that invalid patterns are reported with their rule
+def test_rule_engine_invalid_pattern():
+    with pytest.raises(ValueError, match="broken"):
+        RuleEngine([{'id': 'broken', 'patterns': [r'(unclosed'], 'responses': ["x"]}])
+
+# Test literal extraction used by the prefilter
+def test_extract_literals():
+    assert extract_literals(r'joke|tell me a joke') == {'joke', 'tell me a joke'}
+    assert extract_literals(r'what is (ml|machine learning)') == {'what is ml', 'what is machine learning'}
+    assert extract_literals(r'^hi$') == {'hi'}
+    assert extract_literals(r'colou?r') == {'colo'}
+    assert extract_literals(r'.*') is None
+    assert extract_literals(r'(?i)hello') is None
+
+    automaton = LiteralAutomaton({'he': {1}, 'she': {2}, 'hers': {3}, 'his': {4}})
+    assert automaton.find("ushers") == {1, 2, 3}
+
+# Test that the prefiltered engine agrees with a full linear scan
+def test_prefilter_matches_linear_scan():
+    rules = list(DEFAULT_RULES) + [
+        {'id': 'wildcard', 'patterns': [r'^\w+\?$'], 'responses': ["?"]},
+        {'id': 'nocase', 'patterns': [r'(?i)QUANTUM'], 'responses': ["q"]},
+    ]
+    filtered = RuleEngine(rules)
+    linear = RuleEngine(rules, prefilter=False)
+    pieces = [p for rule in DEFAULT_RULES for p in re.split(r'[|()^$]', ''.join(rule['patterns'])) if p]
+    queries = pieces + [a + " " + b for a, b in zip(pieces, reversed(pieces))] + [
+        "hi", "bye", "why?", "quantum computing", "tell me something in मराठी please", "",
+    ]
+    for query in queries:
+        assert filtered.lookup(query) == linear.lookup(query), query
+
+# Test hot reload of the rule file into versioned snapshots
+def test_rule_store_reload(tmp_path):
+    path = tmp_path / "rules.json"
+    rules = [
+        {'id': 'joke', 'patterns': ['joke'], 'responses': ["ha"]},
+        {'id': 'bye', 'patterns': ['bye'], 'responses': ["later"]},
+    ]
+    path.write_text(json.dumps(rules))
+    store = RuleStore(str(path), check_interval=0)
+
+    first = store.snapshot()
+    assert first.version == 1
+    assert first.engine.match("bye").rule_id == 'bye'
+
+    # Edit one rule; the untouched pattern is reused, not recompiled
+    rules[1]['patterns'] = ['goodbye']
+    path.write_text(json.dumps(rules))
+    os.utime(path, ns=(first.mtime + 10**9, first.mtime + 10**9))
+    second = store.snapshot()
+    assert second.version == 2
+    assert second.engine.match("bye") is None
+    assert second.engine._compiled['joke'] is first.engine._compiled['joke']
+    # The old snapshot is untouched for requests still using it
+    assert first.engine.match("bye").rule_id == 'bye'
+
+    # A broken file keeps serving the last good snapshot
+    path.write_text("{not json")
+    os.utime(path, ns=(first.mtime + 2 * 10**9, first.mtime + 2 * 10**9))
+    assert store.snapshot().version == 2
+    assert store.last_error
+
+    # Bad edits that are valid JSON or YAML are rejected the same way
+    bad_edits = [
+        ("rules.json", json.dumps([{'id': 'x', 'patterns': [1], 'responses': ["r"]}])),
+        ("rules.json", json.dumps([{'id': ["a"], 'patterns': ['x'], 'responses': ["r"]}])),
+        ("rules.json", json.dumps([{'id': 'x', 'patterns': "hello", 'responses': ["r"]}])),
+        ("rules.json", json.dumps([{'id': 'x', 'patterns': ['x'], 'responses': "hello"}])),
+        ("rules.yaml", "- id: x\n  patterns: [unclosed\n"),
+    ]
+    for step, (name, text) in enumerate(bad_edits, 3):
+        path = tmp_path / name
+        path.write_text(text)
+        os.utime(path, ns=(first.mtime + step * 10**9, first.mtime + step * 10**9))
+        store.path = str(path)
+        store.last_error = None
+        assert store.snapshot().version == 2, text
+        assert store.last_error, text
+        assert store.snapshot().engine.match("goodbye").rule_id == 'bye'
+
+# Test batched offline matching, in-process and over a process pool
+def test_match_many():
+    engine = RuleEngine(DEFAULT_RULES)
+    queries = ["Hello", "  what is ML?", "explain quantum entanglement", "BYE"] * 50
+    expected = [
+        MatchResult(q, *((e.rule_id, e.pattern) if e else (None, None)))
+        for q, e in ((q, engine.lookup(q.lower().strip())) for q in queries)
+    ]
+    with patch('app.get_ai_response') as ai:
+        assert list(match_many(iter(queries), engine=engine)) == expected
+        assert list(match_many(queries, engine=engine, workers=2, chunk_size=7, min_parallel=10)) == expected
+        ai.assert_not_called()
+
+# Test the headless HTTP API over one kept-alive connection
+def test_http_api():
+    import http.client
+    from chatbot.server import make_server
+
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+
+    def post(path, body):
+        conn.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read()), response.getheader("Server-Timing")
+
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = "Dark matter is..."
+    try:
+        status, reply, timing = post("/chat", {"message": "Hello there"})
+        assert status == 200 and reply["source"] == "rule" and reply["rule_id"] == "greeting"
+        assert timing.startswith("app;dur=")
+
+        with patch.object(app.get_ai_client(), '_create', return_value=mock_response):
+            status, reply, _ = post("/chat/batch", {"messages": ["thanks", "explain dark matter"], "session": "s1"})
+        assert status == 200
+        assert [r["source"] for r in reply["results"]] == ["rule", "ai"]
+        assert reply["results"][1]["response"] == "Dark matter is..."
+
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        assert response.status == 200 and response.getheader("Content-Type").startswith("text/plain; version=0.0.4")
+        assert 'chatbot_rule_hits_total{rule_id="greeting"' in response.read().decode("utf-8")
+
+        assert post("/chat", {"text": "hi"})[0] == 400
+        assert post("/nowhere", {})[0] == 404
+
+        # A body left unread is never parsed as the next request: the connection closes
+        import socket
+        with socket.create_connection(("127.0.0.1", server.server_port), timeout=10) as raw:
+            body = b'{"message": "hi"}'
+            raw.sendall(b"POST /chat HTTP/1.1\r\nHost: x\r\nContent-Length: ten\r\n\r\n" + body +
+                        b"POST /chat HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            received = b""
+            while chunk := raw.recv(65536):
+                received += chunk
+        assert received.startswith(b"HTTP/1.1 400") and received.count(b"HTTP/1.1 ") == 1
+        assert b"Connection: close" in received
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+
+# Milliseconds a fresh interpreter may spend importing the core modules
+CORE_IMPORT_BUDGET_MS = {'chatbot': 60, 'chatbot.pipeline': 200, 'chatbot.server': 300}
+
+# Test that importing the core is fast and loads no Streamlit, Groq, httpx or NumPy
+def test_core_import_budget():
+    import subprocess
+    import sys
+
+    probe = (
+        "import sys, time; t = time.perf_counter(); import {module}; "
+        "print((time.perf_counter() - t) * 1000); "
+        "print(','.join(m for m in ('streamlit', 'groq', 'httpx', 'numpy', 'dotenv') if m in sys.modules))"
+    )
+    for module, budget in CORE_IMPORT_BUDGET_MS.items():
+        timings = []
+        for _ in range(3):
+            out = subprocess.run([sys.executable, "-c", probe.format(module=module)], capture_output=True,
+                                 text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            elapsed, heavy = out.splitlines()[0], (out.splitlines() + [""])[1]
+            assert heavy == "", f"import {module} pulled in {heavy}"
+            timings.append(float(elapsed))
+        assert min(timings) < budget, f"import {module} took {min(timings):.1f} ms (budget {budget} ms)"
+
+# Session state stand-in supporting both st.session_state styles
+class SessionState(dict):
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+# Test that message HTML is built once, escaped, and rendered in a bounded window
+def test_message_rendering():
+    state = SessionState(messages=MessageStore("render", spill_dir=tempfile.mkdtemp()), history_window=app.HISTORY_WINDOW)
+    with patch.object(app.st, 'session_state', state), patch.object(app.st, 'markdown') as markdown, \
+            patch.object(app.st, 'button', return_value=False) as button:
+        app.add_message("user", "<script>alert(1)</script>")
+        bot = app.add_message("assistant", "Hello! Nice to meet you", matched_pattern="hello|hi", is_pattern_match=True)
+        assert "&lt;script&gt;" in state.messages[0].html
+        assert bot.decoration == "👋"
+        assert bot.html.startswith('<div class="message bot-message">👋 Hello!') and "hello|hi" in bot.html
+
+        for i in range(100):
+            app.add_message("user", f"message {i}")
+        with patch('app.build_message_html') as build:
+            app.render_messages()
+        build.assert_not_called()
+        rendered = [call.args[0] for call in markdown.call_args_list]
+        assert len(rendered) == app.HISTORY_WINDOW
+        assert all(bubble.count('class="message') == 1 for bubble in rendered)
+        assert "message 99" in rendered[-1] and not any("message 59<" in bubble for bubble in rendered)
+        button.assert_called_once()
+
+        # "Load earlier" widens the window by one page
+        button.return_value = True
+        markdown.reset_mock()
+        app.render_messages()
+        assert markdown.call_count == 2 * app.HISTORY_WINDOW
+
+        # An unterminated code fence stays inside its own message's element
+        app.add_message("assistant", "Here is the code:\n\n```python\nprint(1)", is_pattern_match=False)
+        app.add_message("user", "thanks")
+        markdown.reset_mock()
+        app.render_messages()
+        fenced, after = (call.args[0] for call in markdown.call_args_list[-2:])
+        assert "```python" in fenced and fenced.endswith("</div>")
+        assert after == '<div class="message user-message">thanks</div>'
+
+# The decoration chain main() ran for every assistant message before classify_tone
+def legacy_decoration(content):
+    emoji_list = ['😊', '👋', '🤖', '💡', '🚀', '📊', '⚠️', '🤔', '👍', '✨', '🙏', '😄']
+    if content and not any(emoji in content[:4] for emoji in emoji_list):
+        if "hello" in content.lower() or "hi" in content.lower():
+            return "👋"
+        elif "thank" in content.lower():
+            return "😊"
+        elif "sorry" in content.lower():
+            return "😔"
+        elif "help" in content.lower() or "assist" in content.lower():
+            return "🤝"
+        elif "created" in content.lower() or "developer" in content.lower():
+            return "👨‍💻"
+        elif "capabilities" in content.lower() or "can you" in content.lower():
+            return "🚀"
+        elif any(word in content.lower() for word in ["data", "weather", "temperature"]):
+            return "📊"
+        elif "error" in content.lower() or "trouble" in content.lower():
+            return "⚠️"
+        elif "?" in content:
+            return "🤔"
+        elif any(word in content.lower() for word in ["yes", "sure", "correct", "right"]):
+            return "👍"
+        elif any(word in content.lower() for word in ["welcome", "please", "glad"]):
+            return "🙏"
+        elif any(word in content.lower() for word in ["joke", "funny", "laugh"]):
+            return "😄"
+        elif any(word in content.lower() for word in ["awesome", "amazing", "excellent", "great"]):
+            return "✨"
+        else:
+            return "💡"
+    return ""
+
+# Differential test: classify_tone picks exactly what the old branch chain did
+def test_classify_tone_matches_legacy():
+    import random
+
+    keywords = [keyword for _, group in TONES for keyword in group]
+    fragments = keywords + [k.upper() for k in keywords] + [k.title() for k in keywords] + [
+        "", " ", "x", "ok", "yesorry", "İ", "ß", "नमस्ते", "😄 ", "✨", "👋", "\n", "lorem", "ipsum", "h", "i"]
+    rng = random.Random(16)
+    samples = [""] + keywords + [
+        "".join(rng.choice(fragments) for _ in range(rng.randint(1, 12))) for _ in range(5000)]
+    for text in samples:
+        assert classify_tone(text) == legacy_decoration(text), repr(text)
+
+# Test the minified page chrome and the batched sidebar history
+def test_static_chrome():
+    css = app.minify_css("/* note */\n.a > div,\n.b {\n    color: red;\n    margin: 0 auto;\n}\n")
+    assert css == ".a>div,.b{color:red;margin:0 auto}"
+    assert app.get_page_css().startswith("<style>") and "\n" not in app.get_page_css()
+    assert app.minify_html("<div>\n    <p>Hi   there</p>\n</div>") == "<div><p>Hi there</p></div>"
+
+    sidebar = app.render_chat_history([("it's <b>bold</b>", 0), ("x" * 50, 0)])
+    assert sidebar.count('class="history-item"') == 2 and sidebar.count('class="history-container"') == 1
+    assert "<b>" not in sidebar and "value=\'it\\&#x27;s &lt;b&gt;" in sidebar
+    assert "x" * 40 + "...</div>" in sidebar
+
+# Test the compact message store: shared rule responses, bounded memory, spill log
+def test_message_store():
+    store = MessageStore("spill", window=20, max_bytes=4096, spill_dir=tempfile.mkdtemp())
+    for i in range(100):
+        store.append(Message("user", f"question {i} " + "x" * (500 if i == 50 else 0)))
+        store.append(Message("assistant", "Hello! How can I help?", "hello|hi", "rule", 3, rule_response=True))
+    assert len(store) == 200 and store.spilled + len(store._memory) == 200
+    assert len(store._memory) <= 20 and store.memory_bytes() <= 4096
+    assert store.memory_bytes() == sum(message.size() for message in store._memory)
+
+    # Rule answers share one response text and read back from the log intact
+    first, reply = store[0], store[1]
+    assert first.content == "question 0 " and reply.content == "Hello! How can I help?"
+    assert reply.text is None and reply.pattern == "hello|hi" and reply.source == "rule" and reply.rules_version == 3
+    assert [m.content for m in store[99:102]] == ["Hello! How can I help?", "question 50 " + "x" * 500,
+                                                   "Hello! How can I help?"]
+    assert store[-1] is store._memory[-1] and len(list(store)) == 200
+    assert memory_report()['spilled'] >= store.spilled
+
+    # The log goes away with the session
+    path = store.path
+    assert os.path.exists(path)
+    del store, first, reply
+    gc.collect()
+    assert not os.path.exists(path)
+
+# Test the batched conversation log: resume by session and paginated export
+def test_conversation_store(tmp_path):
+    store = ConversationStore(str(tmp_path / "chat.db"))
+    try:
+        for i in range(5):
+            store.record("a" * 32, Message("user", f"question {i % 3}"))
+            store.record("a" * 32, Message("assistant", "Hello!", "hello|hi", "rule", 2, rule_response=True))
+            store.record("b" * 32, Message("assistant", f"answer {i}", source="ai", timing=(0.1, 0.5, "miss")))
+        assert store.flush()
+        stats = store.stats()
+        assert stats['written'] == 15 and stats['dropped'] == 0 and 1 <= stats['batches'] <= 15
+
+        assert store.has_session("a" * 32) and not store.has_session("c" * 32)
+        messages = list(store.load_messages("a" * 32))
+        assert [m.content for m in messages[:2]] == ["question 0", "Hello!"]
+        assert messages[1].text is None and messages[1].pattern == "hello|hi" and messages[1].rules_version == 2
+        assert [query for query, _ in store.user_queries("a" * 32)] == [f"question {i % 3}" for i in range(5)]
+
+        # Pages are fetched by id, so a small page size still streams everything in order
+        turns = list(store.iter_turns(page_size=2))
+        assert [turn['id'] for turn in turns] == list(range(1, 16))
+        b_turns = list(store.iter_turns("b" * 32, page_size=2))
+        assert [turn['content'] for turn in b_turns] == [f"answer {i}" for i in range(5)]
+        assert b_turns[0]['ttft'] == 0.1 and b_turns[0]['cache_status'] == "miss"
+        assert [turn['id'] for turn in store.iter_turns(after=turns[-2]['id'])] == [15]
+    finally:
+        store.close()
+
+# Test the sidebar history index: dedupe, recency and ranked prefix search
+def test_query_history():
+    history = QueryHistory(max_entries=5)
+    for i, query in enumerate(["What is Python?", "python decorators explained", "weather in Pune",
+                               "What is Python?", "पुणे का मौसम"]):
+        history.add(query, timestamp=i)
+    assert len(history) == 4
+    assert [query for query, _ in history.recent(3)] == ["पुणे का मौसम", "What is Python?", "weather in Pune"]
+    assert history.recent(1) == [("पुणे का मौसम", 4)]
+
+    # Whole words outrank prefixes, then the most recently asked wins
+    assert [query for query, _ in history.search("pyth")] == ["What is Python?", "python decorators explained"]
+    assert [query for query, _ in history.search("python deco")] == ["python decorators explained"]
+    assert [query for query, _ in history.search("pune")] == ["weather in Pune"]
+    assert [query for query, _ in history.search("पुणे")] == ["पुणे का मौसम"]
+    assert history.search("w") == [] and history.search("java") == []
+    assert history.search("  ") == history.recent()
+
+    # Past max_entries the least recent query leaves the index too
+    history.add("java streams", timestamp=5)
+    history.add("rust lifetimes", timestamp=6)
+    assert len(history) == 5 and history.search("decorators") == []
+    assert "decorators" not in history._postings and "decorators" not in history._vocabulary
+    assert [query for query, _ in history.search("ja")] == ["java streams"]
+
+# Test the token-budgeted AI context: recent turns, rolling summary, bounded prompt
+def test_conversation_context():
+    context = ConversationContext(budget=80, summary_tokens=60, max_turns=6)
+    history = []
+    folded = []
+    fold = context._fold
+    with patch.object(context, '_fold', side_effect=lambda message: (folded.append(message), fold(message))):
+        for i in range(200):
+            history.append(Message("user", f"Tell me about planet number {i}. Be brief please."))
+            source = "error" if i == 3 else "ai"
+            history.append(Message("assistant", f"Planet {i} is a gas giant. It has {i} moons.", source=source))
+            prompt = build_messages("and its moons?", context.build(history))
+            # Bounded by budget + summary, however long the conversation gets
+            assert estimate_tokens(prompt) <= estimate_tokens(build_messages("and its moons?")) + 80 + 70
+    # Every message was folded exactly once, in order
+    assert folded == history[:context.covered] and context.covered > 150
+
+    turns = context.build(history)
+    assert turns[0]["role"] == "system" and turns[0]["content"].startswith("Summary of the earlier conversation:")
+    assert "Assistant: Planet 3 " not in context.summary() and "User: Tell me about planet number" in context.summary()
+    assert turns[-1] == {"role": "assistant", "content": "Planet 199 is a gas giant. It has 199 moons."}
+    assert turns[-2]["content"].startswith("Tell me about planet number 199")
+    assert estimate_tokens([{"content": "नमस्ते"}]) == 18 // 4 + 4
+
+    # Follow-ups are cached under the questions they follow, never matched semantically
+    assert ai_cache_key("and its moons?", turns) != ai_cache_key("and its moons?")
+    other = [{"role": "user", "content": "Tell me about planet number 198. Be brief please."},
+             {"role": "assistant", "content": "A different reply."}] + turns[-2:]
+    assert ai_cache_key("and its moons?", turns) == ai_cache_key("and its moons?", other)
+    # A question that stands on its own shares the cache across conversations
+    assert ai_cache_key("explain the structure of saturn's rings", turns) == \
+        ai_cache_key("explain the structure of saturn's rings")
+    assert build_messages("q", turns)[1:-1] == turns and build_messages("q")[1:] == [{"role": "user", "content": "q"}]
+
+# Test sharded metrics, turn instrumentation and the Prometheus endpoint
+def test_metrics():
+    import urllib.request
+    from chatbot import metrics
+
+    counter = metrics.Counter("test_total", "Test counter", ("kind",))
+    threads = [threading.Thread(target=lambda: [counter.inc("a") for _ in range(5000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc("b", amount=3)
+    # Shards of finished threads are folded into one total, not kept per thread
+    assert counter.values() == {("a",): 40000, ("b",): 3} and len(counter._shards) == 1
+    for _ in range(200):
+        thread = threading.Thread(target=counter.inc, args=("a",))
+        thread.start()
+        thread.join()
+    assert counter.values()[("a",)] == 40200 and len(counter._shards) == 1
+
+    histogram = metrics.Histogram("test_seconds", "Test histogram", ("stage",), buckets=(0.1, 1.0))
+    # Half from a thread that has ended: its buckets are folded into the total
+    thread = threading.Thread(target=lambda: [histogram.observe(value, 'say "hi"\n') for value in (0.5, 5.0)])
+    thread.start()
+    thread.join()
+    for value in (0.05, 0.5):
+        histogram.observe(value, 'say "hi"\n')
+    assert histogram.render() == [
+        'test_seconds_bucket{stage="say \\"hi\\"\\n",le="0.1"} 1',
+        'test_seconds_bucket{stage="say \\"hi\\"\\n",le="1.0"} 3',
+        'test_seconds_bucket{stage="say \\"hi\\"\\n",le="+Inf"} 4',
+        'test_seconds_sum{stage="say \\"hi\\"\\n"} 6.05',
+        'test_seconds_count{stage="say \\"hi\\"\\n"} 4',
+    ]
+
+    # Turns through the pipeline are counted per rule, per source and per stage
+    hits = metrics.RULE_HITS.values()
+    turns = metrics.TURNS.values().get(("rule",), 0)
+    stages = metrics.STAGE_SECONDS.values()
+    turn = answer("hello there")
+    assert metrics.RULE_HITS.values()[(turn.rule_id, turn.pattern)] == hits.get((turn.rule_id, turn.pattern), 0) + 1
+    assert metrics.TURNS.values()[("rule",)] == turns + 1
+    for stage in ("normalize", "match"):
+        assert sum(metrics.STAGE_SECONDS.values()[(stage,)][0]) == sum(stages.get((stage,), ([0], 0))[0]) + 1
+
+    with patch.dict(os.environ, {"CHATBOT_METRICS_PORT": "0"}):
+        server = metrics.start_metrics_server()
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics", timeout=10) as response:
+        assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+        text = response.read().decode("utf-8")
+    assert "# TYPE chatbot_stage_seconds histogram" in text and 'chatbot_turns_total{source="rule"}' in text
+    assert f'chatbot_rule_hits_total{{rule_id="{turn.rule_id}",pattern="{metrics.escape_label(turn.pattern)}"}}' in text
+    assert re.search(r"^chatbot_ai_fallback_ratio [0-9.]+$", text, re.M)
+
+# Test sampled per-turn traces: stage spans, attributes and the batched OTLP file export
+def test_tracing(tmp_path, fresh_ai_cache):
+    from chatbot import tracing
+
+    path = tmp_path / "traces.jsonl"
+    exporter = tracing.BatchExporter(tracing.FileSink(str(path)), interval=60)
+    tracer = tracing.Tracer(exporter, sample_rate=1.0)
+    completion = MagicMock(choices=[MagicMock(message=MagicMock(content="Forty-two"))], usage=MagicMock(total_tokens=42))
+    client = app.get_ai_client()
+    with patch.object(tracing, '_tracer', tracer), patch.object(client, '_create', return_value=completion):
+        rule_turn = answer("hello there")
+        ai_turn = answer("compose a haiku about tulips")
+    assert exporter.flush() and tracing.current_span() is None
+    spans = [span for line in path.read_text().splitlines()
+             for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    assert exporter.stats()["exported"] == len(spans) and exporter.stats()["dropped"] == 0
+
+    roots = [span for span in spans if span["name"] == "chat.turn"]
+    assert len(roots) == 2 and all(root["parentSpanId"] == "" for root in roots)
+    traces = {root["traceId"]: [span for span in spans if span["traceId"] == root["traceId"]] for root in roots}
+    rule_trace, ai_trace = traces.values()
+    attributes = lambda span: {a["key"]: next(iter(a["value"].values())) for a in span["attributes"]}
+    assert [span["name"] for span in rule_trace] == ["normalize", "match", "chat.turn"]
+    assert attributes(rule_trace[1])["rule.pattern"] == rule_turn.pattern and rule_trace[1]["parentSpanId"] == roots[0]["spanId"]
+    assert [span["name"] for span in ai_trace] == ["normalize", "match", "fuzzy", "ai.cache", "ai.call", "chat.turn"]
+    call = attributes(ai_trace[4])
+    assert (call["ai.model"], call["ai.usage.total_tokens"], call["cache.status"]) == ("llama3-8b-8192", "42", "miss")
+    assert attributes(roots[1])["chat.source"] == ai_turn.source == "ai"
+    for span in spans:
+        assert int(span["startTimeUnixNano"]) <= int(span["endTimeUnixNano"])
+
+    # Unsampled turns and tracers without an exporter record nothing
+    assert tracing.Tracer(exporter, sample_rate=0.0).start_trace("chat.turn") is tracing.NOOP_SPAN
+    assert tracing.Tracer(None, sample_rate=1.0).start_trace("chat.turn") is tracing.NOOP_SPAN
+    with patch.object(tracing, '_tracer', tracing.Tracer(exporter, sample_rate=0.0)):
+        answer("hello there")
+    assert exporter.flush() and exporter.stats()["exported"] == len(spans)
+
+# Test that backtracking-prone rule patterns are disabled and reported, statically or on timeout
+def test_redos_guards():
+    from chatbot import metrics
+    from chatbot.redos import analyze_pattern, compile_search
+
+    for pattern in (r'(a+)+$', r'(a*)*b', r'(\w+\s?)+$', r'(a|aa)+$', r'(.|\s)*x', r'^(([a-z])+.)+[A-Z]([a-z])+$'):
+        assert analyze_pattern(pattern), pattern
+    for pattern in (r'(a|ab)*c', r'(hello|help)+', r'(\w+\s)+x', r'(?:ab+c)+', r'(?>a+)+'):
+        assert not analyze_pattern(pattern), pattern
+    assert not [p for rule in DEFAULT_RULES for p in rule['patterns'] if analyze_pattern(p)]
+    # Patterns that can't backtrack keep re's own search; alternation can
+    assert compile_search(r'\bhello\b') == re.compile(r'\bhello\b').search
+    assert compile_search('hello|hi') != re.compile('hello|hi').search
+
+    # Ambiguous alternations in a row backtrack exponentially without any quantifier
+    ambiguous = "(a|a)" * 24 + "b"
+    assert "ambiguous alternations in sequence" in analyze_pattern(ambiguous)[0]
+    assert not analyze_pattern("(a|a)" * 3 + "b") and not analyze_pattern("(hello|hi) (there|you)")
+    attack = "a" * 30 + "x" + "a" * 24 + "b"
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        compile_search(ambiguous, 0.05)("a" * 30)
+    assert time.perf_counter() - start < 1
+    start = time.perf_counter()
+    assert RuleEngine([{'id': 'alt', 'patterns': [ambiguous], 'responses': ["x"]}], match_timeout=0.05).match(attack) \
+        is None
+    assert time.perf_counter() - start < 1
+
+    engine = RuleEngine([
+        {'id': 'nested', 'patterns': [r'(a+)+$'], 'responses': ["x"]},
+        {'id': 'slow', 'patterns': [r'(\w|\d)+$'], 'responses': ["y"]},
+        {'id': 'hi', 'patterns': [r'\bhi\b'], 'responses': ["hello"]},
+    ], match_timeout=0.05)
+    assert list(engine.disabled) == [r'(a+)+$'] and "nested quantifier" in engine.disabled[r'(a+)+$'][1]
+
+    # The slow pattern gives up within its timeout, is disabled, and the next rule still answers
+    timeouts = metrics.RULE_TIMEOUTS.values().get(('slow', r'(\w|\d)+$'), 0)
+    text = "hi " + "1" * 5000 + "!"
+    start = time.perf_counter()
+    assert engine.match(text).rule_id == 'hi'
+    assert time.perf_counter() - start < 1
+    assert engine.disabled[r'(\w|\d)+$'] == ('slow', "timed out after 0.05s")
+    assert metrics.RULE_TIMEOUTS.values()[('slow', r'(\w|\d)+$')] == timeouts + 1
+    assert engine.lookup("aaaa") is None and engine.match(text).rule_id == 'hi'
+    # It stays disabled when the rules are rebuilt from this engine
+    assert list(RuleEngine(engine.rules, previous=engine, match_timeout=0.05).disabled) == list(engine.disabled)
+
+# Test that typos are corrected against rule keywords before falling back to the AI
+def test_fuzzy_rule_matching():
+    from chatbot import metrics
+    from chatbot.fuzzy import FuzzyIndex, edit_distance
+    from chatbot.pipeline import match_rule
+    from chatbot.rules import RuleSnapshot
+
+    assert (edit_distance("machne", "machine"), edit_distance("teh", "the"), edit_distance("wat", "what")) == (1, 1, 1)
+    index = FuzzyIndex(["hello", "help", "tell me a joke", "weather"])
+    assert index.correct("tel me a jok") == ("tell me a joke", [(0, 4, 1), (10, 14, 1)])
+    # Known words, short words and numbers stay; a typo as close to two equally used words is left alone
+    assert index.correct("help me with 2024") is None and index.correct("hellp") is None
+    assert index.suggest("waether") == ("weather", 1) and index.suggest("wxxxher") is None
+
+    engine = RuleEngine(DEFAULT_RULES)
+    snapshot = RuleSnapshot(1, engine, None, None)
+    hits = metrics.FUZZY_LOOKUPS.values().get(("hit",), 0)
+    for query, rule_id in (("tel me a jok", 'joke'), ("wat is deep lerning", 'deep_learning'),
+                           ("Explain nueral networks", 'neural_networks'), ("thnak you", 'thanks')):
+        assert engine.match(query.lower()) is None
+        turn = match_rule(query, snapshot)
+        assert (turn.source, turn.rule_id) == ("rule", rule_id), query
+    assert metrics.FUZZY_LOOKUPS.values()[("hit",)] == hits + 4
+    match = engine.fuzzy_match("tel me a jok")
+    assert match.corrected == "tell me a joke" and match.confidence == 1 - 1 / 4
+
+    # Each corrected word is scored on its own: the rest of the match can't make up for a
+    # rewritten word, and short words are never corrected by two edits
+    for query in ("how to learn cooking", "explain llvm", "compose a haiku about tulips"):
+        assert match_rule(query, snapshot) is None, query
+    assert engine.fuzzy_match("hepl").rule_id == 'capabilities'
+    assert RuleEngine(DEFAULT_RULES, fuzzy_threshold=0.8).fuzzy_match("hepl") is None
+    # 0 turns the tier off
+    off = RuleEngine(DEFAULT_RULES, fuzzy_threshold=0)
+    assert off.fuzzy is None and match_rule("tel me a jok", RuleSnapshot(1, off, None, None)) is None
+
+# Run the tests
+if __name__ == "__main__":
     pytest.main(["-v", "test_chatbot.py"]) 
\ No newline at end of file